@@ -0,0 +1,127 @@
+# api/action_plans.py
+"""
+Idea action plans, cached and persisted.
+
+A plan only depends on the idea, the platform, the language and the few
+profile fields the prompt uses, so it is keyed on
+(idea hash, platform, lang, profile fingerprint). Lookup order:
+  1) the Draft's own execution_plan, when a draft_id is given and the plan
+     was built for the same key (or saved by the client without one)
+  2) the plan cache (in process + Redis)
+  3) OpenAI - the result goes to the cache and is written back to the Draft.
+"""
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .llm_cache import TieredCache
+from .models import Draft
+from .utils import agenerate_idea_action_plan, generate_idea_action_plan
+
+plan_cache = TieredCache(
+    "plans",
+    default_ttl=getattr(settings, "ACTION_PLAN_CACHE_TTL", 60 * 60 * 24 * 30),
+    local_max_entries=512,
+)
+
+DRAFT_IDEA_FIELDS = ("title", "description", "suggested_caption_starter", "hook_used", "personal_twist")
+
+
+def _sha(data) -> str:
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def idea_hash(idea: dict) -> str:
+    return _sha({k: v.strip() if isinstance(v, str) else v for k, v in idea.items() if v not in (None, "")})
+
+
+def profile_fingerprint(profile) -> str:
+    # only what build_idea_action_plan_request puts in the prompt
+    return _sha([
+        (getattr(profile, field, "") or "").strip().lower()
+        for field in ("niche", "creator_stage", "target_audience")
+    ])[:16]
+
+
+def plan_key(profile, idea: dict, platform: str, lang: str) -> str:
+    lang = (lang or "en").split("-")[0].lower()
+    return f"{idea_hash(idea)[:32]}:{(platform or '').lower()}:{lang}:{profile_fingerprint(profile)}"
+
+
+def idea_from_draft(draft) -> dict:
+    return {f: getattr(draft, f) for f in DRAFT_IDEA_FIELDS if getattr(draft, f)}
+
+
+def get_user_draft(user, draft_id):
+    if not draft_id or not getattr(user, "is_authenticated", False):
+        return None
+    try:
+        return Draft.objects.filter(pk=draft_id, user=user).first()
+    except Exception:
+        # malformed uuid
+        return None
+
+
+def _stored_plan(draft, key: str):
+    if draft is None or not draft.execution_plan:
+        return None
+    if draft.execution_plan_key and draft.execution_plan_key != key:
+        return None
+    try:
+        plan = json.loads(draft.execution_plan)
+    except ValueError:
+        return None
+    return plan if isinstance(plan, dict) else None
+
+
+def _lookup(draft, key: str):
+    plan = _stored_plan(draft, key)
+    if plan is not None:
+        return plan
+    plan = plan_cache.get(key)
+    if plan is not None and draft is not None:
+        _write_back(draft, key, plan)
+    return plan
+
+
+def _write_back(draft, key: str, plan: dict):
+    if draft is None:
+        return
+    Draft.objects.filter(pk=draft.pk).update(
+        execution_plan=json.dumps(plan, ensure_ascii=False),
+        execution_plan_key=key,
+    )
+
+
+def _save(draft, key: str, plan: dict):
+    plan_cache.set(key, plan)
+    _write_back(draft, key, plan)
+
+
+def get_idea_action_plan(profile, idea: dict, platform: str = "instagram", lang: str = "en", draft=None, user=None) -> dict:
+    """
+    Cached generate_idea_action_plan(). `draft`: the user's Draft the idea
+    was opened from, if any.
+    """
+    key = plan_key(profile, idea, platform, lang)
+    plan = _lookup(draft, key)
+    if plan is not None:
+        return plan
+
+    plan = generate_idea_action_plan(profile=profile, idea=idea, platform=platform, lang=lang, user=user)
+    _save(draft, key, plan)
+    return plan
+
+
+async def aget_idea_action_plan(profile, idea: dict, platform: str = "instagram", lang: str = "en", draft=None, user=None) -> dict:
+    key = plan_key(profile, idea, platform, lang)
+    plan = await sync_to_async(_lookup)(draft, key)
+    if plan is not None:
+        return plan
+
+    plan = await agenerate_idea_action_plan(profile=profile, idea=idea, platform=platform, lang=lang, user=user)
+    await sync_to_async(_save)(draft, key, plan)
+    return plan
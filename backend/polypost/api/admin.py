@@ -4,7 +4,7 @@ from django.utils.html import format_html
 from django.shortcuts import redirect
 
 # Register your models here.
-from .models import  GlobalTrend, PlatformTiming, PlannedPostSlot, MediaUpload, CreatorProfile, NewsletterBlast, SupportTicket, AppReview
+from .models import  GlobalTrend, PlatformTiming, PlannedPostSlot, MediaUpload, CreatorProfile, NewsletterBlast, SupportTicket, AppReview, GenerationJob, LLMCall
 
 @admin.register(CreatorProfile)
 class CreatorProfileAdmin(admin.ModelAdmin):
@@ -97,3 +97,19 @@ admin.site.register(GlobalTrend)
 admin.site.register(PlatformTiming)
 admin.site.register(PlannedPostSlot)
 admin.site.register(MediaUpload)
+
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "user", "attempts", "created_at", "finished_at")
+    list_filter = ("kind", "status")
+    search_fields = ("id", "user__username")
+
+
+@admin.register(LLMCall)
+class LLMCallAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "endpoint", "model", "user", "prompt_tokens", "completion_tokens", "latency_ms", "cache_hit", "ok")
+    list_filter = ("endpoint", "model", "cache_hit", "ok")
+    search_fields = ("user__username", "endpoint")
+    date_hierarchy = "created_at"
+    raw_id_fields = ("user",)
@@ -6,4 +6,5 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
-        import api.signals
\ No newline at end of file
+        import api.signals
+        import api.deadlines  # Celery task deadlines (signal handlers)
\ No newline at end of file
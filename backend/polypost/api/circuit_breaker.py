@@ -0,0 +1,258 @@
+# api/circuit_breaker.py
+"""
+Circuit breakers for external dependencies (OpenAI, Apify, TMDB, MaxMind).
+
+    closed     calls go through; failures are counted over a sliding `window`
+    open       after `failures` failures in the window: every call fails fast
+               with CircuitOpen (503 + Retry-After) for `cooldown` seconds
+    half-open  after the cooldown one caller (per cluster) is let through as a
+               probe: success closes the circuit, failure opens it again
+
+Only errors that mean "the service is in trouble" count (connection errors,
+timeouts, 5xx); a 4xx answer is proof the service is up. The state is kept in
+Redis so all workers open / close together, with an in-process copy when
+Redis is down. Limits live in settings.CIRCUIT_BREAKERS.
+
+    tmdb_breaker = CircuitBreaker("tmdb", failure_exceptions=(requests.RequestException,),
+                                  is_failure=lambda resp: resp.status_code >= 500)
+    resp = tmdb_breaker.call(requests.get, url, timeout=10)
+"""
+import math
+import threading
+import time
+import uuid
+from collections import deque
+
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import APIException
+
+from .redis_client import get_redis, mark_redis_down
+
+DEFAULT_CONFIG = {"failures": 5, "window": 60, "cooldown": 30}
+STATE_TTL = 60 * 60  # an open state nobody probes is forgotten after cooldown + this
+
+
+class CircuitOpen(APIException):
+    status_code = 503
+    default_detail = "An external service is unavailable right now, please retry later."
+    default_code = "circuit_open"
+
+    def __init__(self, name: str, wait: int = 5):
+        super().__init__()
+        self.name = name
+        self.wait = wait  # DRF turns this into Retry-After
+
+    def __str__(self):
+        return f"{self.name} circuit open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_exceptions=(Exception,), is_failure=None):
+        self.name = name
+        self.failure_exceptions = failure_exceptions
+        self.is_failure = is_failure  # optional check on the returned value (e.g. HTTP 5xx)
+        # in-process state, used while Redis is down
+        self._lock = threading.Lock()
+        self._failures = deque()
+        self._open_until = None
+        self._probe_until = 0.0
+
+    # ---- config / keys ----
+    def _config(self) -> dict:
+        return {**DEFAULT_CONFIG, **getattr(settings, "CIRCUIT_BREAKERS", {}).get(self.name, {})}
+
+    def _key(self, part: str) -> str:
+        return f"cb:{self.name}:{part}"
+
+    # ---- state ----
+    def _get_open_until(self):
+        r = get_redis()
+        if r is not None:
+            try:
+                raw = r.get(self._key("open"))
+                return float(raw) if raw is not None else None
+            except redis.RedisError as e:
+                mark_redis_down(e)
+        with self._lock:
+            return self._open_until
+
+    def _claim_probe(self, cooldown: int) -> bool:
+        r = get_redis()
+        if r is not None:
+            try:
+                return bool(r.set(self._key("probe"), "1", nx=True, ex=max(1, cooldown)))
+            except redis.RedisError as e:
+                mark_redis_down(e)
+        now = time.time()
+        with self._lock:
+            if self._probe_until > now:
+                return False
+            self._probe_until = now + cooldown
+            return True
+
+    def _open(self, cooldown: int):
+        print(f"[CIRCUIT] {self.name}: open for {cooldown}s")
+        open_until = time.time() + cooldown
+        with self._lock:
+            self._open_until = open_until
+            self._failures.clear()
+            self._probe_until = 0.0
+        r = get_redis()
+        if r is None:
+            return
+        try:
+            pipe = r.pipeline()
+            pipe.set(self._key("open"), open_until, ex=cooldown + STATE_TTL)
+            pipe.delete(self._key("failures"), self._key("probe"))
+            pipe.execute()
+        except redis.RedisError as e:
+            mark_redis_down(e)
+
+    def _close(self):
+        print(f"[CIRCUIT] {self.name}: closed")
+        with self._lock:
+            self._open_until = None
+            self._failures.clear()
+            self._probe_until = 0.0
+        r = get_redis()
+        if r is None:
+            return
+        try:
+            r.delete(self._key("open"), self._key("failures"), self._key("probe"))
+        except redis.RedisError as e:
+            mark_redis_down(e)
+
+    def _count_failure(self, window: int) -> int:
+        r = get_redis()
+        if r is not None:
+            # sorted set of failure timestamps: a true sliding window
+            now = time.time()
+            key = self._key("failures")
+            try:
+                pipe = r.pipeline()
+                pipe.zadd(key, {uuid.uuid4().hex: now})
+                pipe.zremrangebyscore(key, "-inf", now - window)
+                pipe.zcard(key)
+                pipe.expire(key, window)
+                return int(pipe.execute()[2])
+            except redis.RedisError as e:
+                mark_redis_down(e)
+        now = time.time()
+        with self._lock:
+            self._failures.append(now)
+            while self._failures and self._failures[0] < now - window:
+                self._failures.popleft()
+            return len(self._failures)
+
+    # ---- public ----
+    def enabled(self) -> bool:
+        return getattr(settings, "CIRCUIT_BREAKERS_ENABLED", True)
+
+    def state(self) -> str:
+        """
+        "closed", "open" or "half-open" (cooldown over, waiting for a probe).
+        """
+        open_until = self._get_open_until()
+        if open_until is None:
+            return "closed"
+        return "open" if time.time() < open_until else "half-open"
+
+    def is_open(self) -> bool:
+        return self.enabled() and self.state() == "open"
+
+    def before_call(self) -> bool:
+        """
+        Raises CircuitOpen while the circuit is open. Returns True when this
+        call is the half-open probe.
+        """
+        open_until = self._get_open_until()
+        if open_until is None:
+            return False
+        now = time.time()
+        if now < open_until:
+            raise CircuitOpen(self.name, wait=max(1, math.ceil(open_until - now)))
+        if self._claim_probe(self._config()["cooldown"]):
+            print(f"[CIRCUIT] {self.name}: half-open, probing")
+            return True
+        raise CircuitOpen(self.name, wait=1)
+
+    def record_success(self, probe: bool = False):
+        if probe:
+            self._close()
+
+    def record_failure(self, probe: bool = False):
+        config = self._config()
+        if probe or self._count_failure(config["window"]) >= config["failures"]:
+            self._open(config["cooldown"])
+
+    def _record_result(self, probe: bool, result):
+        if self.is_failure is not None and self.is_failure(result):
+            self.record_failure(probe)
+        else:
+            self.record_success(probe)
+
+    def call(self, fn, *args, **kwargs):
+        """
+        fn(*args, **kwargs) through the breaker.
+        """
+        if not self.enabled():
+            return fn(*args, **kwargs)
+        probe = self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except self.failure_exceptions:
+            self.record_failure(probe)
+            raise
+        except Exception:
+            self.record_success(probe)  # the service answered, the call was just bad
+            raise
+        self._record_result(probe, result)
+        return result
+
+    def iterate(self, fn, *args, **kwargs):
+        """
+        Yields from the iterable fn(*args, **kwargs) (e.g. a streamed
+        response) through the breaker: errors raised while iterating count
+        too, not just the ones from starting the call.
+        """
+        if not self.enabled():
+            yield from fn(*args, **kwargs)
+            return
+        probe = self.before_call()
+        try:
+            yield from fn(*args, **kwargs)
+        except self.failure_exceptions:
+            self.record_failure(probe)
+            raise
+        except Exception:
+            self.record_success(probe)
+            raise
+        except GeneratorExit:
+            self.record_success(probe)  # the consumer stopped reading, the service was fine
+            raise
+        self.record_success(probe)
+
+    async def acall(self, afn, *args, **kwargs):
+        """
+        Async twin of call().
+        """
+        if not self.enabled():
+            return await afn(*args, **kwargs)
+        probe = await sync_to_async(self.before_call, thread_sensitive=False)()
+        try:
+            result = await afn(*args, **kwargs)
+        except self.failure_exceptions:
+            await sync_to_async(self.record_failure, thread_sensitive=False)(probe)
+            raise
+        except Exception:
+            await sync_to_async(self.record_success, thread_sensitive=False)(probe)
+            raise
+        await sync_to_async(self._record_result, thread_sensitive=False)(probe, result)
+        return result
+
+
+def http_server_error(resp) -> bool:
+    # is_failure for `requests` responses
+    return resp.status_code >= 500
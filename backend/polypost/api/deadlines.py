@@ -0,0 +1,183 @@
+# api/deadlines.py
+"""
+Per-request deadlines.
+
+RequestDeadlineMiddleware gives every API request a time budget
+(REQUEST_DEADLINE_SECONDS, per-path overrides in REQUEST_DEADLINE_PATHS);
+Celery tasks get one from their soft time limit (task_prerun below). The
+deadline lives in a contextvar, so it follows the request through
+sync_to_async and into the LLM / Apify / MaxMind / TMDB helpers, which ask
+timeout_for(cap) for their timeout instead of using a fixed one.
+
+Once the budget is spent, timeout_for() raises DeadlineExceeded (504) instead
+of starting another outbound call. Streamed (SSE) bodies keep the request's
+deadline while they are produced.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.exceptions import APIException
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)  # time.monotonic() value
+
+
+class DeadlineExceeded(APIException):
+    status_code = 504
+    default_detail = "The request took too long, please retry."
+    default_code = "deadline_exceeded"
+
+
+def current_deadline():
+    return _deadline.get()
+
+
+def remaining():
+    """
+    Seconds left for the current request / task, or None without a deadline.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def timeout_for(cap: float, minimum: float = 0.1) -> float:
+    """
+    Timeout for an outbound call: `cap`, shortened to what's left of the
+    deadline. Raises DeadlineExceeded when there is (almost) nothing left.
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left < minimum:
+        raise DeadlineExceeded()
+    return min(cap, left)
+
+
+def wait_budget(cap: float) -> float:
+    """
+    Like timeout_for() for local waits (locks, queues): never raises, 0 when spent.
+    """
+    left = remaining()
+    return cap if left is None else max(0.0, min(cap, left))
+
+
+@contextmanager
+def deadline_at(deadline):
+    """
+    Run with an absolute deadline (e.g. the request's one, in a worker thread).
+    """
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """
+    Run with a budget of `seconds` (None = no deadline). Nested scopes never
+    extend an outer deadline.
+    """
+    deadline = _deadline.get()
+    if seconds is not None:
+        new = time.monotonic() + seconds
+        deadline = new if deadline is None else min(deadline, new)
+    with deadline_at(deadline):
+        yield
+
+
+def budget_for_path(path: str):
+    for prefix, seconds in getattr(settings, "REQUEST_DEADLINE_PATHS", {}).items():
+        if path.startswith(prefix):
+            return seconds
+    return getattr(settings, "REQUEST_DEADLINE_SECONDS", None)
+
+
+_DONE = object()
+
+
+def _iter_with_deadline(content, deadline):
+    iterator = iter(content)
+    while True:
+        # set around next() only: a generator must not hold the contextvar across yields
+        with deadline_at(deadline):
+            chunk = next(iterator, _DONE)
+        if chunk is _DONE:
+            return
+        yield chunk
+
+
+async def _aiter_with_deadline(content, deadline):
+    iterator = aiter(content)
+    while True:
+        with deadline_at(deadline):
+            chunk = await anext(iterator, _DONE)
+        if chunk is _DONE:
+            return
+        yield chunk
+
+
+def _keep_deadline(response, deadline):
+    """
+    A streamed body (SSE) is produced after the view has returned and the
+    scope is gone: run every chunk under the request's deadline again.
+    """
+    if deadline is None or not getattr(response, "streaming", False):
+        return response
+    wrap = _aiter_with_deadline if response.is_async else _iter_with_deadline
+    response.streaming_content = wrap(response.streaming_content, deadline)
+    return response
+
+
+@sync_and_async_middleware
+def RequestDeadlineMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with deadline_scope(budget_for_path(request.path)):
+                deadline = current_deadline()
+                response = await get_response(request)
+            return _keep_deadline(response, deadline)
+    else:
+        def middleware(request):
+            with deadline_scope(budget_for_path(request.path)):
+                deadline = current_deadline()
+                response = get_response(request)
+            return _keep_deadline(response, deadline)
+    return middleware
+
+
+# -----------------------------------------------------------------------------
+# Celery
+# -----------------------------------------------------------------------------
+_task_tokens = {}  # task_id -> contextvar token
+
+
+@task_prerun.connect
+def _start_task_deadline(task_id=None, task=None, **kwargs):
+    timelimit = getattr(task.request, "timelimit", None) or (None, None)
+    soft_limit = (
+        timelimit[1]
+        or getattr(task, "soft_time_limit", None)
+        or getattr(settings, "TASK_DEADLINE_SECONDS", None)
+    )
+    if soft_limit:
+        deadline = time.monotonic() + soft_limit
+        outer = _deadline.get()  # eager task inside a request
+        _task_tokens[task_id] = _deadline.set(deadline if outer is None else min(outer, deadline))
+
+
+@task_postrun.connect
+def _end_task_deadline(task_id=None, **kwargs):
+    token = _task_tokens.pop(task_id, None)
+    if token is not None:
+        try:
+            _deadline.reset(token)
+        except ValueError:
+            pass  # token from another context
@@ -0,0 +1,252 @@
+# api/degrade.py
+"""
+Degrade mode: template-based ideas / sample captions when the LLM tier is
+saturated or failing.
+
+It kicks in automatically when too many LLM calls are in flight across
+workers (LLM_DEGRADE_MAX_INFLIGHT), when every model of the endpoint's route
+is unhealthy (error rate / p95 over budget, see llm_router.py), while the
+OpenAI circuit breaker is open, or when the live call itself fails. Output is built from the seasonal / floating hooks,
+the latest GlobalTrend titles and UseCaseTemplate hints, is deterministic
+(same user + day + platform -> same ideas) and flagged with "degraded": true.
+
+Trend titles and templates are kept in process for LLM_DEGRADE_SOURCE_TTL,
+so a warm call does no DB or network work at all. Templates are English;
+UseCaseTemplate hints in the requested language are preferred.
+"""
+import random
+import threading
+import time
+from datetime import date
+
+from django.conf import settings
+
+from .llm import inflight
+from .llm_backends import openai_breaker
+from .llm_router import _is_healthy, get_route, route_stats_store
+from .models import UseCaseTemplate
+from .prompt_budget import clip
+from .utils import get_floating_event_hooks, get_ideas_context, get_seasonal_hooks
+
+DEGRADED_HEADER = "X-Degraded"
+
+_DECISION_TTL = 1.0  # seconds a degrade decision is reused per endpoint
+
+_decisions = {}  # endpoint -> (decided_at, reason)
+_sources = {"loaded_at": 0.0, "trends": [], "templates": []}
+_sources_lock = threading.Lock()
+
+
+# -----------------------------------------------------------------------------
+# Trigger
+# -----------------------------------------------------------------------------
+def _route_down(endpoint: str) -> bool:
+    route_name, route = get_route(endpoint)
+    if not route:
+        return False
+    return not any(
+        _is_healthy(route_stats_store.get(route_name, model), route)
+        for model in route["models"]
+    )
+
+
+def degrade_reason(endpoint: str):
+    """
+    "forced" / "saturated" / "unhealthy" / "circuit_open", or None when the
+    LLM should be used.
+    """
+    if not getattr(settings, "LLM_DEGRADE_ENABLED", True):
+        return None
+    if getattr(settings, "LLM_DEGRADE_FORCE", False):
+        return "forced"
+
+    now = time.monotonic()
+    cached = _decisions.get(endpoint)
+    if cached and now - cached[0] < _DECISION_TTL:
+        return cached[1]
+
+    reason = None
+    if inflight.count() >= settings.LLM_DEGRADE_MAX_INFLIGHT:
+        reason = "saturated"
+    elif _route_down(endpoint):
+        reason = "unhealthy"
+    elif openai_breaker.is_open():
+        reason = "circuit_open"
+
+    if reason:
+        print(f"[DEGRADE] {endpoint}: {reason}")
+    _decisions[endpoint] = (now, reason)
+    return reason
+
+
+# -----------------------------------------------------------------------------
+# Sources
+# -----------------------------------------------------------------------------
+def _load_sources() -> dict:
+    with _sources_lock:
+        if time.monotonic() - _sources["loaded_at"] < settings.LLM_DEGRADE_SOURCE_TTL:
+            return _sources
+        try:
+            _sources["trends"] = [clip(t, 120) for t in get_ideas_context()["trends"]]
+            _sources["templates"] = list(
+                UseCaseTemplate.objects.values(
+                    "niche", "main_platform", "preferred_language",
+                    "short_description", "example_caption_hint",
+                )
+            )
+        except Exception as e:
+            print(f"[DEGRADE] could not load sources: {e}")
+        _sources["loaded_at"] = time.monotonic()
+        return _sources
+
+
+def _matching_hints(niche: str, platform: str, lang: str) -> list:
+    """
+    example_caption_hint lines of the UseCaseTemplates closest to this
+    creator: same niche first, then same platform, then same language.
+    """
+    niche = (niche or "").strip().lower()
+
+    def score(t):
+        return (
+            2 * bool(niche and niche in (t["niche"] or "").lower())
+            + (t["main_platform"] == platform)
+            + (t["preferred_language"] == lang)
+        )
+
+    hints = []
+    for t in sorted(_load_sources()["templates"], key=score, reverse=True):
+        if score(t) == 0:
+            break
+        for line in (t["example_caption_hint"] or "").splitlines():
+            line = line.strip(" -•\t")
+            if line:
+                hints.append(line)
+    return hints
+
+
+def _short(hook: str) -> str:
+    # "Halloween costumes / spooky aesthetic (...)" -> "Halloween costumes"
+    return clip(hook.split(" (")[0].split(" / ")[0].split(":")[-1].strip(), 60)
+
+
+# -----------------------------------------------------------------------------
+# Ideas
+# -----------------------------------------------------------------------------
+IDEA_FORMATS = [
+    (
+        "{short}, {niche} edition",
+        "Take “{hook}” and show it through your {niche} lens, made for {audience}.",
+        "Nobody talks about this side of {short}…",
+    ),
+    (
+        "3 things {audience} get wrong about {short}",
+        "Quick carousel or reel busting myths around {short}, with your own take for each one.",
+        "You've been doing {short} wrong. Here's why 👇",
+    ),
+    (
+        "Behind the scenes: {short}",
+        "Film how you actually prepare for {short}, raw and unpolished, {tone} voice-over.",
+        "What {short} really looks like on my side:",
+    ),
+    (
+        "POV: {short} as a {niche} creator",
+        "A short POV clip inspired by “{hook}”, keeping your {vibe} vibe.",
+        "POV: it's {short} season and you're me.",
+    ),
+    (
+        "Ask your audience: {short}",
+        "Story poll or Q&A around {short}; turn the best answers into tomorrow's post.",
+        "Settle this for me: {short}, yes or no?",
+    ),
+]
+
+
+def degraded_ideas(profile, platform: str, user=None, today: date | None = None, count: int = 5) -> list:
+    """
+    `count` ideas in the same shape as the LLM ones
+    (title, description, suggested_caption_starter, hook_used, personal_twist).
+    At least 2 come from DB trends when there are any, then dated hooks, then
+    evergreen ones.
+    """
+    today = today or date.today()
+    niche = (getattr(profile, "niche", None) or "creator").strip()
+    audience = (getattr(profile, "target_audience", None) or "your followers").strip()
+    vibe = (getattr(profile, "vibe", None) or "fun").strip().lower()
+    tone = (getattr(profile, "tone", None) or "casual").strip().lower()
+    lang = getattr(profile, "preferred_language", None) or "en"
+
+    rng = random.Random(f"{getattr(user, 'pk', 'anon')}:{today.isoformat()}:{platform}")
+
+    trends = list(_load_sources()["trends"])
+    seasonal = get_seasonal_hooks(today)
+    floating = get_floating_event_hooks(today)
+    rng.shuffle(trends)
+
+    hooks = trends[:2] + floating + seasonal + trends[2:]
+    # de-dupe, keep order
+    hooks = list(dict.fromkeys(hooks))
+    twists = _matching_hints(niche, platform, lang) or [
+        f"Keep it {tone} and lean into your {vibe} side.",
+        f"End with a question {audience} can answer in one word.",
+        "Show your face in the first second.",
+    ]
+
+    formats = IDEA_FORMATS[:]
+    rng.shuffle(formats)
+
+    ideas = []
+    for i, hook in enumerate(hooks[:count]):
+        title, description, starter = formats[i % len(formats)]
+        fields = {
+            "hook": hook, "short": _short(hook), "niche": niche,
+            "audience": audience, "vibe": vibe, "tone": tone,
+        }
+        ideas.append({
+            "title": title.format(**fields),
+            "description": description.format(**fields),
+            "suggested_caption_starter": starter.format(**fields),
+            "hook_used": hook,
+            "personal_twist": twists[i % len(twists)],
+        })
+    return ideas
+
+
+# -----------------------------------------------------------------------------
+# Brand sample captions
+# -----------------------------------------------------------------------------
+CAPTION_FORMATS = [
+    "New here? I'm all about {niche} for {audience}. Stick around ✨",
+    "{short}, but make it {vibe}. Who's with me?",
+    "Real talk for {audience}: {short} doesn't have to be complicated.",
+    "Saving this one for the {niche} crew 💬 Tell me what you'd add.",
+]
+
+
+def degraded_sample_captions(data: dict, platform: str, lang: str = "en", count: int = 3) -> dict:
+    """
+    Same shape as parse_brand_sample_captions(): {"captions": [...]}.
+    UseCaseTemplate hints first, then filled-in templates.
+    """
+    niche = (data.get("niche") or "creator").strip()
+    audience = (data.get("target_audience") or "followers").strip()
+    vibe = (data.get("recommended_vibe") or "fun").strip().lower()
+
+    captions = _matching_hints(niche, platform, lang)[:count]
+
+    hooks = get_floating_event_hooks() + get_seasonal_hooks()
+    rng = random.Random(f"{niche}:{audience}:{vibe}:{platform}:{date.today().isoformat()}")
+    formats = CAPTION_FORMATS[:]
+    rng.shuffle(formats)
+
+    for i, fmt in enumerate(formats):
+        if len(captions) >= count:
+            break
+        captions.append(fmt.format(
+            niche=niche, audience=audience, vibe=vibe, short=_short(hooks[i % len(hooks)]),
+        ))
+    return {"captions": captions}
+
+
+def mark_degraded(payload: dict, reason: str) -> dict:
+    return {**payload, "degraded": True, "degraded_reason": reason}
@@ -4,6 +4,9 @@ import requests
 from datetime import datetime, timezone as dt_timezone
 import time
 
+from .circuit_breaker import CircuitBreaker, CircuitOpen, http_server_error
+from .deadlines import DeadlineExceeded, timeout_for, wait_budget
+
 APIFY_TOKEN = os.getenv("APIFY_TOKEN")
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 
@@ -12,6 +15,29 @@ APIFY_TIKTOK_ACTOR = os.getenv("APIFY_TIKTOK_ACTOR")
 APIFY_INSTAGRAM_ACTOR = os.getenv("APIFY_INSTAGRAM_ACTOR")
 APIFY_TWITTER_ACTOR = os.getenv("APIFY_TWITTER_ACTOR")
 
+# while Apify / TMDB are down, skip them instead of waiting out every timeout
+apify_breaker = CircuitBreaker(
+    "apify", failure_exceptions=(requests.RequestException,), is_failure=http_server_error
+)
+tmdb_breaker = CircuitBreaker(
+    "tmdb", failure_exceptions=(requests.RequestException,), is_failure=http_server_error
+)
+
+def _apify_request(actor_id: str, method, url: str, cap: float, **kwargs):
+    """
+    One Apify HTTP call through the breaker, with its timeout capped by the
+    request / task deadline. None when the circuit is open or the deadline is
+    spent: callers give up with what they have.
+    """
+    try:
+        return apify_breaker.call(method, url, timeout=timeout_for(cap), **kwargs)
+    except DeadlineExceeded:
+        print(f"[Apify] {actor_id}: skipped, deadline reached")
+    except CircuitOpen:
+        print(f"[Apify] {actor_id}: skipped, circuit open")
+    return None
+
+
 def apify_run_and_get_items(actor_id: str, payload: dict | None = None, limit: int = 20):
     """
     Try to run an Apify actor and return items.
@@ -26,7 +52,9 @@ def apify_run_and_get_items(actor_id: str, payload: dict | None = None, limit: i
 
     # 1) try run-sync-dataset (most scrapers support this)
     sync_url = f"{APIFY_BASE}/{actor_id}/run-sync-dataset?token={APIFY_TOKEN}"
-    sync_resp = requests.post(sync_url, json=payload, timeout=30)
+    sync_resp = _apify_request(actor_id, requests.post, sync_url, 30, json=payload)
+    if sync_resp is None:
+        return []
     if sync_resp.status_code == 200:
         try:
             data = sync_resp.json()
@@ -37,7 +65,9 @@ def apify_run_and_get_items(actor_id: str, payload: dict | None = None, limit: i
 
     # 2) normal run
     run_url = f"{APIFY_BASE}/{actor_id}/runs?token={APIFY_TOKEN}"
-    run_resp = requests.post(run_url, json=payload, timeout=30)
+    run_resp = _apify_request(actor_id, requests.post, run_url, 30, json=payload)
+    if run_resp is None:
+        return []
     run_resp.raise_for_status()
     run_data = run_resp.json()
 
@@ -54,28 +84,33 @@ def apify_run_and_get_items(actor_id: str, payload: dict | None = None, limit: i
     # 2b) poll the run until finished
     for _ in range(10):  # up to ~15s
         status_url = f"https://api.apify.com/v2/actor-runs/{run_id}"
-        status_resp = requests.get(status_url, timeout=15)
+        status_resp = _apify_request(actor_id, requests.get, status_url, 15)
+        if status_resp is None:
+            return []  # run still going, nothing to read yet
         status_data = status_resp.json()
         status = status_data.get("status")
         dataset_id = status_data.get("defaultDatasetId")
         if status in ("SUCCEEDED", "FAILED", "ABORTED"):
             break
-        time.sleep(1.5)
+        pause = wait_budget(1.5)
+        if not pause:
+            break
+        time.sleep(pause)
 
     # 3) try to read dataset
     dataset_id = status_data.get("defaultDatasetId")
     if dataset_id:
         items_url = f"https://api.apify.com/v2/datasets/{dataset_id}/items?clean=true&limit={limit}"
-        items_resp = requests.get(items_url, timeout=30)
-        if items_resp.status_code == 200:
+        items_resp = _apify_request(actor_id, requests.get, items_url, 30)
+        if items_resp is not None and items_resp.status_code == 200:
             return items_resp.json()
 
     # 4) try KV store
     kv_id = status_data.get("defaultKeyValueStoreId")
     if kv_id:
         kv_url = f"https://api.apify.com/v2/key-value-stores/{kv_id}/records/OUTPUT?raw=1"
-        kv_resp = requests.get(kv_url, timeout=30)
-        if kv_resp.status_code == 200:
+        kv_resp = _apify_request(actor_id, requests.get, kv_url, 30)
+        if kv_resp is not None and kv_resp.status_code == 200:
             try:
                 data = kv_resp.json()
                 if isinstance(data, list):
@@ -95,7 +130,9 @@ def apify_sync_items(actor_id: str, payload: dict | None = None, limit: int = 20
     payload = payload or {}
     url = f"{APIFY_BASE}/{actor_id}/run-sync-get-dataset-items?token={APIFY_TOKEN}"
 
-    resp = requests.post(url, json=payload, timeout=40)
+    resp = _apify_request(actor_id, requests.post, url, 40, json=payload)
+    if resp is None:
+        return []
 
     # 👇 accept both 200 and 201
     if resp.status_code not in (200, 201):
@@ -198,7 +235,7 @@ def get_tmdb_trending():
         return []
     url = f"https://api.themoviedb.org/3/trending/all/day?api_key={TMDB_API_KEY}"
     try:
-        resp = requests.get(url, timeout=10)
+        resp = tmdb_breaker.call(requests.get, url, timeout=timeout_for(10))
         resp.raise_for_status()
     except Exception:
         return []
@@ -1,7 +1,12 @@
 
+import requests
+from geoip2.errors import HTTPError as MaxMindHTTPError
 from geoip2.webservice import Client as MaxMindClient
 from django.conf import settings
 
+from .circuit_breaker import CircuitBreaker
+from .deadlines import DeadlineExceeded, timeout_for
+
 # Put these in your settings.py (or env vars)
 # MAXMIND_ACCOUNT_ID = "your_account_id"
 # MAXMIND_LICENSE_KEY = "your_license_key"
@@ -13,6 +18,9 @@ COUNTRY_LANG_MAP = {
     "PT": "pt", "BR": "pt",
 }
 
+# unknown IPs / bad input are not outages; 5xx, timeouts and connection errors are
+maxmind_breaker = CircuitBreaker("maxmind", failure_exceptions=(MaxMindHTTPError, requests.RequestException))
+
 def get_country_code_from_ip(ip: str) -> str | None:
     """
     Returns a 2-letter country code like 'FR', 'US', 'BR', or None on failure.
@@ -24,13 +32,19 @@ def get_country_code_from_ip(ip: str) -> str | None:
         return None
 
     try:
-        client = MaxMindClient(account_id, license_key)
+        # the client defaults to a 60s timeout; keep geo lookups short
+        timeout = timeout_for(getattr(settings, "MAXMIND_TIMEOUT", 3))
+    except DeadlineExceeded:
+        return None
+
+    try:
+        client = MaxMindClient(account_id, license_key, timeout=timeout)
 
         # choose the service you have access to:
         # - client.country(ip)
         # - client.city(ip)
         # - client.insights(ip)
-        response = client.country(ip)  # cheapest, enough for language by country
+        response = maxmind_breaker.call(client.country, ip)  # cheapest, enough for language by country
 
         return response.country.iso_code  # ex: "FR"
     except Exception:
@@ -0,0 +1,163 @@
+# api/idea_pools.py
+"""
+Segment-level idea pools.
+
+The ideas prompt mostly depends on (platform, niche, vibe, tone, language,
+target audience, country, city) plus today's date and the latest trends, so
+many users share the same prompt. A nightly task pre-generates a few batches of ideas for the most common
+segments; GenerateIdeasView serves a batch from the pool when the user's
+profile matches and falls back to live generation otherwise.
+"""
+import hashlib
+from datetime import timedelta
+from types import SimpleNamespace
+
+import redis
+from django.conf import settings
+from django.db.models import Count, Value
+from django.db.models.functions import Coalesce, Lower, Trim
+from django.utils import timezone
+
+from .llm import chat_completion
+from .llm_cache import TieredCache
+from .models import CreatorProfile
+from .redis_client import get_redis, mark_redis_down
+from .utils import build_ideas_request, parse_ideas
+
+POOL_TTL = 60 * 60 * 26  # a bit more than a day, the key carries the date anyway
+
+idea_pool_cache = TieredCache("ideas:pool", default_ttl=POOL_TTL, local_max_entries=256)
+
+
+def _norm(value) -> str:
+    return (value or "").strip().lower()
+
+
+def get_segment(profile, platform: str) -> tuple:
+    return (
+        _norm(platform),
+        _norm(profile.niche),
+        _norm(profile.vibe),
+        _norm(profile.tone),
+        _norm(profile.preferred_language) or "en",
+        _norm(profile.target_audience),
+        _norm(profile.country),
+        _norm(profile.city),
+    )
+
+
+def segment_key(segment: tuple, day=None) -> str:
+    day = day or timezone.localdate()
+    digest = hashlib.sha256("|".join(segment).encode("utf-8")).hexdigest()[:24]
+    return f"{day.isoformat()}:{digest}"
+
+
+def _segment_profile(segment: tuple):
+    """
+    Stand-in profile for the prompt builder: only the segment fields are set.
+    """
+    _, niche, vibe, tone, lang, audience, country, city = segment
+    return SimpleNamespace(
+        niche=niche or None,
+        vibe=vibe or None,
+        tone=tone or None,
+        preferred_language=lang,
+        target_audience=audience or None,
+        city=city or None,
+        country=country or None,
+    )
+
+
+def get_top_segments(limit: int, min_users: int, active_days: int) -> list:
+    """
+    Most common segments (see get_segment) among recently active users.
+    """
+    since = timezone.now() - timedelta(days=active_days)
+    rows = (
+        CreatorProfile.objects
+        .filter(user__last_login__gte=since)
+        .annotate(
+            niche_key=Lower(Trim(Coalesce("niche", Value("")))),
+            vibe_key=Lower(Trim(Coalesce("vibe", Value("")))),
+            tone_key=Lower(Trim(Coalesce("tone", Value("")))),
+            audience_key=Lower(Trim(Coalesce("target_audience", Value("")))),
+            country_key=Lower(Trim(Coalesce("country", Value("")))),
+            city_key=Lower(Trim(Coalesce("city", Value("")))),
+        )
+        .values(
+            "default_platform", "niche_key", "vibe_key", "tone_key", "preferred_language",
+            "audience_key", "country_key", "city_key",
+        )
+        .annotate(users=Count("id"))
+        .filter(users__gte=min_users)
+        .order_by("-users")[:limit]
+    )
+    return [
+        (
+            _norm(r["default_platform"]),
+            r["niche_key"],
+            r["vibe_key"],
+            r["tone_key"],
+            _norm(r["preferred_language"]) or "en",
+            r["audience_key"],
+            r["country_key"],
+            r["city_key"],
+        )
+        for r in rows
+    ]
+
+
+def build_segment_pool(segment: tuple, batches: int) -> list:
+    """
+    Generate `batches` independent batches of 5 ideas for one segment.
+    """
+    request_kwargs = build_ideas_request(_segment_profile(segment), segment[0])
+    pool = []
+    for _ in range(batches):
+        try:
+            raw = chat_completion("ideas_pool", **request_kwargs).strip()
+        except Exception as e:
+            print(f"[IDEAS_POOL] generation failed for {segment}: {e}")
+            continue
+        ideas = parse_ideas(raw)
+        if isinstance(ideas, list) and ideas:
+            pool.append(ideas)
+    return pool
+
+
+def store_segment_pool(segment: tuple, pool: list):
+    idea_pool_cache.set(segment_key(segment), {"segment": list(segment), "batches": pool})
+
+
+def take_pooled_ideas(user, profile, platform: str):
+    """
+    Next unseen pooled batch for this user today, or None (-> live generation).
+
+    Each user walks through the segment's batches starting at a user-specific
+    offset, so users of the same segment don't all get the same ideas, and
+    nobody gets the same batch twice in a day.
+    """
+    if not getattr(settings, "IDEA_POOL_ENABLED", True) or profile is None:
+        return None
+
+    key = segment_key(get_segment(profile, platform))
+    pool = idea_pool_cache.get(key)
+    if not pool or not pool.get("batches"):
+        return None
+
+    r = get_redis()
+    if r is None:
+        return None
+    seen_key = f"ideas:pool:seen:{key}:{user.id}"
+    try:
+        seen = r.incr(seen_key)
+        if seen == 1:
+            r.expire(seen_key, POOL_TTL)
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return None
+
+    batches = pool["batches"]
+    if seen > len(batches):
+        return None
+    return batches[(user.id + seen - 1) % len(batches)]
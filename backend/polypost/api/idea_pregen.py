@@ -0,0 +1,178 @@
+# api/idea_pregen.py
+"""
+Opt-in overnight idea pre-generation (CreatorProfile.pregenerate_ideas).
+
+An hourly beat task picks the opted-in, recently active users for whom it is
+currently IDEA_PREGEN_LOCAL_HOUR in their own timezone and generates that
+day's batch of ideas. The first ideas request of the day is then a Redis read.
+Quota is only charged when the ideas are actually revealed (served).
+
+Batches live in the app Redis only (a hash per user and local day, no
+in-process tier): revealing one is an atomic claim, so two requests or two
+workers can never both serve and charge the same batch. A claimed batch
+keeps its (emptied) key until it expires, so it isn't generated again.
+"""
+import json
+import zoneinfo
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from .deadlines import current_deadline, deadline_at
+from .llm import chat_completion
+from .models import CreatorProfile
+from .redis_client import get_redis, mark_redis_down
+from .utils import build_ideas_request, check_usage_allowed, parse_ideas
+
+PREGEN_TTL = 60 * 60 * 30
+
+# hand out the batch once, and only for the platform it was made for
+_CLAIM_LUA = """
+if redis.call('hget', KEYS[1], 'platform') ~= ARGV[1] then
+    return false
+end
+local ideas = redis.call('hget', KEYS[1], 'ideas')
+redis.call('hdel', KEYS[1], 'ideas')
+redis.call('hset', KEYS[1], 'platform', '')
+return ideas
+"""
+
+IDEAS_PER_CALL = 5
+
+
+def get_profile_tz(profile):
+    try:
+        return zoneinfo.ZoneInfo(profile.timezone or "UTC")
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return zoneinfo.ZoneInfo("UTC")
+
+
+def local_today(profile):
+    return timezone.now().astimezone(get_profile_tz(profile)).date()
+
+
+def _key(user_id, day) -> str:
+    return f"ideas:pregen:batch:{user_id}:{day.isoformat()}"
+
+
+def get_due_profiles(now=None) -> list:
+    """
+    Opted-in active profiles whose local hour is IDEA_PREGEN_LOCAL_HOUR
+    and whose batch for today isn't generated yet.
+    """
+    r = get_redis()
+    if r is None:
+        return []  # nowhere to keep the batches
+
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.IDEA_PREGEN_ACTIVE_DAYS)
+    profiles = (
+        CreatorProfile.objects
+        .filter(pregenerate_ideas=True, user__last_login__gte=since, user__is_active=True)
+        .select_related("user")
+    )
+
+    candidates = []
+    for profile in profiles:
+        local_now = now.astimezone(get_profile_tz(profile))
+        if local_now.hour == settings.IDEA_PREGEN_LOCAL_HOUR:
+            candidates.append((profile, _key(profile.user_id, local_now.date())))
+    if not candidates:
+        return []
+
+    try:
+        pipe = r.pipeline(transaction=False)
+        for _, key in candidates:
+            pipe.exists(key)
+        generated = pipe.execute()
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return []
+    return [profile for (profile, _), exists in zip(candidates, generated) if not exists]
+
+
+def _prepare(profile):
+    """
+    DB work for one user (quota check, prompt) - done on the task thread.
+    """
+    # no point paying for ideas the user couldn't reveal anyway
+    if not check_usage_allowed(profile.user, "idea", amount=IDEAS_PER_CALL):
+        return None
+
+    day = local_today(profile)
+    platform = profile.default_platform or "instagram"
+    return {
+        "key": _key(profile.user_id, day),
+        "platform": platform,
+        "request_kwargs": build_ideas_request(profile, platform, today=day),
+    }
+
+
+def _generate(job):
+    """
+    Only the OpenAI round trip runs in the worker threads.
+    """
+    try:
+        with deadline_at(job["deadline"]):
+            raw = chat_completion("ideas_pregen", **job["request_kwargs"]).strip()
+    except Exception as e:
+        print(f"[IDEAS_PREGEN] {job['key']} failed: {e}")
+        return None
+
+    ideas = parse_ideas(raw)
+    if not isinstance(ideas, list) or not ideas:
+        return None
+    return ideas
+
+
+def pregenerate_due_ideas() -> int:
+    jobs = [job for job in map(_prepare, get_due_profiles()) if job]
+    if not jobs:
+        return 0
+
+    deadline = current_deadline()  # the task's soft limit, for the worker threads
+    for job in jobs:
+        job["deadline"] = deadline
+
+    with ThreadPoolExecutor(max_workers=settings.IDEA_PREGEN_CONCURRENCY) as pool:
+        results = list(pool.map(_generate, jobs))
+
+    done = 0
+    r = get_redis()
+    for job, ideas in zip(jobs, results):
+        if not ideas or r is None:
+            continue
+        try:
+            pipe = r.pipeline()
+            pipe.hset(job["key"], mapping={"platform": job["platform"], "ideas": json.dumps(ideas)})
+            pipe.expire(job["key"], PREGEN_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            mark_redis_down(e)
+            break
+        done += 1
+
+    print(f"[IDEAS_PREGEN] generated {done}/{len(jobs)} batches")
+    return done
+
+
+def take_pregenerated_ideas(user, profile, platform: str):
+    """
+    Today's pre-generated batch for this user, or None. One-shot: the first
+    caller claims it atomically, later requests go through the normal path.
+    """
+    if profile is None or not profile.pregenerate_ideas:
+        return None
+
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        raw = r.eval(_CLAIM_LUA, 1, _key(user.id, local_today(profile)), platform)
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return None
+    return json.loads(raw) if raw else None
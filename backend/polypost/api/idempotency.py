@@ -0,0 +1,229 @@
+# api/idempotency.py
+"""
+Idempotency-Key support for the generation endpoints.
+
+The first response for a (view, user, key) is stored for IDEMPOTENCY_TTL;
+a retry with the same key gets exactly the same bytes back, without calling
+the model or charging usage again. A retry that arrives while the first
+request is still running gets a 409, and reusing a key with a different
+payload gets a 422.
+
+SSE streams are recorded as they are sent: once fully sent, the whole body is
+stored and replayed in one piece; the lock is held until then. A stream that
+was cut short or ended with an `error` event only releases the lock.
+5xx and degraded (template) responses are not stored: those can simply be
+retried.
+"""
+import base64
+import hashlib
+import json
+
+import redis
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.exceptions import APIException
+
+from .degrade import DEGRADED_HEADER
+from .llm_cache import TieredCache
+from .redis_client import get_redis, mark_redis_down
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+idempotency_cache = TieredCache(
+    "idem",
+    default_ttl=getattr(settings, "IDEMPOTENCY_TTL", 60 * 60 * 24),
+    local_max_entries=1024,
+    durable=True,
+)
+
+
+class IdempotencyConflict(APIException):
+    status_code = 409
+    default_detail = "A request with this Idempotency-Key is still being processed."
+    default_code = "idempotency_conflict"
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = 422
+    default_detail = "This Idempotency-Key was already used with a different payload."
+    default_code = "idempotency_key_reused"
+
+
+class IdempotentReplay(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def make_scope(view_name: str, user, key: str) -> str:
+    user_part = user.pk if getattr(user, "is_authenticated", False) else "anon"
+    return f"{view_name}:{user_part}:{key.strip()[:255]}"
+
+
+def fingerprint(data) -> str:
+    raw = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def replay_or_lock(scope: str, fp: str):
+    """
+    Returns the stored HttpResponse for a replay, or None after taking the
+    in-flight lock. Raises IdempotencyKeyReused / IdempotencyConflict.
+    """
+    stored = idempotency_cache.get(scope)
+    if stored is not None:
+        if stored["fingerprint"] != fp:
+            raise IdempotencyKeyReused()
+        response = HttpResponse(
+            base64.b64decode(stored["content"]),
+            status=stored["status"],
+            content_type=stored["content_type"],
+        )
+        response["Idempotent-Replayed"] = "true"
+        return response
+
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        acquired = r.set(f"idem:lock:{scope}", fp, nx=True, ex=getattr(settings, "IDEMPOTENCY_LOCK_TTL", 120))
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return None
+    if not acquired:
+        raise IdempotencyConflict()
+    return None
+
+
+def unlock(scope: str):
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.delete(f"idem:lock:{scope}")
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def _store(scope: str, fp: str, status: int, content_type: str, content: bytes):
+    idempotency_cache.set(scope, {
+        "fingerprint": fp,
+        "status": status,
+        "content_type": content_type,
+        "content": base64.b64encode(content).decode("ascii"),
+    })
+
+
+class _RecordedStream:
+    """
+    Streamed body that is kept as it is sent; on close (Django closes the
+    response after the last chunk or on disconnect) it is stored if complete,
+    then the lock is released - exactly once.
+    """
+
+    def __init__(self, content, scope: str, fp: str, status: int, content_type: str):
+        self._content = content
+        self._scope = scope
+        self._fp = fp
+        self._status = status
+        self._content_type = content_type
+        self._chunks = []
+        self._complete = False
+        self._open = True
+
+    def __iter__(self):
+        for chunk in self._content:
+            self._chunks.append(chunk)
+            yield chunk
+        self._complete = True
+
+    def close(self):
+        if not self._open:
+            return
+        self._open = False
+        try:
+            if self._complete and not (self._chunks and self._chunks[-1].startswith(b"event: error")):
+                _store(self._scope, self._fp, self._status, self._content_type, b"".join(self._chunks))
+        finally:
+            unlock(self._scope)
+
+
+class _ARecordedStream(_RecordedStream):
+    __iter__ = None  # StreamingHttpResponse tells sync from async by iter()
+
+    async def __aiter__(self):
+        async for chunk in self._content:
+            self._chunks.append(chunk)
+            yield chunk
+        self._complete = True
+
+
+def store_and_unlock(scope: str, fp: str, response):
+    """
+    Store a rendered response (if storable) and release the in-flight lock.
+    Streamed responses are stored / unlocked when they are closed.
+    """
+    if isinstance(response, StreamingHttpResponse) and not response.has_header(DEGRADED_HEADER):
+        wrap = _ARecordedStream if response.is_async else _RecordedStream
+        response.streaming_content = wrap(
+            response.streaming_content, scope, fp,
+            response.status_code, response.get("Content-Type", "text/event-stream"),
+        )
+        return
+
+    try:
+        if (
+            not isinstance(response, StreamingHttpResponse)
+            and response.status_code < 500
+            and not response.has_header(DEGRADED_HEADER)
+        ):
+            if hasattr(response, "render") and not getattr(response, "is_rendered", True):
+                response.render()
+            _store(scope, fp, response.status_code, response.get("Content-Type", "application/json"),
+                   response.content)
+    finally:
+        unlock(scope)
+
+
+class IdempotentPostMixin:
+    """
+    DRF views: put this first in the bases of a generation view.
+
+    The lookup happens in initial(), i.e. after authentication, so keys are
+    scoped per user.
+    """
+    _idempotency = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+
+        self._idempotency = None
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if request.method != "POST" or not key:
+            return
+
+        scope = make_scope(self.__class__.__name__, request.user, key)
+        fp = fingerprint({"query": request.query_params.dict(), "data": request.data})
+        replay = replay_or_lock(scope, fp)
+        if replay is not None:
+            raise IdempotentReplay(replay)
+        self._idempotency = (scope, fp)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, IdempotentReplay):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # unhandled -> 500 further up; don't leave the key locked
+            if self._idempotency is not None:
+                unlock(self._idempotency[0])
+                self._idempotency = None
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self._idempotency is not None:
+            scope, fp = self._idempotency
+            self._idempotency = None
+            store_and_unlock(scope, fp, response)
+        return response
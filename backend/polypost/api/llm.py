@@ -0,0 +1,414 @@
+# api/llm.py
+import threading
+import time
+import uuid
+
+import redis
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+
+from .circuit_breaker import CircuitOpen
+from .deadlines import DeadlineExceeded, current_deadline, deadline_at
+from .llm_backends import get_llm_backend, is_request_error
+from .llm_cache import completion_cache, get_completion_cache_ttl, make_completion_key
+from .llm_lanes import LaneLimiter
+from .llm_ledger import record_llm_call
+from .llm_router import pick_models, record_call, try_timeout
+from .redis_client import get_redis, mark_redis_down
+from .single_flight import SingleFlight
+
+single_flight = SingleFlight(
+    "llm:sf",
+    wait_timeout=getattr(settings, "LLM_SINGLE_FLIGHT_WAIT", 60),
+)
+
+
+# KEYS[1] in-flight zset   ARGV: now, stale cutoff, limit, token
+ADMIT_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+return 1
+"""
+
+
+class InflightTracker:
+    """
+    Counts backend calls currently in flight: per process, and across all
+    workers through a Redis sorted set of call tokens (score = start time).
+    Entries older than stale_after are dropped, so a killed worker can't
+    leave the count stuck.
+    """
+
+    def __init__(self, key: str, stale_after: int = 120):
+        self.key = key
+        self.stale_after = stale_after
+        self._local = 0
+        self._lock = threading.Lock()
+        self._admit_script = None
+
+    def _start(self, endpoint: str) -> str:
+        token = f"{endpoint}:{uuid.uuid4().hex}"
+        with self._lock:
+            self._local += 1
+        r = get_redis()
+        if r is not None:
+            try:
+                r.zadd(self.key, {token: time.time()})
+            except redis.RedisError as e:
+                mark_redis_down(e)
+        return token
+
+    def _finish(self, token: str):
+        with self._lock:
+            self._local -= 1
+        r = get_redis()
+        if r is not None:
+            try:
+                r.zrem(self.key, token)
+            except redis.RedisError as e:
+                mark_redis_down(e)
+
+    def try_start(self, endpoint: str, limit: int):
+        """
+        Register a call only if fewer than `limit` are in flight (atomic in
+        Redis). Returns the call token, or None when full.
+        """
+        if limit <= 0:
+            return self._start(endpoint)
+
+        token = f"{endpoint}:{uuid.uuid4().hex}"
+        now = time.time()
+        r = get_redis()
+        if r is not None:
+            try:
+                if self._admit_script is None:
+                    self._admit_script = r.register_script(ADMIT_LUA)
+                admitted = self._admit_script(
+                    keys=[self.key], args=[now, now - self.stale_after, limit, token], client=r
+                )
+            except redis.RedisError as e:
+                mark_redis_down(e)
+            else:
+                if not int(admitted):
+                    return None
+                with self._lock:
+                    self._local += 1
+                return token
+
+        # Redis down: this process only
+        with self._lock:
+            if self._local >= limit:
+                return None
+            self._local += 1
+        return token
+
+    def local_count(self) -> int:
+        return self._local
+
+    def count(self) -> int:
+        """
+        In-flight calls across all workers (this process only if Redis is down).
+        """
+        r = get_redis()
+        if r is not None:
+            try:
+                pipe = r.pipeline()
+                pipe.zremrangebyscore(self.key, "-inf", time.time() - self.stale_after)
+                pipe.zcard(self.key)
+                return int(pipe.execute()[1])
+            except redis.RedisError as e:
+                mark_redis_down(e)
+        return self._local
+
+
+inflight = InflightTracker(
+    "llm:inflight",
+    stale_after=getattr(settings, "LLM_INFLIGHT_STALE_AFTER", 120),
+)
+
+# plan-aware admission on top of the in-flight count (llm_lanes.py)
+limiter = LaneLimiter(inflight)
+
+
+def _single_flight_enabled(endpoint: str) -> bool:
+    return endpoint in getattr(settings, "LLM_SINGLE_FLIGHT_ENDPOINTS", ())
+
+
+def _chain_deadline():
+    """
+    Deadline for a whole model chain: LLM_CHAIN_TIMEOUT_SECONDS from now, or
+    the request / task deadline if that comes first.
+    """
+    deadline = current_deadline()
+    budget = getattr(settings, "LLM_CHAIN_TIMEOUT_SECONDS", None)
+    if not budget:
+        return deadline
+    end = time.monotonic() + budget
+    return end if deadline is None else min(deadline, end)
+
+
+def _try_deadline(route_name, chain_deadline, last: bool):
+    """
+    Deadline for one try: the route's latency budget, so a slow model fails
+    over in time, bounded by the chain deadline. The last model of the chain
+    gets whatever is left.
+    """
+    budget = try_timeout(route_name)
+    if last or not budget:
+        return chain_deadline
+    end = time.monotonic() + budget
+    return end if chain_deadline is None else min(chain_deadline, end)
+
+
+def _complete(endpoint: str, model: str, messages: list, params: dict):
+    """
+    One backend call, going down the route's model chain on failure. Each try
+    gets the route's latency budget (the rest of the chain deadline for the
+    last model) as its timeout.
+    """
+    route_name, models = pick_models(endpoint, model)
+    deadline = _chain_deadline()
+    last_error = None
+    for i, candidate in enumerate(models):
+        started = time.monotonic()
+        try:
+            with deadline_at(_try_deadline(route_name, deadline, last=i == len(models) - 1)):
+                result = get_llm_backend().complete(endpoint, model=candidate, messages=messages, **params)
+        except (DeadlineExceeded, CircuitOpen):
+            raise  # out of time / OpenAI down: not this model's fault, no point trying the next
+        except Exception as e:
+            if is_request_error(e):
+                raise  # bad request: the next model would refuse it too, and it says nothing about this one
+            record_call(route_name, candidate, started, ok=False)
+            print(f"[LLM_ROUTER] {endpoint}: {candidate} failed ({e})")
+            last_error = e
+            continue
+        record_call(route_name, candidate, started, ok=True)
+        return result
+    raise last_error
+
+
+async def _acomplete(endpoint: str, model: str, messages: list, params: dict):
+    route_name, models = await sync_to_async(pick_models, thread_sensitive=False)(endpoint, model)
+    deadline = _chain_deadline()
+    last_error = None
+    for i, candidate in enumerate(models):
+        started = time.monotonic()
+        try:
+            with deadline_at(_try_deadline(route_name, deadline, last=i == len(models) - 1)):
+                result = await get_llm_backend().acomplete(endpoint, model=candidate, messages=messages, **params)
+        except (DeadlineExceeded, CircuitOpen):
+            raise
+        except Exception as e:
+            if is_request_error(e):
+                raise
+            await sync_to_async(record_call, thread_sensitive=False)(route_name, candidate, started, False)
+            print(f"[LLM_ROUTER] {endpoint}: {candidate} failed ({e})")
+            last_error = e
+            continue
+        await sync_to_async(record_call, thread_sensitive=False)(route_name, candidate, started, True)
+        return result
+    raise last_error
+
+
+def _stream(endpoint: str, model: str, messages: list, params: dict):
+    """
+    Streaming can only fail over before the first delta was sent, so the
+    latency budget only bounds the wait for it.
+    """
+    route_name, models = pick_models(endpoint, model)
+    deadline = _chain_deadline()
+    last_error = None
+    for i, candidate in enumerate(models):
+        started = time.monotonic()
+        sent = False
+        try:
+            deltas = iter(get_llm_backend().stream(endpoint, model=candidate, messages=messages, **params))
+            first = _try_deadline(route_name, deadline, last=i == len(models) - 1)
+            while True:
+                # the deadline is only set around next(): a generator must not
+                # hold a contextvar across its yields
+                with deadline_at(deadline if sent else first):
+                    delta = next(deltas, None)
+                if delta is None:
+                    break
+                sent = True
+                yield delta
+        except (DeadlineExceeded, CircuitOpen):
+            raise
+        except Exception as e:
+            if is_request_error(e) and not sent:
+                raise
+            record_call(route_name, candidate, started, ok=False)
+            if sent:
+                raise
+            print(f"[LLM_ROUTER] {endpoint}: {candidate} failed ({e})")
+            last_error = e
+            continue
+        record_call(route_name, candidate, started, ok=True)
+        return
+    raise last_error
+
+
+def _ms_since(started: float) -> int:
+    return int((time.monotonic() - started) * 1000)
+
+
+def _record_hit(endpoint: str, model: str, user, started: float):
+    record_llm_call(endpoint, model, user=user, latency_ms=_ms_since(started), cache_hit=True)
+
+
+def _recorded(endpoint: str, model: str, user, call) -> str:
+    """
+    Run call() (-> LLMResult), add it to the usage ledger, return its text.
+    """
+    started = time.monotonic()
+    try:
+        result = call()
+    except Exception:
+        record_llm_call(endpoint, model, user=user, latency_ms=_ms_since(started), ok=False)
+        raise
+    record_llm_call(
+        endpoint, result.model or model, user=user,
+        prompt_tokens=result.prompt_tokens, completion_tokens=result.completion_tokens,
+        latency_ms=_ms_since(started),
+    )
+    return result.content
+
+
+def chat_completion(endpoint: str, *, model: str, messages: list, user=None, **params) -> str:
+    """
+    Single entry point for chat completions. Returns the message text.
+    The actual call goes through the backend picked by settings.LLM_BACKEND.
+
+    endpoint: short name of the calling feature ("caption", "ideas",
+              "brand_personas", ...). Endpoints listed in
+              settings.LLM_CACHE_ENDPOINTS are served from the completion
+              cache when the exact same prompt was sent recently.
+              Endpoints in settings.LLM_SINGLE_FLIGHT_ENDPOINTS share one
+              upstream call between concurrent identical requests.
+    model:    default model. Endpoints mapped in settings.LLM_ENDPOINT_ROUTES
+              are served by their route's model chain instead (llm_router.py).
+    user:     the caller (request.user); picks the priority lane from the
+              user's plan (llm_lanes.py). None = background work.
+
+    Every call, cache hits included, goes to the usage ledger (llm_ledger.py).
+    """
+    ttl = get_completion_cache_ttl(endpoint)
+    coalesce = _single_flight_enabled(endpoint)
+    key = None
+
+    if ttl or coalesce:
+        key = make_completion_key(model, messages, params)
+
+    started = time.monotonic()
+    if ttl:
+        cached = completion_cache.get(key)
+        if cached is not None:
+            _record_hit(endpoint, model, user, started)
+            return cached
+
+    called = []
+
+    def _create():
+        with limiter.slot(endpoint, user):
+            called.append(True)
+            return _recorded(endpoint, model, user, lambda: _complete(endpoint, model, messages, params))
+
+    content = single_flight.do(key, _create) if coalesce else _create()
+    if not called:
+        _record_hit(endpoint, model, user, started)  # served by another caller's request
+
+    if ttl:
+        completion_cache.set(key, content, ttl=ttl)
+
+    return content
+
+
+async def achat_completion(endpoint: str, *, model: str, messages: list, user=None, **params) -> str:
+    """
+    Async twin of chat_completion, used by the ASGI views.
+    The OpenAI round trip doesn't hold a thread; only the (fast) cache
+    lookups are pushed to a worker thread.
+    """
+    ttl = get_completion_cache_ttl(endpoint)
+    coalesce = _single_flight_enabled(endpoint)
+    key = None
+
+    if ttl or coalesce:
+        key = make_completion_key(model, messages, params)
+
+    started = time.monotonic()
+    record = sync_to_async(record_llm_call, thread_sensitive=False)
+    if ttl:
+        cached = await sync_to_async(completion_cache.get, thread_sensitive=False)(key)
+        if cached is not None:
+            await record(endpoint, model, user=user, latency_ms=_ms_since(started), cache_hit=True)
+            return cached
+
+    called = []
+
+    async def _create():
+        async with limiter.aslot(endpoint, user):
+            called.append(True)
+            call_started = time.monotonic()
+            try:
+                result = await _acomplete(endpoint, model, messages, params)
+            except Exception:
+                await record(endpoint, model, user=user, latency_ms=_ms_since(call_started), ok=False)
+                raise
+            await record(
+                endpoint, result.model or model, user=user,
+                prompt_tokens=result.prompt_tokens, completion_tokens=result.completion_tokens,
+                latency_ms=_ms_since(call_started),
+            )
+            return result.content
+
+    content = await single_flight.ado(key, _create) if coalesce else await _create()
+    if not called:
+        await record(endpoint, model, user=user, latency_ms=_ms_since(started), cache_hit=True)
+
+    if ttl:
+        await sync_to_async(completion_cache.set, thread_sensitive=False)(key, content, ttl=ttl)
+
+    return content
+
+
+def stream_chat_completion(endpoint: str, *, model: str, messages: list, user=None, **params):
+    """
+    Generator yielding text deltas as the model produces them.
+
+    Cache-enabled endpoints replay a cached completion as a single chunk and
+    store the assembled text once the stream has finished.
+    """
+    ttl = get_completion_cache_ttl(endpoint)
+    key = None
+
+    started = time.monotonic()
+    if ttl:
+        key = make_completion_key(model, messages, params)
+        cached = completion_cache.get(key)
+        if cached is not None:
+            _record_hit(endpoint, model, user, started)
+            yield cached
+            return
+
+    parts = []
+    with limiter.slot(endpoint, user):
+        call_started = time.monotonic()
+        try:
+            for delta in _stream(endpoint, model, messages, params):
+                parts.append(delta)
+                yield delta
+        except Exception:
+            record_llm_call(endpoint, model, user=user, latency_ms=_ms_since(call_started), ok=False)
+            raise
+        # streamed responses carry no usage block
+        record_llm_call(endpoint, model, user=user, latency_ms=_ms_since(call_started))
+
+    if ttl:
+        completion_cache.set(key, "".join(parts), ttl=ttl)
@@ -0,0 +1,395 @@
+# api/llm_backends.py
+"""
+LLM backends used by api/llm.py. Pick one with settings.LLM_BACKEND:
+
+- "openai": the real thing
+- "fake":   deterministic offline answers with configurable latency / token counts
+- "record": calls OpenAI and appends every completion to LLM_REPLAY_PATH
+- "replay": serves completions captured by "record", no network needed
+
+Every backend implements complete() / acomplete() / stream() and gets the
+endpoint name, so fakes can return something the calling view can parse.
+"""
+import asyncio
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from .circuit_breaker import CircuitBreaker
+from .deadlines import timeout_for
+from .llm_cache import make_completion_key
+
+
+def llm_timeout() -> float:
+    """
+    Per-call timeout: LLM_TIMEOUT_SECONDS, shortened to the request deadline.
+    """
+    return timeout_for(getattr(settings, "LLM_TIMEOUT_SECONDS", 30))
+
+
+def _sleep(latency: float):
+    # offline backends time out like the real client would
+    timeout = llm_timeout()
+    time.sleep(min(latency, timeout))
+    if latency > timeout:
+        raise TimeoutError(f"LLM call timed out after {timeout:.1f}s")
+
+
+async def _asleep(latency: float):
+    timeout = llm_timeout()
+    await asyncio.sleep(min(latency, timeout))
+    if latency > timeout:
+        raise TimeoutError(f"LLM call timed out after {timeout:.1f}s")
+
+
+# per-model or transient answers: another model (or a later try) may succeed
+RETRYABLE_4XX = (404, 408, 409, 429)
+
+
+def is_request_error(exc) -> bool:
+    """
+    True when the API rejected the request itself (400, 401, 403, 422, ...):
+    every model in the chain would reject it the same way.
+    """
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in RETRYABLE_4XX
+
+
+class LLMResult:
+    def __init__(self, content: str, model: str = "", prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.content = content
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+
+class BaseLLMBackend:
+    name = "base"
+
+    def complete(self, endpoint: str, *, model: str, messages: list, **params) -> LLMResult:
+        raise NotImplementedError
+
+    async def acomplete(self, endpoint: str, *, model: str, messages: list, **params) -> LLMResult:
+        raise NotImplementedError
+
+    def stream(self, endpoint: str, *, model: str, messages: list, **params):
+        """
+        Yields text deltas. Default: one chunk with the full completion.
+        """
+        yield self.complete(endpoint, model=model, messages=messages, **params).content
+
+
+# -----------------------------------------------------------------------------
+# OpenAI
+# -----------------------------------------------------------------------------
+# shared by all models: when OpenAI itself is down, falling back to another
+# model doesn't help either
+openai_breaker = CircuitBreaker("openai")
+
+
+class OpenAIBackend(BaseLLMBackend):
+    name = "openai"
+
+    def __init__(self):
+        # imported here so fake/replay runs don't need the SDK configured
+        from openai import APIConnectionError, AsyncOpenAI, InternalServerError, OpenAI
+
+        # no SDK retries: each one would get a fresh llm_timeout() and blow the
+        # deadline; failing over / retrying is llm.py's (and the router's) call
+        self.client = OpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+        self.async_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+        import httpx
+
+        # timeouts (APITimeoutError is an APIConnectionError), connection
+        # errors and 5xx; a 400 means OpenAI is up. Errors while reading a
+        # stream come straight from httpx, unwrapped.
+        openai_breaker.failure_exceptions = (APIConnectionError, InternalServerError, httpx.TransportError)
+
+    @staticmethod
+    def _to_result(resp, model: str) -> LLMResult:
+        usage = getattr(resp, "usage", None)
+        return LLMResult(
+            content=resp.choices[0].message.content or "",
+            model=getattr(resp, "model", None) or model,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        )
+
+    def complete(self, endpoint, *, model, messages, **params):
+        resp = openai_breaker.call(
+            self.client.chat.completions.create,
+            model=model, messages=messages, timeout=llm_timeout(), **params
+        )
+        return self._to_result(resp, model)
+
+    async def acomplete(self, endpoint, *, model, messages, **params):
+        resp = await openai_breaker.acall(
+            self.async_client.chat.completions.create,
+            model=model, messages=messages, timeout=llm_timeout(), **params
+        )
+        return self._to_result(resp, model)
+
+    def _deltas(self, model, messages, params):
+        stream = self.client.chat.completions.create(
+            model=model, messages=messages, stream=True, timeout=llm_timeout(), **params
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    def stream(self, endpoint, *, model, messages, **params):
+        # a stream can also die half-way (read timeout, dropped connection)
+        yield from openai_breaker.iterate(self._deltas, model, messages, params)
+
+
+# -----------------------------------------------------------------------------
+# Fake
+# -----------------------------------------------------------------------------
+def _estimate_tokens(messages: list) -> int:
+    # ~4 characters per token is close enough for a fake
+    chars = sum(len(str(m.get("content") or "")) for m in messages)
+    return max(1, chars // 4)
+
+
+def _chunks(text: str, size: int = 16):
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+class FakeBackend(BaseLLMBackend):
+    """
+    Deterministic: the same prompt always gives the same answer and latency.
+    Answers are shaped per endpoint (ideas -> JSON array, json_object -> JSON)
+    so the views' parsing code runs like in production.
+    """
+    name = "fake"
+
+    def __init__(self):
+        self.latency_ms = getattr(settings, "LLM_FAKE_LATENCY_MS", 800)
+        self.jitter_ms = getattr(settings, "LLM_FAKE_LATENCY_JITTER_MS", 0)
+        self.prompt_tokens = getattr(settings, "LLM_FAKE_PROMPT_TOKENS", None)
+        self.completion_tokens = getattr(settings, "LLM_FAKE_COMPLETION_TOKENS", 120)
+        self.responses = getattr(settings, "LLM_FAKE_RESPONSES", {})
+
+    def _seed(self, model, messages, params) -> str:
+        return make_completion_key(model, messages, params)
+
+    def _latency(self, seed: str) -> float:
+        jitter = 0
+        if self.jitter_ms:
+            jitter = int(seed[:8], 16) % (self.jitter_ms + 1)
+        return (self.latency_ms + jitter) / 1000.0
+
+    def _filler(self, seed: str, words: int) -> str:
+        vocab = ["creator", "content", "post", "audience", "story", "vibe", "hook", "trend"]
+        return " ".join(vocab[int(seed[i % len(seed)], 16) % len(vocab)] for i in range(words))
+
+    def _content(self, endpoint: str, seed: str, params: dict) -> str:
+        if endpoint in self.responses:
+            return self.responses[endpoint]
+
+        if endpoint.startswith("ideas"):
+            per_idea = max(1, self.completion_tokens // 5)
+            return json.dumps([
+                {
+                    "title": f"Fake idea {i + 1} ({seed[:6]})",
+                    "description": self._filler(seed[i:], per_idea),
+                    "suggested_caption_starter": "Here's the thing...",
+                    "hook_used": "fake",
+                    "personal_twist": "fake",
+                }
+                for i in range(5)
+            ])
+
+        if (params.get("response_format") or {}).get("type") == "json_object":
+            return json.dumps({"fake": True, "text": self._filler(seed, self.completion_tokens)})
+
+        return self._filler(seed, self.completion_tokens)
+
+    def _result(self, endpoint, model, messages, params):
+        seed = self._seed(model, messages, params)
+        result = LLMResult(
+            content=self._content(endpoint, seed, params),
+            model=model,
+            prompt_tokens=self.prompt_tokens or _estimate_tokens(messages),
+            completion_tokens=self.completion_tokens,
+        )
+        return result, self._latency(seed)
+
+    def complete(self, endpoint, *, model, messages, **params):
+        result, latency = self._result(endpoint, model, messages, params)
+        _sleep(latency)
+        return result
+
+    async def acomplete(self, endpoint, *, model, messages, **params):
+        result, latency = self._result(endpoint, model, messages, params)
+        await _asleep(latency)
+        return result
+
+    def stream(self, endpoint, *, model, messages, **params):
+        result, latency = self._result(endpoint, model, messages, params)
+        timeout = llm_timeout()
+        parts = _chunks(result.content)
+        for i, part in enumerate(parts):
+            if latency * (i + 1) / len(parts) > timeout:
+                raise TimeoutError(f"LLM stream timed out after {timeout:.1f}s")
+            time.sleep(latency / len(parts))
+            yield part
+
+
+# -----------------------------------------------------------------------------
+# Record / replay
+# -----------------------------------------------------------------------------
+class LLMReplayMiss(Exception):
+    pass
+
+
+class RecordingBackend(OpenAIBackend):
+    """
+    Real OpenAI calls, every completion appended to LLM_REPLAY_PATH (JSONL).
+    """
+    name = "record"
+
+    def __init__(self):
+        super().__init__()
+        self.path = settings.LLM_REPLAY_PATH
+        self._lock = threading.Lock()
+
+    def _record(self, endpoint, model, messages, params, result: LLMResult, latency: float):
+        line = json.dumps({
+            "key": make_completion_key(model, messages, params),
+            "endpoint": endpoint,
+            "model": result.model,
+            "content": result.content,
+            "prompt_tokens": result.prompt_tokens,
+            "completion_tokens": result.completion_tokens,
+            "latency_ms": int(latency * 1000),
+        }, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def complete(self, endpoint, *, model, messages, **params):
+        start = time.monotonic()
+        result = super().complete(endpoint, model=model, messages=messages, **params)
+        self._record(endpoint, model, messages, params, result, time.monotonic() - start)
+        return result
+
+    async def acomplete(self, endpoint, *, model, messages, **params):
+        start = time.monotonic()
+        result = await super().acomplete(endpoint, model=model, messages=messages, **params)
+        self._record(endpoint, model, messages, params, result, time.monotonic() - start)
+        return result
+
+    def stream(self, endpoint, *, model, messages, **params):
+        start = time.monotonic()
+        parts = []
+        for delta in super().stream(endpoint, model=model, messages=messages, **params):
+            parts.append(delta)
+            yield delta
+        # streamed responses carry no usage block
+        result = LLMResult("".join(parts), model=model)
+        self._record(endpoint, model, messages, params, result, time.monotonic() - start)
+
+
+class ReplayBackend(BaseLLMBackend):
+    """
+    Serves completions captured by RecordingBackend, keyed on the prompt hash.
+
+    LLM_REPLAY_ON_MISS: "fake" (answer with FakeBackend) or "error".
+    LLM_REPLAY_REALTIME: sleep for the recorded latency before answering.
+    """
+    name = "replay"
+
+    def __init__(self):
+        self.path = settings.LLM_REPLAY_PATH
+        self.on_miss = getattr(settings, "LLM_REPLAY_ON_MISS", "fake")
+        self.realtime = getattr(settings, "LLM_REPLAY_REALTIME", False)
+        self.records = {}
+        self.fake = FakeBackend() if self.on_miss == "fake" else None
+
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        record = json.loads(line)
+                        self.records[record["key"]] = record
+        except FileNotFoundError:
+            print(f"[LLM_REPLAY] no recordings at {self.path}")
+
+        print(f"[LLM_REPLAY] loaded {len(self.records)} recorded completions")
+
+    def _lookup(self, endpoint, model, messages, params):
+        record = self.records.get(make_completion_key(model, messages, params))
+        if record is None:
+            if self.fake is None:
+                raise LLMReplayMiss(f"No recorded completion for endpoint={endpoint!r}")
+            return None, 0.0
+
+        result = LLMResult(
+            content=record["content"],
+            model=record.get("model") or model,
+            prompt_tokens=record.get("prompt_tokens", 0),
+            completion_tokens=record.get("completion_tokens", 0),
+        )
+        latency = record.get("latency_ms", 0) / 1000.0 if self.realtime else 0.0
+        return result, latency
+
+    def complete(self, endpoint, *, model, messages, **params):
+        result, latency = self._lookup(endpoint, model, messages, params)
+        if result is None:
+            return self.fake.complete(endpoint, model=model, messages=messages, **params)
+        _sleep(latency)
+        return result
+
+    async def acomplete(self, endpoint, *, model, messages, **params):
+        result, latency = self._lookup(endpoint, model, messages, params)
+        if result is None:
+            return await self.fake.acomplete(endpoint, model=model, messages=messages, **params)
+        await _asleep(latency)
+        return result
+
+    def stream(self, endpoint, *, model, messages, **params):
+        result, latency = self._lookup(endpoint, model, messages, params)
+        if result is None:
+            yield from self.fake.stream(endpoint, model=model, messages=messages, **params)
+            return
+        parts = _chunks(result.content)
+        for part in parts:
+            if latency:
+                time.sleep(latency / len(parts))
+            yield part
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "fake": FakeBackend,
+    "record": RecordingBackend,
+    "replay": ReplayBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_llm_backend() -> BaseLLMBackend:
+    """
+    Process-wide backend instance, built on first use from settings.LLM_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, "LLM_BACKEND", "openai")
+                try:
+                    backend_cls = BACKENDS[name]
+                except KeyError:
+                    raise ValueError(f"Unknown LLM_BACKEND {name!r}, expected one of {sorted(BACKENDS)}")
+                _backend = backend_cls()
+                print(f"[LLM] using {_backend.name} backend")
+    return _backend
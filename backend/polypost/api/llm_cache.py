@@ -0,0 +1,156 @@
+# api/llm_cache.py
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+
+from .redis_client import get_cache_redis, get_redis, mark_cache_redis_down, mark_redis_down
+
+
+class TieredCache:
+    """
+    Small two-tier cache:
+      1) in-process LRU (bounded, per worker)
+      2) Redis (shared between workers, TTL-based)
+
+    Values must be JSON-serialisable. Redis errors never break the caller:
+    we just fall back to the local tier.
+
+    Entries live in the cache Redis (CACHE_REDIS_URL, allowed to evict them);
+    durable=True keeps them in the app Redis for entries that must survive
+    memory pressure until their TTL (e.g. stored idempotent responses).
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        default_ttl: int = 3600,
+        local_max_entries: int = 512,
+        local_ttl: int | None = None,
+        durable: bool = False,
+    ):
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.local_max_entries = local_max_entries
+        self.local_ttl = local_ttl
+        self._redis, self._redis_down = (
+            (get_redis, mark_redis_down) if durable else (get_cache_redis, mark_cache_redis_down)
+        )
+        self._local = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    # ---- local tier ----
+    def _local_get(self, key):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return item
+
+    def _local_set(self, key, value, ttl: int):
+        if self.local_ttl is not None:
+            ttl = min(ttl, self.local_ttl)
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_max_entries:
+                self._local.popitem(last=False)
+
+    # ---- public API ----
+    def get(self, key: str, default=None):
+        item = self._local_get(key)
+        if item is not None:
+            return item[1]
+
+        r = self._redis()
+        if r is None:
+            return default
+
+        try:
+            raw = r.get(self._redis_key(key))
+            if raw is None:
+                return default
+            ttl_left = r.ttl(self._redis_key(key))
+        except redis.RedisError as e:
+            self._redis_down(e)
+            return default
+
+        value = json.loads(raw)
+        # repopulate the local tier with whatever lifetime Redis has left
+        self._local_set(key, value, ttl_left if ttl_left and ttl_left > 0 else self.default_ttl)
+        return value
+
+    def set(self, key: str, value, ttl: int | None = None):
+        ttl = ttl or self.default_ttl
+        self._local_set(key, value, ttl)
+
+        r = self._redis()
+        if r is None:
+            return
+        try:
+            r.set(self._redis_key(key), json.dumps(value), ex=ttl)
+        except redis.RedisError as e:
+            self._redis_down(e)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._local.pop(key, None)
+
+        r = self._redis()
+        if r is None:
+            return
+        try:
+            r.delete(self._redis_key(key))
+        except redis.RedisError as e:
+            self._redis_down(e)
+
+
+def _normalize_content(content):
+    if isinstance(content, str):
+        # same prompt with different line endings / trailing spaces = same key
+        lines = content.replace("\r\n", "\n").split("\n")
+        return "\n".join(line.rstrip() for line in lines).strip()
+    return content
+
+
+def make_completion_key(model: str, messages: list, params: dict) -> str:
+    """
+    Stable hash of model + messages + generation parameters.
+    """
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": m.get("role"), "content": _normalize_content(m.get("content"))}
+            for m in messages
+        ],
+        "params": {k: v for k, v in params.items() if v is not None},
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_completion_cache_ttl(endpoint: str) -> int | None:
+    """
+    Per-endpoint opt-in: only endpoints listed in LLM_CACHE_ENDPOINTS are cached.
+    """
+    if not getattr(settings, "LLM_CACHE_ENABLED", True):
+        return None
+    return getattr(settings, "LLM_CACHE_ENDPOINTS", {}).get(endpoint)
+
+
+completion_cache = TieredCache(
+    "llm:completion",
+    local_max_entries=getattr(settings, "LLM_CACHE_LOCAL_MAX_ENTRIES", 512),
+)
@@ -0,0 +1,148 @@
+# api/llm_lanes.py
+"""
+Plan-aware priority lanes in front of the LLM backend.
+
+At most LLM_CONCURRENCY_LIMIT calls are in flight across all workers. Every
+call runs in a lane picked from get_user_plan(user).slug
+(settings.LLM_PRIORITY_LANES); a lane may only start a call while the total
+in flight is below its share of the limit, so under contention free traffic
+stops at e.g. 60% and the remaining slots stay free for paying users.
+
+A call that can't get a slot waits (polling) up to its lane's max_wait, or
+less if the request deadline is closer, then raises LLMSaturated (503 +
+Retry-After). Ideas / sample captions turn that into a degraded answer (see
+degrade.py).
+"""
+import asyncio
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import APIException
+
+from .deadlines import wait_budget
+
+POLL_INTERVAL = 0.05
+PLAN_CACHE_TTL = 60  # seconds a user's plan slug is reused
+
+BACKGROUND_LANE = "background"  # calls without a user (nightly pools, pre-generation, ...)
+
+_plan_slugs = {}  # user_id -> (expires_at, slug)
+_plan_lock = threading.Lock()
+
+
+class LLMSaturated(APIException):
+    status_code = 503
+    default_detail = "The AI service is busy right now, please retry in a moment."
+    default_code = "llm_saturated"
+
+    def __init__(self, lane: str, wait: int = 5):
+        super().__init__()
+        self.lane = lane
+        self.wait = wait  # DRF turns this into Retry-After
+
+
+def _plan_slug(user) -> str:
+    from .utils import get_user_plan  # utils imports llm, which imports us
+
+    now = time.monotonic()
+    with _plan_lock:
+        cached = _plan_slugs.get(user.pk)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    try:
+        slug = get_user_plan(user).slug
+    except Exception as e:
+        print(f"[LLM_LANES] could not resolve plan for user {user.pk}: {e}")
+        slug = "free"
+
+    with _plan_lock:
+        _plan_slugs[user.pk] = (now + PLAN_CACHE_TTL, slug)
+    return slug
+
+
+def lane_for(user) -> str:
+    """
+    Lane name for a caller. None = no user at all (background work);
+    anonymous visitors use LLM_DEFAULT_LANE.
+    """
+    if user is None:
+        return BACKGROUND_LANE
+    if not getattr(user, "is_authenticated", False):
+        return settings.LLM_DEFAULT_LANE
+
+    slug = _plan_slug(user)
+    for name, lane in settings.LLM_PRIORITY_LANES.items():
+        if slug in lane.get("plans", ()):
+            return name
+    return settings.LLM_DEFAULT_LANE
+
+
+def _lane_limit(lane_name: str) -> int:
+    limit = getattr(settings, "LLM_CONCURRENCY_LIMIT", 0)
+    if limit <= 0:
+        return 0
+    share = settings.LLM_PRIORITY_LANES.get(lane_name, {}).get("share", 1.0)
+    return max(1, math.floor(limit * share))
+
+
+def _max_wait(lane_name: str) -> float:
+    return settings.LLM_PRIORITY_LANES.get(lane_name, {}).get("max_wait", 10)
+
+
+class LaneLimiter:
+    def __init__(self, tracker):
+        self.tracker = tracker  # llm.InflightTracker
+
+    def _give_up(self, endpoint: str, lane: str, waited: float):
+        print(f"[LLM_LANES] {endpoint}/{lane}: no slot after {waited:.1f}s")
+        raise LLMSaturated(lane, wait=max(1, math.ceil(_max_wait(lane) / 2)))
+
+    @contextmanager
+    def slot(self, endpoint: str, user):
+        lane = lane_for(user)
+        limit = _lane_limit(lane)
+        started = time.monotonic()
+        deadline = started + wait_budget(_max_wait(lane))
+
+        token = self.tracker.try_start(endpoint, limit)
+        while token is None:
+            if time.monotonic() >= deadline:
+                self._give_up(endpoint, lane, time.monotonic() - started)
+            time.sleep(POLL_INTERVAL)
+            token = self.tracker.try_start(endpoint, limit)
+
+        waited = time.monotonic() - started
+        if waited > 0.5:
+            print(f"[LLM_LANES] {endpoint}/{lane}: queued {waited:.1f}s")
+        try:
+            yield lane
+        finally:
+            self.tracker._finish(token)
+
+    @asynccontextmanager
+    async def aslot(self, endpoint: str, user):
+        lane = await sync_to_async(lane_for)(user)
+        limit = _lane_limit(lane)
+        started = time.monotonic()
+        deadline = started + wait_budget(_max_wait(lane))
+
+        try_start = sync_to_async(self.tracker.try_start, thread_sensitive=False)
+        token = await try_start(endpoint, limit)
+        while token is None:
+            if time.monotonic() >= deadline:
+                self._give_up(endpoint, lane, time.monotonic() - started)
+            await asyncio.sleep(POLL_INTERVAL)
+            token = await try_start(endpoint, limit)
+
+        waited = time.monotonic() - started
+        if waited > 0.5:
+            print(f"[LLM_LANES] {endpoint}/{lane}: queued {waited:.1f}s")
+        try:
+            yield lane
+        finally:
+            await sync_to_async(self.tracker._finish, thread_sensitive=False)(token)
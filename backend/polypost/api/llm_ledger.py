@@ -0,0 +1,263 @@
+# api/llm_ledger.py
+"""
+OpenAI usage ledger.
+
+Every chat_completion / achat_completion / stream_chat_completion call (and
+every completion-cache or single-flight hit) is recorded as an LLMCall row:
+endpoint, model, prompt / completion tokens, latency, cache hit, user.
+
+Recording must not slow the request down, so record_llm_call() only RPUSHes a
+compact JSON line to a Redis list; the flush_llm_ledger task drains it every
+minute with bulk_create (a batch that fails to write is pushed back and
+retried on the next run). If Redis is down, lines are buffered in process and
+written directly once LOCAL_FLUSH_AT are pending.
+
+ledger_report() aggregates per endpoint per day in SQL (calls, cache hits,
+errors, tokens, estimated cost from LLM_PRICES), plus p50 / p95 latency of the
+real calls from a bounded sample.
+Streamed completions carry no usage block, their token counts are 0.
+"""
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Mod, TruncDate
+from django.utils import timezone
+
+from .models import LLMCall
+from .redis_client import get_redis, mark_redis_down
+
+LEDGER_KEY = "llm:ledger"
+LOCAL_FLUSH_AT = 200
+REPORT_LATENCY_SAMPLE = 50_000  # max rows read for the p50 / p95 latencies
+
+_local = []
+_local_lock = threading.Lock()
+
+
+def _enabled() -> bool:
+    return getattr(settings, "LLM_LEDGER_ENABLED", True)
+
+
+def record_llm_call(endpoint: str, model: str = "", *, user=None, prompt_tokens: int = 0,
+                    completion_tokens: int = 0, latency_ms: int = 0, cache_hit: bool = False,
+                    ok: bool = True):
+    if not _enabled():
+        return
+    line = json.dumps({
+        "e": endpoint,
+        "m": model or "",
+        "u": user.pk if getattr(user, "is_authenticated", False) else None,
+        "pt": int(prompt_tokens or 0),
+        "ct": int(completion_tokens or 0),
+        "ms": max(0, int(latency_ms)),
+        "c": int(cache_hit),
+        "ok": int(ok),
+        "t": round(time.time(), 3),
+    }, separators=(",", ":"))
+
+    r = get_redis()
+    if r is not None:
+        try:
+            r.rpush(LEDGER_KEY, line)
+            return
+        except redis.RedisError as e:
+            mark_redis_down(e)
+
+    with _local_lock:
+        _local.append(line)
+        if len(_local) < LOCAL_FLUSH_AT:
+            return
+        lines = _local[:]
+        _local.clear()
+    _write(lines)
+
+
+def _to_row(line) -> LLMCall | None:
+    try:
+        d = json.loads(line)
+        return LLMCall(
+            user_id=d["u"],
+            endpoint=d["e"][:64],
+            model=d["m"][:64],
+            prompt_tokens=d["pt"],
+            completion_tokens=d["ct"],
+            latency_ms=d["ms"],
+            cache_hit=bool(d["c"]),
+            ok=bool(d["ok"]),
+            created_at=datetime.fromtimestamp(d["t"], tz=dt_timezone.utc),
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"[LLM_LEDGER] skipping bad line {line!r}: {e}")
+        return None
+
+
+def _write(lines) -> int:
+    rows = [row for row in map(_to_row, lines) if row is not None]
+    user_ids = {row.user_id for row in rows if row.user_id}
+    if user_ids:
+        # users deleted since the call was queued
+        existing = set(get_user_model().objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+        for row in rows:
+            if row.user_id not in existing:
+                row.user_id = None
+    if rows:
+        LLMCall.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def flush_llm_ledger(max_rows: int | None = None) -> int:
+    """
+    Move queued calls into the database. Returns the number of rows written.
+    """
+    max_rows = max_rows or getattr(settings, "LLM_LEDGER_FLUSH_BATCH", 5000)
+    written = 0
+
+    with _local_lock:
+        lines = _local[:]
+        _local.clear()
+    if lines:
+        try:
+            written += _write(lines)
+        except Exception as e:
+            print(f"[LLM_LEDGER] flush failed, keeping {len(lines)} local lines: {e}")
+            _requeue_local(lines)
+            return written
+
+    r = get_redis()
+    if r is None:
+        return written
+    while True:
+        try:
+            pipe = r.pipeline()  # MULTI: read + trim in one step, so two flushers never share lines
+            pipe.lrange(LEDGER_KEY, 0, max_rows - 1)
+            pipe.ltrim(LEDGER_KEY, max_rows, -1)
+            lines, _ = pipe.execute()
+        except redis.RedisError as e:
+            mark_redis_down(e)
+            break
+        if not lines:
+            break
+        try:
+            written += _write(lines)
+        except Exception as e:
+            # DB down / failing: put the batch back at the head and retry next run
+            print(f"[LLM_LEDGER] flush failed, requeueing {len(lines)} lines: {e}")
+            _requeue(r, lines)
+            break
+        if len(lines) < max_rows:
+            break
+    return written
+
+
+def _requeue_local(lines):
+    with _local_lock:
+        _local[:0] = lines
+
+
+def _requeue(r, lines):
+    try:
+        r.lpush(LEDGER_KEY, *reversed(lines))  # LPUSH reverses: keeps the original order
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        _requeue_local(lines)
+
+
+# -----------------------------------------------------------------------------
+# Report
+# -----------------------------------------------------------------------------
+def _percentile(values: list, pct: float):
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[idx]
+
+
+def _price(model: str):
+    """
+    (input, output) USD per 1M tokens. Dated snapshots ("gpt-4o-mini-2024-07-18")
+    use their base model's price.
+    """
+    prices = getattr(settings, "LLM_PRICES", {})
+    for name in sorted(prices, key=len, reverse=True):
+        if model.startswith(name):
+            return prices[name]
+    return None
+
+
+def ledger_report(days: int = 7, endpoint: str | None = None) -> list:
+    """
+    [{day, endpoint, calls, cache_hits, errors, prompt_tokens, completion_tokens,
+      p50_ms, p95_ms, est_cost_usd}], newest day first.
+
+    Counts, tokens and cost are summed in SQL (per day, endpoint and model);
+    the latency percentiles come from a sample of at most REPORT_LATENCY_SAMPLE
+    real calls (every k-th row by id).
+    """
+    since = timezone.now() - timedelta(days=days)
+    qs = LLMCall.objects.filter(created_at__gte=since)
+    if endpoint:
+        qs = qs.filter(endpoint=endpoint)
+    qs = qs.order_by()
+    real = Q(cache_hit=False, ok=True)
+
+    groups = defaultdict(lambda: {
+        "calls": 0, "cache_hits": 0, "errors": 0, "real": 0,
+        "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "latencies": [],
+    })
+    rows = (
+        qs.values("endpoint", "model", day=TruncDate("created_at"))
+        .annotate(
+            calls=Count("id"),
+            cache_hits=Count("id", filter=Q(cache_hit=True)),
+            errors=Count("id", filter=Q(cache_hit=False, ok=False)),
+            real=Count("id", filter=real),
+            prompt_tokens=Sum("prompt_tokens"),
+            completion_tokens=Sum("completion_tokens"),
+        )
+    )
+    for row in rows:
+        g = groups[(row["day"].isoformat(), row["endpoint"])]
+        for field in ("calls", "cache_hits", "errors", "real"):
+            g[field] += row[field]
+        pt, ct = row["prompt_tokens"] or 0, row["completion_tokens"] or 0
+        g["prompt_tokens"] += pt
+        g["completion_tokens"] += ct
+        price = _price(row["model"])
+        if price:
+            g["cost"] += (pt * price[0] + ct * price[1]) / 1_000_000
+
+    total_real = sum(g["real"] for g in groups.values())
+    if total_real:
+        step = max(1, math.ceil(total_real / REPORT_LATENCY_SAMPLE))
+        sample = qs.filter(real)
+        if step > 1:
+            sample = sample.annotate(bucket=Mod("id", step)).filter(bucket=0)
+        for day, ep, ms in sample.values_list(TruncDate("created_at"), "endpoint", "latency_ms").iterator(chunk_size=5000):
+            groups[(day.isoformat(), ep)]["latencies"].append(ms)
+
+    report = []
+    for (day, ep), g in groups.items():
+        report.append({
+            "day": day,
+            "endpoint": ep,
+            "calls": g["calls"],
+            "cache_hits": g["cache_hits"],
+            "errors": g["errors"],
+            "prompt_tokens": g["prompt_tokens"],
+            "completion_tokens": g["completion_tokens"],
+            "p50_ms": _percentile(g["latencies"], 50),
+            "p95_ms": _percentile(g["latencies"], 95),
+            "est_cost_usd": round(g["cost"], 4),
+        })
+    report.sort(key=lambda row: (row["day"], row["calls"]), reverse=True)
+    return report
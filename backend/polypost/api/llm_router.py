@@ -0,0 +1,189 @@
+# api/llm_router.py
+"""
+Latency-aware model routing.
+
+Endpoints are grouped into task classes ("routes", settings.LLM_ROUTES), each
+with an ordered model chain and a latency budget. For every call we pick the
+first model in the chain whose recent p95 latency and error rate are within
+budget; if the call itself fails, or takes longer than the latency budget, we
+fall through to the next model (try_timeout()).
+
+Latency / error samples are kept in Redis (shared by all workers) with an
+in-process copy as fallback, and can be inspected via route_stats(). Only
+samples from the last LLM_ROUTE_SAMPLE_WINDOW seconds count: a demoted model
+hardly gets calls, so once its old samples age out it is below min_samples,
+tried first again, and re-measured.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+
+import redis
+from django.conf import settings
+
+from .redis_client import get_redis, mark_redis_down
+
+WINDOW = 200  # samples kept per (route, model)
+SNAPSHOT_TTL = 5  # seconds we reuse computed stats before re-reading Redis
+
+
+def _percentile(values: list, pct: float):
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[idx]
+
+
+def _sample_window() -> int:
+    return getattr(settings, "LLM_ROUTE_SAMPLE_WINDOW", 600)
+
+
+class RouteStats:
+    def __init__(self):
+        self._local = defaultdict(lambda: deque(maxlen=WINDOW))  # (route, model) -> [(ms, ok, at)]
+        self._snapshots = {}  # (route, model) -> (computed_at, stats)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _redis_key(route: str, model: str) -> str:
+        return f"llm:route:{route}:{model}"
+
+    def record(self, route: str, model: str, latency_ms: int, ok: bool):
+        now = time.time()
+        with self._lock:
+            self._local[(route, model)].append((latency_ms, ok, now))
+
+        r = get_redis()
+        if r is None:
+            return
+        try:
+            key = self._redis_key(route, model)
+            pipe = r.pipeline()
+            pipe.lpush(key, f"{latency_ms}:{int(ok)}:{int(now)}")
+            pipe.ltrim(key, 0, WINDOW - 1)
+            pipe.expire(key, _sample_window())
+            pipe.execute()
+        except redis.RedisError as e:
+            mark_redis_down(e)
+
+    def _samples(self, route: str, model: str) -> list:
+        """
+        [(ms, ok)] recorded within the sample window, newest first.
+        """
+        since = time.time() - _sample_window()
+        r = get_redis()
+        if r is not None:
+            try:
+                raw = r.lrange(self._redis_key(route, model), 0, WINDOW - 1)
+                samples = []
+                for item in raw:
+                    parts = item.decode().split(":")
+                    if len(parts) != 3 or int(parts[2]) < since:
+                        break  # newest first: the rest is older (or from before timestamps)
+                    samples.append((int(parts[0]), parts[1] == "1"))
+                return samples
+            except redis.RedisError as e:
+                mark_redis_down(e)
+        with self._lock:
+            return [(ms, ok) for ms, ok, at in reversed(self._local[(route, model)]) if at >= since]
+
+    def get(self, route: str, model: str, fresh: bool = False) -> dict:
+        now = time.monotonic()
+        cached = self._snapshots.get((route, model))
+        if cached and not fresh and now - cached[0] < SNAPSHOT_TTL:
+            return cached[1]
+
+        samples = self._samples(route, model)
+        latencies = [ms for ms, ok in samples if ok]
+        errors = sum(1 for _, ok in samples if not ok)
+        stats = {
+            "samples": len(samples),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "error_rate": round(errors / len(samples), 3) if samples else 0.0,
+        }
+        self._snapshots[(route, model)] = (now, stats)
+        return stats
+
+
+route_stats_store = RouteStats()
+
+
+def get_route(endpoint: str):
+    """
+    (route_name, route_config) for an endpoint, or (None, None) if unrouted.
+    """
+    name = getattr(settings, "LLM_ENDPOINT_ROUTES", {}).get(endpoint)
+    if not name:
+        return None, None
+    return name, getattr(settings, "LLM_ROUTES", {}).get(name)
+
+
+def _is_healthy(stats: dict, route: dict) -> bool:
+    if stats["samples"] < route.get("min_samples", 20):
+        return True  # not enough data yet, give it a chance
+    if stats["error_rate"] > route.get("max_error_rate", 0.2):
+        return False
+    return stats["p95_ms"] is None or stats["p95_ms"] <= route["latency_budget_ms"]
+
+
+def try_timeout(route_name):
+    """
+    Seconds a single try may take before we move on to the next model: the
+    route's latency budget (None for unrouted calls).
+    """
+    if route_name is None:
+        return None
+    route = getattr(settings, "LLM_ROUTES", {}).get(route_name) or {}
+    budget_ms = route.get("latency_budget_ms")
+    return budget_ms / 1000.0 if budget_ms else None
+
+
+def pick_models(endpoint: str, requested_model: str):
+    """
+    Ordered list of models to try for this call, plus the route name.
+
+    Healthy models keep their chain order; unhealthy ones go to the end
+    (fastest first), so they are still tried as a last resort.
+    """
+    route_name, route = get_route(endpoint)
+    if not route:
+        return None, [requested_model]
+
+    chain = list(route["models"])
+    stats = {m: route_stats_store.get(route_name, m) for m in chain}
+    healthy = [m for m in chain if _is_healthy(stats[m], route)]
+    unhealthy = sorted(
+        (m for m in chain if m not in healthy),
+        key=lambda m: stats[m]["p95_ms"] or 0,
+    )
+    return route_name, healthy + unhealthy
+
+
+def record_call(route_name, model: str, started: float, ok: bool):
+    if route_name is None:
+        return
+    latency_ms = int((time.monotonic() - started) * 1000)
+    route_stats_store.record(route_name, model, latency_ms, ok)
+
+
+def route_stats() -> dict:
+    """
+    {route: {"latency_budget_ms", "endpoints", "models": {model: stats}}}
+    """
+    endpoint_routes = getattr(settings, "LLM_ENDPOINT_ROUTES", {})
+    out = {}
+    for name, route in getattr(settings, "LLM_ROUTES", {}).items():
+        out[name] = {
+            "latency_budget_ms": route["latency_budget_ms"],
+            "endpoints": sorted(e for e, r in endpoint_routes.items() if r == name),
+            "models": {
+                model: {
+                    **route_stats_store.get(name, model, fresh=True),
+                    "healthy": _is_healthy(route_stats_store.get(name, model), route),
+                }
+                for model in route["models"]
+            },
+        }
+    return out
@@ -0,0 +1,195 @@
+# api/load_shedding.py
+"""
+Load shedding for the generation endpoints.
+
+Under a spike, accepting every generation request only means each one waits
+in the LLM lanes / OpenAI until it times out. LoadSheddingMiddleware answers
+503 + Retry-After straight away instead, before auth or any DB work, when
+
+  - this process already has LOAD_SHED_MAX_LOCAL generation requests in
+    progress (including the ones still queued for a lane slot), or
+  - the request's LLM lane is in LOAD_SHED_LANES and the LLM calls in flight
+    across all workers (llm.inflight, re-read at most every
+    CLUSTER_SNAPSHOT_TTL seconds) reached that lane's share of
+    LOAD_SHED_MAX_INFLIGHT, i.e. the lane would only queue for a slot.
+    Paying lanes aren't shed on the cluster count: they wait for their
+    (larger) share in the limiter instead.
+
+The lane is only looked up once the cluster count is past the lowest shed
+threshold: the JWT is checked here (one user lookup, the plan slug is cached
+by llm_lanes). A streamed response counts as in progress until it is closed.
+
+Only POSTs to LOAD_SHED_PATHS are shed; drafts, notifications, usage, ... keep
+serving. Ideas / sample captions are not listed on purpose: they fall back to
+degrade mode, which is as cheap as a 503 and more useful.
+"""
+import json
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+
+CLUSTER_SNAPSHOT_TTL = 0.5
+
+_local = {"active": 0}
+_local_lock = threading.Lock()
+_cluster = {"at": 0.0, "count": 0}
+
+
+def _cluster_inflight() -> int:
+    from .llm import inflight  # llm pulls in the backends; keep middleware import light
+
+    now = time.monotonic()
+    if now - _cluster["at"] >= CLUSTER_SNAPSHOT_TTL:
+        _cluster["count"] = inflight.count()
+        _cluster["at"] = now
+    return _cluster["count"]
+
+
+def _sheddable(request) -> bool:
+    if not getattr(settings, "LOAD_SHED_ENABLED", True) or request.method != "POST":
+        return False
+    return request.path in getattr(settings, "LOAD_SHED_PATHS", ())
+
+
+def _shed_threshold(lane: str, limit: int) -> int:
+    share = settings.LLM_PRIORITY_LANES.get(lane, {}).get("share", 1.0)
+    return max(1, math.floor(limit * share))
+
+
+def _request_lane(request) -> str:
+    """
+    LLM lane of the caller. Runs before auth, so the JWT is checked here;
+    anonymous / invalid tokens get LLM_DEFAULT_LANE (auth will 401 them anyway).
+    """
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+    from .llm_lanes import lane_for
+
+    try:
+        auth = JWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        auth = None
+    if auth is None:
+        return settings.LLM_DEFAULT_LANE
+    return lane_for(auth[0])
+
+
+def shed_reason(request):
+    """
+    "process" / "cluster" when new generation work should be refused, else None.
+    """
+    if _local["active"] >= settings.LOAD_SHED_MAX_LOCAL:
+        return "process"
+    limit = settings.LOAD_SHED_MAX_INFLIGHT
+    lanes = getattr(settings, "LOAD_SHED_LANES", ())
+    if limit <= 0 or not lanes:
+        return None
+    count = _cluster_inflight()
+    if count < min(_shed_threshold(lane, limit) for lane in lanes):
+        return None  # no lane is shed yet: skip the token / plan lookup
+    lane = _request_lane(request)
+    if lane in lanes and count >= _shed_threshold(lane, limit):
+        return f"cluster, {lane} lane"
+    return None
+
+
+def _overloaded(request, reason: str) -> HttpResponse:
+    print(f"[LOAD_SHED] {request.path}: shed ({reason}, {_local['active']} active here)")
+    retry_after = getattr(settings, "LOAD_SHED_RETRY_AFTER", 5)
+    response = HttpResponse(
+        json.dumps({
+            "detail": "We're generating for a lot of people right now, please retry in a moment.",
+            "code": "overloaded",
+        }),
+        content_type="application/json",
+        status=503,
+    )
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def _enter():
+    with _local_lock:
+        _local["active"] += 1
+
+
+def _leave():
+    with _local_lock:
+        _local["active"] -= 1
+
+
+class _Streamed:
+    """
+    Streamed body that leaves the active count when Django closes the
+    response (after the last chunk, or on disconnect), exactly once.
+    """
+
+    def __init__(self, content):
+        self._content = content
+        self._open = True
+
+    def __iter__(self):
+        return iter(self._content)
+
+    def close(self):
+        if self._open:
+            self._open = False
+            _leave()
+
+
+class _AStreamed(_Streamed):
+    __iter__ = None  # StreamingHttpResponse tells sync from async by iter()
+
+    def __aiter__(self):
+        return aiter(self._content)
+
+
+def _finish(response):
+    """
+    Leave now, or once the streamed body is done.
+    """
+    if not getattr(response, "streaming", False):
+        _leave()
+        return response
+    wrap = _AStreamed if response.is_async else _Streamed
+    response.streaming_content = wrap(response.streaming_content)
+    return response
+
+
+@sync_and_async_middleware
+def LoadSheddingMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not _sheddable(request):
+                return await get_response(request)
+            reason = await sync_to_async(shed_reason, thread_sensitive=False)(request)
+            if reason:
+                return _overloaded(request, reason)
+            _enter()
+            try:
+                response = await get_response(request)
+            except BaseException:
+                _leave()
+                raise
+            return _finish(response)
+    else:
+        def middleware(request):
+            if not _sheddable(request):
+                return get_response(request)
+            reason = shed_reason(request)
+            if reason:
+                return _overloaded(request, reason)
+            _enter()
+            try:
+                response = get_response(request)
+            except BaseException:
+                _leave()
+                raise
+            return _finish(response)
+    return middleware
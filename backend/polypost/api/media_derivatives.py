@@ -0,0 +1,195 @@
+# api/media_derivatives.py
+"""
+Small JPEG derivatives of MediaUpload files for vision captions.
+
+Full-size uploads are slow to send and expensive in image tokens, so the model
+only ever sees a downscaled, recompressed copy: the photo itself, or
+VISION_VIDEO_FRAMES frames spread over a video (extracted with ffmpeg, if it is
+installed). Every image is at most VISION_MAX_SIDE px on its longest side and
+VISION_MAX_BYTES once encoded (quality first, then size is lowered until it
+fits), and is sent with detail=VISION_DETAIL.
+
+Derivatives are built once and kept in the default storage under
+vision/<media id>/, keyed on the budget settings, so a new budget rebuilds
+them. Anything that goes wrong returns no images and the caption falls back to
+the text-only prompt.
+"""
+import base64
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .deadlines import timeout_for
+
+MIN_SIDE = 128  # never shrink below this to meet the byte budget
+MIN_QUALITY = 40
+
+
+def _budget() -> dict:
+    return {
+        "max_side": getattr(settings, "VISION_MAX_SIDE", 768),
+        "max_bytes": getattr(settings, "VISION_MAX_BYTES", 120_000),
+        "quality": getattr(settings, "VISION_JPEG_QUALITY", 75),
+        "frames": getattr(settings, "VISION_VIDEO_FRAMES", 3),
+    }
+
+
+def _derivative_path(media, budget: dict, index: int) -> str:
+    sig = hashlib.sha1(repr(sorted(budget.items())).encode()).hexdigest()[:10]
+    return f"vision/{media.id}/{sig}-{index}.jpg"
+
+
+# -----------------------------------------------------------------------------
+# Encoding
+# -----------------------------------------------------------------------------
+def downscale(fp, budget: dict) -> bytes:
+    """
+    JPEG bytes of the image in `fp`, within the side / byte budget.
+    """
+    max_side = budget["max_side"]
+    with Image.open(fp) as img:
+        # JPEGs can be decoded at 1/2, 1/4, 1/8 scale directly: much cheaper for big photos
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    while True:
+        quality = budget["quality"]
+        while True:
+            buf = BytesIO()
+            img.save(buf, "JPEG", quality=quality, optimize=True)
+            if buf.tell() <= budget["max_bytes"] or quality <= MIN_QUALITY:
+                break
+            quality -= 10
+        if buf.tell() <= budget["max_bytes"] or max(img.size) <= MIN_SIDE:
+            return buf.getvalue()
+        img = img.resize((max(1, int(img.width * 0.75)), max(1, int(img.height * 0.75))), Image.LANCZOS)
+
+
+@contextmanager
+def _local_path(field):
+    """
+    A filesystem path for ffmpeg, copying remote storage to a temp file.
+    """
+    try:
+        path = field.path
+    except NotImplementedError:
+        path = None
+    if path:
+        yield path
+        return
+
+    suffix = os.path.splitext(field.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        with field.open("rb") as src:
+            shutil.copyfileobj(src, tmp)
+        tmp.flush()
+        yield tmp.name
+
+
+def _video_duration(path: str, ffprobe: str) -> float:
+    out = subprocess.run(
+        [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True, timeout=timeout_for(10), check=True,
+    )
+    return float(out.stdout.strip() or 0)
+
+
+def video_keyframes(field, budget: dict) -> list:
+    """
+    JPEG bytes of `frames` frames spread over the video (ffmpeg seeks to the
+    nearest keyframe, so this doesn't decode the whole file).
+    """
+    ffmpeg = shutil.which(getattr(settings, "VISION_FFMPEG_BIN", "ffmpeg"))
+    ffprobe = shutil.which(getattr(settings, "VISION_FFPROBE_BIN", "ffprobe"))
+    if not ffmpeg or not ffprobe:
+        print("[VISION] ffmpeg/ffprobe not installed, no video frames")
+        return []
+
+    frames = []
+    with _local_path(field) as path:
+        duration = _video_duration(path, ffprobe)
+        count = budget["frames"] if duration > 0 else 1
+        for i in range(count):
+            at = duration * (i + 0.5) / count
+            out = subprocess.run(
+                [ffmpeg, "-v", "error", "-ss", f"{at:.2f}", "-i", path, "-frames:v", "1",
+                 "-vf", f"scale='min({budget['max_side']},iw)':-2",
+                 "-f", "image2pipe", "-vcodec", "mjpeg", "-"],
+                capture_output=True, timeout=timeout_for(10), check=True,
+            )
+            if out.stdout:
+                frames.append(downscale(BytesIO(out.stdout), budget))
+    return frames
+
+
+# -----------------------------------------------------------------------------
+# Cache
+# -----------------------------------------------------------------------------
+def _stored(media, budget: dict) -> list:
+    images = []
+    for i in range(budget["frames"] if media.media_type == "video" else 1):
+        path = _derivative_path(media, budget, i)
+        if not default_storage.exists(path):
+            break
+        with default_storage.open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def get_derivatives(media) -> list:
+    """
+    JPEG bytes for the media (1 image for a photo, up to `frames` for a video),
+    built on first use.
+    """
+    budget = _budget()
+    images = _stored(media, budget)
+    if images:
+        return images
+
+    if media.media_type == "video":
+        images = video_keyframes(media.file, budget)
+    else:
+        with media.file.open("rb") as f:
+            images = [downscale(f, budget)]
+
+    if not images:
+        return images
+    for i, data in enumerate(images):
+        default_storage.save(_derivative_path(media, budget, i), ContentFile(data))
+    print(f"[VISION] built {len(images)} derivative(s) for {media.id}: {[len(d) for d in images]} bytes")
+    return images
+
+
+def vision_parts(media) -> list:
+    """
+    OpenAI image_url content parts for the media, or [] when vision is off or
+    no derivative could be made.
+    """
+    if not getattr(settings, "VISION_CAPTIONS_ENABLED", True) or not media.file:
+        return []
+    try:
+        images = get_derivatives(media)
+    except Exception as e:
+        print(f"[VISION] no derivative for {media.id}: {e}")
+        return []
+    detail = getattr(settings, "VISION_DETAIL", "low")
+    return [
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii"),
+                "detail": detail,
+            },
+        }
+        for data in images
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0037_generationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creatorprofile',
+            name='pregenerate_ideas',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0038_creatorprofile_pregenerate_ideas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedcaption',
+            name='variant_index',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='generatedcaption',
+            name='variants',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
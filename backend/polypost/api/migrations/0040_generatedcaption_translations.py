@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0039_generatedcaption_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedcaption',
+            name='translations',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0040_generatedcaption_translations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='draft',
+            name='execution_plan_key',
+            field=models.CharField(blank=True, editable=False, max_length=128),
+        ),
+    ]
@@ -135,6 +135,9 @@ class CreatorProfile(models.Model):
         help_text="JSON blob with AI-generated brand persona (summary, pillars, etc.).",
     )
 
+    # opt-in: generate tomorrow's ideas overnight (local time) so the morning request is instant
+    pregenerate_ideas = models.BooleanField(default=False)
+
 
     def __str__(self):
         return f"{self.user.username} Profile"
@@ -182,6 +185,22 @@ class GeneratedCaption(models.Model):
     text            = models.TextField()
     is_user_edited  = models.BooleanField(default=False)
     created_at      = models.DateTimeField(auto_now_add=True)
+    # all captions from the last generation (variants=N); `text` is variants[variant_index]
+    variants        = models.JSONField(default=list, blank=True)
+    variant_index   = models.PositiveSmallIntegerField(default=0)
+    # multi-language mode: {"fr": "...", "en": "..."}; `text` is the first language
+    translations    = models.JSONField(default=dict, blank=True)
+
+    def next_variant(self):
+        """
+        Switch to the next stored variant. Returns False when there is none left.
+        """
+        if self.variant_index + 1 >= len(self.variants):
+            return False
+        self.variant_index += 1
+        self.text = self.variants[self.variant_index]
+        self.is_user_edited = False
+        return True
 
 # ------------------------------------------------------------------
 # 3.  SCHEDULING & REMINDERS
@@ -375,6 +394,8 @@ class Draft(models.Model):
     hook_used = models.CharField(max_length=255, blank=True)
     personal_twist = models.TextField(blank=True)
     execution_plan = models.TextField(blank=True)
+    # (idea hash, platform, lang, profile fingerprint) the stored plan was built for
+    execution_plan_key = models.CharField(max_length=128, blank=True, editable=False)
 
 
     # media fields (optional)
@@ -623,4 +644,83 @@ class Notification(models.Model):
 
     @property
     def is_read(self) -> bool:
-        return self.read_at is not None
\ No newline at end of file
+        return self.read_at is not None
+
+class GenerationJob(models.Model):
+    """
+    Long LLM generation (action plan, brand personas) run by a Celery worker.
+    The web request only creates the row and returns 202 + the job id;
+    clients poll /api/jobs/<id>/ (or long-poll /api/async/jobs/<id>/) for the result.
+    """
+    KIND_CHOICES = [
+        ("idea_action_plan", "Idea action plan"),
+        ("brand_personas", "Brand personas"),
+    ]
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("succeeded", "Succeeded"),
+        ("failed", "Failed"),
+    ]
+    FINISHED_STATUSES = ("succeeded", "failed")
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # null for anonymous jobs (brand personas during registration)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="generation_jobs",
+    )
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="pending")
+    params = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.kind} [{self.status}] {self.id}"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in self.FINISHED_STATUSES
+
+
+class LLMCall(models.Model):
+    """
+    One chat completion (or completion-cache hit), for latency / spend
+    reporting. Rows are queued in Redis and written in batches by the
+    flush_llm_ledger task (api/llm_ledger.py).
+    """
+    # null for background work (pools, pre-generation) and anonymous visitors
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="llm_calls",
+    )
+    endpoint = models.CharField(max_length=64)
+    model = models.CharField(max_length=64, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    cache_hit = models.BooleanField(default=False)
+    ok = models.BooleanField(default=True)
+    created_at = models.DateTimeField(default=dj_timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["endpoint", "created_at"])]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.model} {self.latency_ms}ms"
@@ -0,0 +1,185 @@
+# api/persona_cache.py
+"""
+Brand persona cache for the onboarding flow.
+
+Onboarding answers (niche, audience, goals, comfort level) repeat a lot, so
+the three personas are cached per normalized answers + language. The prompt
+always gets the answers as typed; normalizing is only for the key. Every
+request bumps a daily popularity counter for its answers in Redis (and keeps
+the last typed version of them); a beat task pre-warms the most common
+combinations that aren't cached yet, so most visitors get their personas
+without an OpenAI call.
+"""
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .deadlines import current_deadline, deadline_at
+from .llm_cache import TieredCache
+from .redis_client import get_redis, mark_redis_down
+from .utils import _normalize_persona_inputs, abuild_brand_personas, build_brand_personas
+
+persona_cache = TieredCache(
+    "personas",
+    default_ttl=getattr(settings, "PERSONA_CACHE_TTL", 60 * 60 * 24 * 7),
+    local_max_entries=512,
+)
+
+_SPACES_RE = re.compile(r"\s+")
+POPULARITY_KEY = "personas:answers:{day}"
+TYPED_KEY = "personas:answers:typed:{day}"  # normalized answers -> last typed version that day
+
+
+def _norm(value: str) -> str:
+    return _SPACES_RE.sub(" ", (value or "").strip().lower()).strip(" .!?,;")
+
+
+def normalize_answers(niche, target_audience, goals, comfort_level, lang) -> tuple:
+    """
+    (typed, normalized): the (niche, target_audience, goals, comfort_level,
+    lang) answers with the same defaults as the prompt builder, and the same
+    lowercased and whitespace-collapsed for the cache key.
+    """
+    typed = _normalize_persona_inputs(niche, target_audience, goals, comfort_level, lang)
+    return typed, tuple(_norm(a) for a in typed)
+
+
+def answers_key(answers: tuple) -> str:
+    return json.dumps(list(answers), ensure_ascii=False, separators=(",", ":"))
+
+
+def _track(typed: tuple, answers: tuple):
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        day = timezone.now().date().isoformat()
+        ttl = 60 * 60 * 24 * (settings.PERSONA_PREWARM_DAYS + 1)
+        pipe = r.pipeline()
+        pipe.zincrby(POPULARITY_KEY.format(day=day), 1, answers_key(answers))
+        pipe.expire(POPULARITY_KEY.format(day=day), ttl)
+        pipe.hset(TYPED_KEY.format(day=day), answers_key(answers), answers_key(typed))
+        pipe.expire(TYPED_KEY.format(day=day), ttl)
+        pipe.execute()
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def _lookup(typed: tuple, answers: tuple):
+    _track(typed, answers)
+    return persona_cache.get(answers_key(answers))
+
+
+def get_brand_personas(niche, target_audience, goals, comfort_level, user=None, lang="en") -> dict:
+    """
+    Cached build_brand_personas().
+    """
+    typed, answers = normalize_answers(niche, target_audience, goals, comfort_level, lang)
+    cached = _lookup(typed, answers)
+    if cached is not None:
+        return cached
+
+    data = build_brand_personas(*typed[:4], user=user, lang=typed[4])
+    if data.get("personas"):
+        persona_cache.set(answers_key(answers), data)
+    return data
+
+
+async def aget_brand_personas(niche, target_audience, goals, comfort_level, user=None, lang="en") -> dict:
+    typed, answers = normalize_answers(niche, target_audience, goals, comfort_level, lang)
+    cached = await sync_to_async(_lookup, thread_sensitive=False)(typed, answers)
+    if cached is not None:
+        return cached
+
+    data = await abuild_brand_personas(*typed[:4], user=user, lang=typed[4])
+    if data.get("personas"):
+        await sync_to_async(persona_cache.set, thread_sensitive=False)(answers_key(answers), data)
+    return data
+
+
+def get_top_answers(limit: int, min_count: int, days: int) -> list:
+    """
+    Most requested normalized answer tuples over the last `days` days.
+    """
+    r = get_redis()
+    if r is None:
+        return []
+    today = timezone.now().date()
+    keys = [POPULARITY_KEY.format(day=(today - timedelta(days=i)).isoformat()) for i in range(days)]
+    try:
+        pipe = r.pipeline()
+        pipe.zunionstore("personas:answers:top", keys)
+        pipe.zrevrangebyscore("personas:answers:top", "+inf", min_count, start=0, num=limit)
+        pipe.delete("personas:answers:top")
+        top = pipe.execute()[1]
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return []
+    return [tuple(json.loads(raw)) for raw in top]
+
+
+def _typed_answers(answers: list, days: int) -> list:
+    """
+    The last typed version of each normalized answer tuple over the last
+    `days` days (the normalized one if it's gone).
+    """
+    r = get_redis()
+    if r is None or not answers:
+        return list(answers)
+    today = timezone.now().date()
+    fields = [answers_key(a) for a in answers]
+    try:
+        pipe = r.pipeline()
+        for i in range(days):
+            pipe.hmget(TYPED_KEY.format(day=(today - timedelta(days=i)).isoformat()), fields)
+        per_day = pipe.execute()  # newest day first
+    except redis.RedisError as e:
+        mark_redis_down(e)
+        return list(answers)
+    out = []
+    for i, a in enumerate(answers):
+        raw = next((day[i] for day in per_day if day[i]), None)
+        out.append(tuple(json.loads(raw)) if raw else a)
+    return out
+
+
+def _warm(typed: tuple, answers: tuple) -> bool:
+    try:
+        data = build_brand_personas(*typed[:4], lang=typed[4])
+    except Exception as e:
+        print(f"[PERSONA_CACHE] prewarm failed for {answers}: {e}")
+        return False
+    if not data.get("personas"):
+        return False
+    persona_cache.set(answers_key(answers), data)
+    return True
+
+
+def prewarm_brand_personas() -> int:
+    top = get_top_answers(
+        limit=settings.PERSONA_PREWARM_TOP,
+        min_count=settings.PERSONA_PREWARM_MIN_COUNT,
+        days=settings.PERSONA_PREWARM_DAYS,
+    )
+    missing = [a for a in top if persona_cache.get(answers_key(a)) is None]
+    if not missing:
+        return 0
+
+    deadline = current_deadline()  # the task's soft limit, for the worker threads
+
+    def warm(pair):
+        with deadline_at(deadline):
+            return _warm(*pair)
+
+    with ThreadPoolExecutor(max_workers=settings.PERSONA_PREWARM_CONCURRENCY) as pool:
+        typed = _typed_answers(missing, settings.PERSONA_PREWARM_DAYS)
+        done = sum(pool.map(warm, zip(typed, missing)))
+
+    print(f"[PERSONA_CACHE] pre-warmed {done}/{len(missing)} answer sets ({len(top)} popular)")
+    return done
@@ -0,0 +1,117 @@
+# api/prompt_budget.py
+"""
+Local token estimate + budgeted prompt assembly.
+
+Prompt builders describe their prompt as ordered sections. If the estimate is
+over the endpoint's budget (settings.PROMPT_TOKEN_BUDGETS), items are dropped
+from the end of the lowest-priority sections first; required sections are
+never touched. Every overflowing item is also clipped to its section's
+max_item_chars up front (trend titles, example captions, free-text answers).
+"""
+import math
+import re
+
+from django.conf import settings
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap BPE-ish estimate: every punctuation mark is a token, words cost
+    about one token per 4 characters. Good to ~10-15% on our prompts, which
+    is all a budget needs.
+    """
+    if not text:
+        return 0
+    return sum(
+        math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+        for piece in _TOKEN_RE.findall(text)
+    )
+
+
+def clip(text: str, max_chars: int | None) -> str:
+    if not max_chars or len(text) <= max_chars:
+        return text
+    return text[: max_chars - 1].rstrip() + "…"
+
+
+class PromptSection:
+    """
+    header / footer lines are only emitted while at least one item is kept.
+    Lower priority = trimmed first.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        items: list,
+        header: list | None = None,
+        footer: list | None = None,
+        priority: int = 0,
+        required: bool = False,
+        min_items: int = 0,
+        max_item_chars: int | None = None,
+    ):
+        self.name = name
+        self.raw_text = "\n".join((header or []) + [str(i) for i in items] + (footer or [])) if items else ""
+        self.items = [clip(str(i), max_item_chars) for i in items]
+        self.clipped = sum(1 for i in items if len(str(i)) > (max_item_chars or float("inf")))
+        self.header = header or []
+        self.footer = footer or []
+        self.priority = priority
+        self.required = required
+        self.min_items = min_items
+        self.dropped = 0
+
+    def lines(self) -> list:
+        if not self.items:
+            return []
+        return self.header + self.items + self.footer
+
+
+def get_prompt_budget(label: str) -> int | None:
+    return getattr(settings, "PROMPT_TOKEN_BUDGETS", {}).get(label)
+
+
+def assemble_prompt(label: str, sections: list, budget: int | None = None):
+    """
+    Join the sections into one prompt that fits `budget` tokens
+    (default: PROMPT_TOKEN_BUDGETS[label]). Returns (prompt, report).
+    """
+    if budget is None:
+        budget = get_prompt_budget(label)
+
+    def render():
+        return "\n".join(line for s in sections for line in s.lines())
+
+    before = estimate_tokens("\n".join(s.raw_text for s in sections if s.raw_text))
+    prompt = render()
+    after = estimate_tokens(prompt)
+
+    if budget and after > budget:
+        trimmable = sorted((s for s in sections if not s.required), key=lambda s: s.priority)
+        for section in trimmable:
+            while len(section.items) > section.min_items and after > budget:
+                section.items.pop()
+                section.dropped += 1
+                prompt = render()
+                after = estimate_tokens(prompt)
+            if after <= budget:
+                break
+
+    report = {
+        "label": label,
+        "budget": budget,
+        "tokens_before": before,
+        "tokens_after": after,
+        "over_budget": bool(budget and after > budget),
+        "dropped": {s.name: s.dropped for s in sections if s.dropped},
+        "clipped": {s.name: s.clipped for s in sections if s.clipped},
+    }
+    if report["dropped"] or report["clipped"] or report["over_budget"]:
+        print(
+            f"[PROMPT_BUDGET] {label}: {before} -> {after} tokens (budget {budget}) "
+            f"dropped={report['dropped']} clipped={report['clipped']}"
+        )
+    return prompt, report
@@ -0,0 +1,75 @@
+# api/redis_client.py
+import time
+
+import redis
+from django.conf import settings
+
+_clients = {}
+_down_until = {}
+
+# how long we stop talking to Redis after a connection error
+REDIS_BACKOFF_SECONDS = 5
+
+APP = "APP_REDIS_URL"
+CACHE = "CACHE_REDIS_URL"
+
+
+def _url(which: str) -> str:
+    app_url = getattr(settings, APP, "redis://localhost:6379/2")
+    if which == CACHE:
+        return getattr(settings, CACHE, None) or app_url
+    return app_url
+
+
+def _get(which: str):
+    if time.monotonic() < _down_until.get(which, 0.0):
+        return None
+
+    client = _clients.get(which)
+    if client is None:
+        client = _clients[which] = redis.Redis.from_url(
+            _url(which),
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5,
+        )
+    return client
+
+
+def _mark_down(which: str, exc: Exception | None):
+    _down_until[which] = time.monotonic() + REDIS_BACKOFF_SECONDS
+    if exc is not None:
+        label = "cache " if which == CACHE else ""
+        print(f"[REDIS] {label}unavailable, backing off {REDIS_BACKOFF_SECONDS}s: {exc}")
+
+
+def get_redis():
+    """
+    Shared redis-py client for app-level state: locks, counters, queues.
+    Nothing in here may be evicted (APP_REDIS_URL should point at a
+    noeviction instance).
+
+    Returns None while Redis is considered down (after a recent error),
+    so callers can skip straight to their local fallback instead of
+    paying a connect timeout on every request.
+    """
+    return _get(APP)
+
+
+def mark_redis_down(exc: Exception | None = None):
+    """
+    Call this when a Redis command fails: we back off for a few seconds.
+    """
+    _mark_down(APP, exc)
+
+
+def get_cache_redis():
+    """
+    Same as get_redis(), for pure caches (TieredCache) that can be rebuilt:
+    CACHE_REDIS_URL may point at an allkeys-lru instance. Falls back to
+    APP_REDIS_URL when unset.
+    """
+    return _get(CACHE)
+
+
+def mark_cache_redis_down(exc: Exception | None = None):
+    _mark_down(CACHE, exc)
@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from .models import MediaUpload, GeneratedCaption, PlannedPostSlot, PostPerformance, Draft, MediaUpload, GeneratedCaption, CreatorProfile, UseCaseTemplate, PostingReminder, Notification, Plan
+from .models import MediaUpload, GeneratedCaption, PlannedPostSlot, PostPerformance, Draft, MediaUpload, GeneratedCaption, CreatorProfile, UseCaseTemplate, PostingReminder, Notification, Plan, GenerationJob
 
 
 class RegisterSerializer(serializers.Serializer):
@@ -82,6 +83,7 @@ class CreatorProfileSerializer(serializers.ModelSerializer):
             "marketing_opt_in",
             "creator_stage",
             "avatar",
+            "pregenerate_ideas",
         )
         read_only_fields = ("id", "username", "email")
 
@@ -101,6 +103,23 @@ class MediaUploadSerializer(serializers.ModelSerializer):
 
 class CaptionGenerateSerializer(serializers.Serializer):
     media_id = serializers.UUIDField()
+    variants = serializers.IntegerField(
+        required=False,
+        default=1,
+        min_value=1,
+        max_value=getattr(settings, "CAPTION_MAX_VARIANTS", 5),
+    )
+    # multi-language mode: explicit ISO codes, or multilang=true to use
+    # CreatorProfile.content_languages
+    languages = serializers.ListField(
+        child=serializers.CharField(max_length=8),
+        required=False,
+        allow_empty=False,
+        max_length=getattr(settings, "CAPTION_MAX_LANGUAGES", 4),
+    )
+    multilang = serializers.BooleanField(required=False, default=False)
+    # send a downscaled copy of the media (video: a few frames) along with the prompt
+    vision = serializers.BooleanField(required=False, default=False)
 
     def validate(self, attrs):
         user = self.context["request"].user
@@ -115,10 +134,36 @@ class CaptionGenerateSerializer(serializers.Serializer):
         return attrs
 
 
+class CaptionBatchGenerateSerializer(serializers.Serializer):
+    media_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+
+    def validate_media_ids(self, value):
+        max_items = getattr(settings, "CAPTION_BATCH_MAX_ITEMS", 20)
+        if len(value) > max_items:
+            raise serializers.ValidationError(f"At most {max_items} media per batch.")
+        # drop duplicates, keep order
+        return list(dict.fromkeys(value))
+
+    def validate(self, attrs):
+        user = self.context["request"].user
+        media_ids = attrs["media_ids"]
+
+        # one query for the whole batch
+        media_by_id = MediaUpload.objects.filter(id__in=media_ids, user=user).in_bulk()
+        missing = [str(mid) for mid in media_ids if mid not in media_by_id]
+        if missing:
+            raise serializers.ValidationError(
+                {"media_ids": f"Media not found or not owned by you: {', '.join(missing)}"}
+            )
+
+        attrs["media"] = [media_by_id[mid] for mid in media_ids]
+        return attrs
+
+
 class GeneratedCaptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = GeneratedCaption
-        fields = ("id", "text", "is_user_edited", "created_at")
+        fields = ("id", "text", "is_user_edited", "created_at", "variants", "variant_index", "translations")
 
 
 class PlannedPostSlotSerializer(serializers.ModelSerializer):
@@ -280,3 +325,18 @@ class PlanSerializer(serializers.ModelSerializer):
             "max_upload_mb",
             "max_video_seconds",
         ]
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationJob
+        fields = [
+            "id",
+            "kind",
+            "status",
+            "result",
+            "error",
+            "attempts",
+            "created_at",
+            "finished_at",
+        ]
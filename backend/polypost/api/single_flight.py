@@ -0,0 +1,238 @@
+# api/single_flight.py
+"""
+Single-flight: concurrent identical calls share one execution.
+
+- inside a worker, followers wait on the leader's threading.Event / asyncio
+  future and get its result, or its exception re-raised (the same call would
+  fail the same way)
+- across workers, the leader holds a Redis lock and publishes its result;
+  followers on other workers poll for it. When the leader fails its lock is
+  released without a result, and they run the call themselves.
+
+Followers also run the call themselves when Redis is down, when they waited
+longer than wait_timeout, or when the leader never finished (cancelled,
+killed by a BaseException).
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+
+import redis
+from asgiref.sync import sync_to_async
+
+from .deadlines import wait_budget
+from .redis_client import get_redis, mark_redis_down
+
+POLL_INTERVAL = 0.1
+
+# delete the lock only if we still own it
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.ok = False
+
+
+class SingleFlight:
+    def __init__(self, namespace: str, wait_timeout: int = 60, result_ttl: int = 30):
+        self.namespace = namespace
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self._calls = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.namespace}:lock:{key}"
+
+    def _result_key(self, key: str, token: str) -> str:
+        return f"{self.namespace}:result:{key}:{token}"
+
+    # ---- Redis helpers (all best-effort) ----
+    def _try_acquire(self, key: str):
+        """
+        Returns (token, True) if we became the cluster-wide leader,
+        (leader_token, False) if someone else is, (None, True) if Redis is unusable.
+        """
+        r = get_redis()
+        if r is None:
+            return None, True
+        token = uuid.uuid4().hex
+        try:
+            if r.set(self._lock_key(key), token, nx=True, ex=self.wait_timeout):
+                return token, True
+            leader = r.get(self._lock_key(key))
+        except redis.RedisError as e:
+            mark_redis_down(e)
+            return None, True
+        if leader is None:
+            # lock expired between SET and GET -> just run it ourselves
+            return None, True
+        return leader.decode(), False
+
+    def _publish(self, key: str, token: str | None, result):
+        if token is None:
+            return
+        r = get_redis()
+        if r is None:
+            return
+        try:
+            pipe = r.pipeline()
+            pipe.set(self._result_key(key, token), json.dumps(result), ex=self.result_ttl)
+            pipe.eval(_RELEASE_LUA, 1, self._lock_key(key), token)
+            pipe.execute()
+        except redis.RedisError as e:
+            mark_redis_down(e)
+
+    def _release(self, key: str, token: str | None):
+        if token is None:
+            return
+        r = get_redis()
+        if r is None:
+            return
+        try:
+            r.eval(_RELEASE_LUA, 1, self._lock_key(key), token)
+        except redis.RedisError as e:
+            mark_redis_down(e)
+
+    def _peek(self, key: str, token: str):
+        """
+        One poll of the leader's result: ("done", value), ("wait", None) or ("gone", None).
+        """
+        r = get_redis()
+        if r is None:
+            return "gone", None
+        try:
+            raw = r.get(self._result_key(key, token))
+            if raw is not None:
+                return "done", json.loads(raw)
+            current = r.get(self._lock_key(key))
+        except redis.RedisError as e:
+            mark_redis_down(e)
+            return "gone", None
+        if current is None or current.decode() != token:
+            return "gone", None
+        return "wait", None
+
+    # ---- sync ----
+    def _do_shared(self, key: str, fn):
+        token, is_leader = self._try_acquire(key)
+
+        if is_leader:
+            try:
+                result = fn()
+            except BaseException:
+                self._release(key, token)
+                raise
+            self._publish(key, token, result)
+            return result
+
+        deadline = time.monotonic() + wait_budget(self.wait_timeout)
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            state, value = self._peek(key, token)
+            if state == "done":
+                return value
+            if state == "gone":
+                break
+        return fn()
+
+    def do(self, key: str, fn):
+        """
+        Run fn() once for all concurrent callers using the same key.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not is_leader:
+            if not call.event.wait(wait_budget(self.wait_timeout)):
+                return fn()
+            if call.error is not None:
+                raise call.error
+            if not call.ok:
+                return fn()
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn)
+            call.ok = True
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    # ---- async ----
+    async def _ado_shared(self, key: str, afn):
+        token, is_leader = await sync_to_async(self._try_acquire, thread_sensitive=False)(key)
+
+        if is_leader:
+            try:
+                result = await afn()
+            except BaseException:
+                # cancelled too: free the lock now rather than after wait_timeout
+                await asyncio.shield(sync_to_async(self._release, thread_sensitive=False)(key, token))
+                raise
+            await sync_to_async(self._publish, thread_sensitive=False)(key, token, result)
+            return result
+
+        deadline = time.monotonic() + wait_budget(self.wait_timeout)
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            state, value = await sync_to_async(self._peek, thread_sensitive=False)(key, token)
+            if state == "done":
+                return value
+            if state == "gone":
+                break
+        return await afn()
+
+    async def ado(self, key: str, afn):
+        """
+        Async twin of do(): afn is a zero-arg coroutine function.
+        """
+        loop = asyncio.get_running_loop()
+        fut = self._futures.get((loop, key))
+
+        if fut is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(fut), wait_budget(self.wait_timeout))
+            except asyncio.TimeoutError:
+                return await afn()
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise  # we were cancelled ourselves
+                return await afn()  # the leader was
+
+        fut = loop.create_future()
+        self._futures[(loop, key)] = fut
+        try:
+            result = await self._ado_shared(key, afn)
+            fut.set_result(result)
+            return result
+        except Exception as e:
+            fut.set_exception(e)
+            # nobody may be waiting on it; don't warn about an unretrieved exception
+            fut.exception()
+            raise
+        finally:
+            self._futures.pop((loop, key), None)
+            if not fut.done():
+                fut.cancel()  # leader cancelled: wake the followers now
@@ -3,7 +3,7 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from celery import shared_task
-from .models import GlobalTrend, PlatformTiming, PlannedPostSlot, Draft, CreatorProfile, Notification, PostingReminder
+from .models import GlobalTrend, PlatformTiming, PlannedPostSlot, Draft, CreatorProfile, Notification, PostingReminder, GenerationJob
 from .external_sources import (
     get_tmdb_trending,
     get_tiktok_trends_from_apify,
@@ -13,12 +13,17 @@ from .external_sources import (
 from collections import Counter
 from datetime import datetime, timezone as dt_timezone
 from datetime import timedelta
-from .utils import send_postly_email, get_current_usage
+from .utils import send_postly_email, get_current_usage, refresh_ideas_context
+from .idea_pools import get_top_segments, build_segment_pool, store_segment_pool
+from .idea_pregen import pregenerate_due_ideas
+from .action_plans import get_idea_action_plan, get_user_draft
+from .persona_cache import get_brand_personas, prewarm_brand_personas
+from .llm_ledger import flush_llm_ledger as _flush_llm_ledger
 from django.core.mail import send_mail
 from.email_templates import normalize_lang_code, get_email_text
 
 
-@shared_task
+@shared_task(soft_time_limit=300)
 def refresh_global_trends():
     # 1) entertainment
     for t in get_tmdb_trending():
@@ -40,6 +45,9 @@ def refresh_global_trends():
     # 5) update posting-time table
     update_platform_timing_from_trends()
 
+    # 6) rebuild today's shared ideas prompt block with the fresh titles
+    refresh_ideas_context()
+
 
 def update_platform_timing_from_trends():
     platforms = GlobalTrend.objects.values_list("platform", flat=True).distinct()
@@ -293,3 +301,112 @@ def check_upcoming_posts():
         reminder.notified = True
         reminder.save()
 
+
+def _execute_generation_job(job):
+    params = job.params or {}
+
+    if job.kind == "idea_action_plan":
+        profile = CreatorProfile.objects.filter(user=job.user).first() if job.user_id else None
+        return get_idea_action_plan(
+            profile=profile,
+            idea=params.get("idea") or {},
+            platform=params.get("platform") or "instagram",
+            lang=params.get("lang") or "en",
+            draft=get_user_draft(job.user, params.get("draft_id")) if job.user_id else None,
+            user=job.user,
+        )
+
+    if job.kind == "brand_personas":
+        return get_brand_personas(
+            niche=params.get("niche", ""),
+            target_audience=params.get("target_audience", ""),
+            goals=params.get("goals", ""),
+            comfort_level=params.get("comfort_level", ""),
+            user=job.user,
+            lang=params.get("lang") or "en",
+        )
+
+    raise ValueError(f"Unknown generation job kind: {job.kind}")
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=5, soft_time_limit=120)
+def run_generation_job(self, job_id):
+    """
+    Run a GenerationJob in the worker tier.
+    Upstream failures are retried here (with backoff) instead of in the web request.
+    """
+    job = GenerationJob.objects.filter(id=job_id).first()
+    if job is None or job.is_finished:
+        return
+
+    job.status = "running"
+    job.attempts += 1
+    job.save(update_fields=["status", "attempts", "updated_at"])
+
+    try:
+        result = _execute_generation_job(job)
+    except Exception as exc:
+        job.error = str(exc)
+        if self.request.retries < self.max_retries:
+            job.status = "pending"
+            job.save(update_fields=["status", "error", "updated_at"])
+            raise self.retry(exc=exc, countdown=self.default_retry_delay * (2 ** self.request.retries))
+
+        job.status = "failed"
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "error", "finished_at", "updated_at"])
+        return
+
+    job.status = "succeeded"
+    job.result = result
+    job.error = ""
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "result", "error", "finished_at", "updated_at"])
+
+
+@shared_task(soft_time_limit=1800)
+def refresh_idea_pools():
+    """
+    Nightly: pre-generate idea batches for the most common profile segments.
+    """
+    segments = get_top_segments(
+        limit=settings.IDEA_POOL_MAX_SEGMENTS,
+        min_users=settings.IDEA_POOL_MIN_USERS,
+        active_days=settings.IDEA_POOL_ACTIVE_DAYS,
+    )
+    built = 0
+    for segment in segments:
+        pool = build_segment_pool(segment, batches=settings.IDEA_POOL_BATCHES)
+        if pool:
+            store_segment_pool(segment, pool)
+            built += 1
+
+    print(f"[IDEAS_POOL] built {built}/{len(segments)} segment pools")
+    return built
+
+
+@shared_task(soft_time_limit=1800)
+def pregenerate_daily_ideas():
+    """
+    Hourly: users who opted in get their ideas generated overnight, local time.
+    """
+    return pregenerate_due_ideas()
+
+
+@shared_task(soft_time_limit=900)
+def prewarm_persona_cache():
+    """
+    Pre-generate personas for the most common onboarding answers.
+    """
+    return prewarm_brand_personas()
+
+
+@shared_task
+def flush_llm_ledger():
+    """
+    Every minute: write the queued LLM calls to LLMCall in one batch.
+    """
+    written = _flush_llm_ledger()
+    if written:
+        print(f"[LLM_LEDGER] wrote {written} calls")
+    return written
@@ -0,0 +1,211 @@
+# api/throttling.py
+"""
+Redis token buckets for the public (AllowAny) LLM endpoints.
+
+Each endpoint scope has its own buckets in settings.LLM_TOKEN_BUCKETS, one
+per IP and one per authenticated user:
+
+    "brand_personas": {
+        "ip":   {"capacity": 10, "per_minute": 3},
+        "user": {"capacity": 20, "per_minute": 6},
+    }
+
+A request takes one token from each bucket that applies, all or nothing: when
+one is empty none is charged and we answer 429 with Retry-After (time until
+the empty bucket has a token). The update is a single Lua script, so
+concurrent workers can't overdraw a bucket. If Redis is down each worker falls
+back to its own in-process buckets.
+
+The IP is REMOTE_ADDR, or with LLM_THROTTLE_TRUSTED_PROXIES = n the address
+the n-th proxy from us appended to X-Forwarded-For: entries further left are
+client-supplied and can't be trusted.
+
+Rejections are counted per day in Redis (throttle_stats()).
+"""
+import math
+import threading
+import time
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+
+from .redis_client import get_redis, mark_redis_down
+
+# KEYS: buckets   ARGV: now (s), cost, then capacity, refill per second per key
+# -> {allowed (0/1), seconds until enough tokens (x1000, as an integer),
+#     index of the empty bucket (1-based, 0 if allowed)}
+# Either every bucket is charged or none is.
+TOKEN_BUCKET_LUA = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+
+local levels = {}
+local wait = 0
+local empty = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + 2 * i])
+    local rate = tonumber(ARGV[2 + 2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < cost and (cost - tokens) / rate > wait then
+        wait = (cost - tokens) / rate
+        empty = i
+    end
+end
+if empty > 0 then
+    return {0, math.ceil(wait * 1000), empty}
+end
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + 2 * i])
+    local rate = tonumber(ARGV[2 + 2 * i])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - cost), 'ts', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+end
+return {1, 0, 0}
+"""
+
+_script = None
+_local_buckets = {}  # key -> [tokens, ts]
+_local_lock = threading.Lock()
+
+
+def _client_ip(request) -> str:
+    """
+    REMOTE_ADDR, or the X-Forwarded-For hop appended by the outermost of our
+    LLM_THROTTLE_TRUSTED_PROXIES proxies.
+    """
+    remote = request.META.get("REMOTE_ADDR") or "unknown"
+    trusted = getattr(settings, "LLM_THROTTLE_TRUSTED_PROXIES", 0)
+    if trusted <= 0:
+        return remote
+    hops = [hop.strip() for hop in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if hop.strip()]
+    if len(hops) < trusted:
+        return remote  # didn't come through all our proxies
+    return hops[-trusted]
+
+
+def _local_take(buckets: list, now: float):
+    with _local_lock:
+        levels = []
+        wait, empty = 0.0, None
+        for i, (key, capacity, rate) in enumerate(buckets):
+            tokens, ts = _local_buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+            levels.append(tokens)
+            if tokens < 1 and (1 - tokens) / rate > wait:
+                wait, empty = (1 - tokens) / rate, i
+        if empty is not None:
+            return wait, empty
+        for (key, _, _), tokens in zip(buckets, levels):
+            _local_buckets[key] = (tokens - 1, now)
+        return 0.0, None
+
+
+def take_tokens(buckets: list):
+    """
+    Take one token from every (key, capacity, refill per second) bucket, or
+    from none. Returns (0, None) if allowed, else (seconds until the empty
+    bucket has a token, its index in `buckets`).
+    """
+    global _script
+    now = time.time()
+    r = get_redis()
+    if r is not None:
+        try:
+            if _script is None:
+                _script = r.register_script(TOKEN_BUCKET_LUA)
+            args = [now, 1]
+            for _, capacity, rate in buckets:
+                args += [capacity, rate]
+            allowed, wait_ms, empty = _script(keys=[key for key, _, _ in buckets], args=args, client=r)
+            if int(allowed):
+                return 0.0, None
+            return int(wait_ms) / 1000.0, int(empty) - 1
+        except redis.RedisError as e:
+            mark_redis_down(e)
+    return _local_take(buckets, now)
+
+
+def _record_rejection(scope: str, kind: str):
+    print(f"[THROTTLE] {scope}: rejected ({kind} bucket empty)")
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        key = f"throttle:rejected:{timezone.now().date().isoformat()}"
+        pipe = r.pipeline()
+        pipe.hincrby(key, f"{scope}:{kind}", 1)
+        pipe.expire(key, 60 * 60 * 24 * 30)
+        pipe.execute()
+    except redis.RedisError as e:
+        mark_redis_down(e)
+
+
+def check_token_buckets(scope: str, request):
+    """
+    None if the request may go through, else the Retry-After in seconds.
+    """
+    config = getattr(settings, "LLM_TOKEN_BUCKETS", {}).get(scope)
+    if not config or not getattr(settings, "LLM_THROTTLE_ENABLED", True):
+        return None
+
+    idents = {"ip": _client_ip(request)}
+    user = getattr(request, "user", None)
+    if getattr(user, "is_authenticated", False):
+        idents["user"] = str(user.pk)
+
+    kinds, buckets = [], []
+    for kind, ident in idents.items():
+        bucket = config.get(kind)
+        if not bucket:
+            continue
+        kinds.append(kind)
+        buckets.append((f"throttle:{scope}:{kind}:{ident}", bucket["capacity"], bucket["per_minute"] / 60.0))
+    if not buckets:
+        return None
+
+    wait, empty = take_tokens(buckets)
+    if empty is None:
+        return None
+    _record_rejection(scope, kinds[empty])
+    return max(1, math.ceil(wait))
+
+
+def throttle_stats(days: int = 7) -> dict:
+    """
+    {date: {"scope:kind": rejected_count}} for the last `days` days.
+    """
+    r = get_redis()
+    if r is None:
+        return {}
+    today = timezone.now().date()
+    out = {}
+    try:
+        for i in range(days):
+            day = (today - timedelta(days=i)).isoformat()
+            counts = r.hgetall(f"throttle:rejected:{day}")
+            out[day] = {k.decode(): int(v) for k, v in counts.items()}
+    except redis.RedisError as e:
+        mark_redis_down(e)
+    return out
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle: set `throttle_scope` on the view (a key of LLM_TOKEN_BUCKETS).
+    """
+
+    def allow_request(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        self._wait = check_token_buckets(scope, request) if scope else None
+        return self._wait is None
+
+    def wait(self):
+        return self._wait
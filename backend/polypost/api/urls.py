@@ -6,7 +6,7 @@ from .views import RegisterView, GenerateIdeasView
 
 from rest_framework.routers import DefaultRouter
 from .views import (
-    MediaUploadViewSet, GenerateCaptionView, GenerateIdeasView,
+    MediaUploadViewSet, GenerateCaptionView, GenerateCaptionBatchView, GenerateIdeasView,
     PostingSuggestionView, MyPlannedSlotsView, PlanSlotView,
     SchedulerSuggestionsView, AnalyticsIngestView, StripeCheckoutSessionView,
     StripeWebhookView, MySubscriptionView, DraftListCreateView,
@@ -14,7 +14,8 @@ from .views import (
     ApplyUseCaseTemplateView, MeProfileView, UsageSummaryView, PostingReminderListCreateView,
     AIPostingPlanView, PostingReminderDetailView, NotificationListView,
     NotificationUnreadCountView, IdeaActionPlanView, BioVariantsView,
-    DetectLanguageView, PlanListView, CancelSubscriptionView
+    DetectLanguageView, PlanListView, CancelSubscriptionView, GenerationJobStatusView,
+    LLMLedgerReportView, LLMRouteStatsView, NextCaptionVariantView, ThrottleStatsView
     )
 from .views_auth import PasswordResetRequestView, PasswordResetConfirmView, LoginView, EmailConfirmView, ChangePasswordView, NewsletterSendView
 
@@ -26,6 +27,12 @@ from .views_feedback import (
 
 from .views_brand import BrandPersonaView, BrandSampleCaptionsView
 
+from .views_async import (
+    AsyncGenerateCaptionView, AsyncGenerateIdeasView, AsyncIdeaActionPlanView,
+    AsyncBioVariantsView, AsyncBrandPersonaView, AsyncBrandSampleCaptionsView,
+    AsyncGenerationJobStatusView,
+)
+
 router = DefaultRouter()
 router.register(r"uploads", MediaUploadViewSet, basename="uploads")
 
@@ -33,8 +40,14 @@ urlpatterns = [
     path("auth/register/", RegisterView.as_view(), name="api-register"),
     path("auth/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("captions/generate/", GenerateCaptionView.as_view(), name="caption-generate"),
+    path("captions/generate/batch/", GenerateCaptionBatchView.as_view(), name="caption-generate-batch"),
+    path("captions/<uuid:media_id>/next/", NextCaptionVariantView.as_view(), name="caption-next-variant"),
     path("ideas/generate/", GenerateIdeasView.as_view(), name="ideas-generate"),
     path("ideas/action-plan/", IdeaActionPlanView.as_view(), name="idea-action-plan"),
+    path("jobs/<uuid:job_id>/", GenerationJobStatusView.as_view(), name="generation-job-status"),
+    path("llm/routes/", LLMRouteStatsView.as_view(), name="llm-route-stats"),
+    path("llm/throttle/", ThrottleStatsView.as_view(), name="llm-throttle-stats"),
+    path("llm/ledger/", LLMLedgerReportView.as_view(), name="llm-ledger-report"),
     path("scheduler/suggestions/", PostingSuggestionView.as_view(), name="posting-suggestions"),
     path("scheduler/plan/", PlanSlotView.as_view(), name="scheduler-plan"),
     path("scheduler/my/", MyPlannedSlotsView.as_view(), name="scheduler-my"),
@@ -108,4 +121,17 @@ urlpatterns = [
 
     path("detect-language/", DetectLanguageView.as_view(), name="detect-language"),
 
+    # Async (ASGI) twins of the LLM-bound endpoints
+    path("async/captions/generate/", AsyncGenerateCaptionView.as_view(), name="async-caption-generate"),
+    path("async/ideas/generate/", AsyncGenerateIdeasView.as_view(), name="async-ideas-generate"),
+    path("async/ideas/action-plan/", AsyncIdeaActionPlanView.as_view(), name="async-idea-action-plan"),
+    path("async/brand/bio-variants/", AsyncBioVariantsView.as_view(), name="async-brand-bio-variants"),
+    path("async/brand/persona/", AsyncBrandPersonaView.as_view(), name="async-brand-persona"),
+    path(
+        "async/brand/persona/sample-captions/",
+        AsyncBrandSampleCaptionsView.as_view(),
+        name="async-brand-sample-captions",
+    ),
+    path("async/jobs/<uuid:job_id>/", AsyncGenerationJobStatusView.as_view(), name="async-generation-job-status"),
+
 ] + router.urls
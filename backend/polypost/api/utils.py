@@ -5,17 +5,20 @@ import requests
 import json
 
 from datetime import date, datetime
-from openai import OpenAI
 
 from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.core.mail import EmailMultiAlternatives
 from django.utils.timezone import now
 from django.utils import timezone
 
+from .deadlines import timeout_for
 from .email_templates import POSTLY_EMAIL_TEMPLATE, normalize_lang_code, EMAIL_FOOTER
-from .models import MonthlyUsage, Subscription, Plan, Draft, MediaUpload, PostingReminder
-
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+from .models import MonthlyUsage, Subscription, Plan, Draft, MediaUpload, PostingReminder, GlobalTrend
+from .llm import chat_completion, achat_completion
+from .llm_cache import TieredCache
+from .prompt_budget import PromptSection, assemble_prompt
 
 
 def render_postly_email_html(
@@ -106,7 +109,7 @@ def get_trending_topics():
     trend_api_url = os.getenv("TREND_API_URL")
     if trend_api_url:
         try:
-            resp = requests.get(trend_api_url, timeout=4)
+            resp = requests.get(trend_api_url, timeout=timeout_for(4))
             if resp.status_code == 200:
                 data = resp.json()
                 # expect something like: {"trends": ["Dune 3 trailer", "Taylor Swift ...", ...]}
@@ -129,7 +132,7 @@ def get_trending_movies_from_tmdb():
     if not tmdb_key:
         return []
     url = f"https://api.themoviedb.org/3/trending/movie/day?api_key={tmdb_key}"
-    resp = requests.get(url, timeout=4)
+    resp = requests.get(url, timeout=timeout_for(4))
     if resp.status_code == 200:
         data = resp.json()
         return [m["title"] for m in data.get("results", [])][:5]
@@ -331,7 +334,7 @@ def get_trending_stub_hooks():
     ]
 
 
-def build_caption_prompt(profile, media_obj, platform: str = None):
+def build_caption_prompt(profile, media_obj, platform: str = None, variants: int = 1, lang: str = None):
     vibe = getattr(profile, "vibe", "fun")
     tone = getattr(profile, "tone", "casual")
     examples_raw = getattr(profile, "example_caps", "") or ""
@@ -356,27 +359,467 @@ def build_caption_prompt(profile, media_obj, platform: str = None):
         f"Creator's tone: {tone}.",
         f"Target platform: {platform_hint}",
         f"The content is a {media_obj.media_type}.",
-        "Write exactly one caption.",
+        "Write exactly one caption." if variants == 1 else
+        f"Write exactly {variants} different captions, each with its own angle or hook.",
     ]
 
-    if examples:
-        few = examples[:3]
-        parts.append("Here are some example captions from this creator:")
-        for ex in few:
-            parts.append(f"- {ex}")
-        parts.append("Keep similar energy, length, and punctuation.")
-
     # Personalization flags
+    style = []
     if getattr(profile, "always_add_emojis", True):
-        parts.append("You may include emojis naturally when it fits the vibe.")
+        style.append("You may include emojis naturally when it fits the vibe.")
     else:
-        parts.append("Avoid using emojis unless absolutely necessary.")
+        style.append("Avoid using emojis unless absolutely necessary.")
 
     if getattr(profile, "always_add_cta", False):
-        parts.append("Include a subtle call-to-action encouraging engagement or visiting their link.")
+        style.append("Include a subtle call-to-action encouraging engagement or visiting their link.")
+
+    if variants == 1:
+        style.append("Do not wrap the caption in quotes.")
+    else:
+        style.append(f"Return ONLY a JSON array of {variants} strings, one caption per string. No markdown.")
+
+    # example_caps is free text -> clip each example and drop them first if too long
+    prompt, _ = assemble_prompt("caption", [
+        PromptSection("core", parts, required=True),
+        PromptSection(
+            "examples",
+            [f"- {ex}" for ex in examples[:3]],
+            header=["Here are some example captions from this creator:"],
+            footer=["Keep similar energy, length, and punctuation."],
+            max_item_chars=300,
+        ),
+        PromptSection("style", style, required=True),
+    ])
+
+    if lang:
+        if variants == 1:
+            rule = (f"The final caption MUST be written in the language with ISO code '{lang}'. "
+                    "Do NOT explain the language choice, just output the caption text.")
+        else:
+            rule = (f"Every caption MUST be written in the language with ISO code '{lang}'. "
+                    "Do NOT explain the language choice, just output the JSON array.")
+        prompt += f"\n\nIMPORTANT: {rule}"
+    return prompt
+
+
+def build_caption_request(profile, media_obj, platform: str, lang: str, variants: int = 1) -> dict:
+    """
+    Full chat-completion kwargs (model, messages, ...) for a caption, or for
+    `variants` captions in one completion (JSON array, see parse_caption_variants).
+    Shared by the sync and async caption views.
+    """
+    prompt = build_caption_prompt(profile, media_obj, platform=platform, variants=variants, lang=lang)
+
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {
+                "role": "system",
+                "content": (
+                    "You are a social-media caption generator. "
+                    "You MUST always follow the requested language instructions."
+                ),
+            },
+            {"role": "user", "content": prompt},
+        ],
+        "max_tokens": 80 * variants,
+    }
+
+
+def attach_caption_images(request_kwargs: dict, image_parts: list, media_type: str) -> dict:
+    """
+    Vision mode: the prompt goes out with the media's downscaled image(s)
+    (media_derivatives.vision_parts). No parts -> request unchanged.
+    """
+    if not image_parts:
+        return request_kwargs
+    if media_type == "video":
+        note = "The attached images are frames from the video."
+    else:
+        note = "The attached image is the photo itself."
+    note += " Base the caption on what is actually in it (subject, setting, mood), not on guesses."
+
+    messages = [dict(m) for m in request_kwargs["messages"]]
+    messages[-1]["content"] = [{"type": "text", "text": messages[-1]["content"] + "\n\n" + note}, *image_parts]
+    return {**request_kwargs, "messages": messages}
+
+
+def parse_language_codes(raw) -> list:
+    """
+    "fr,en-US" or ["fr", "en-US"] -> ["fr", "en"], deduplicated, order kept.
+    """
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    langs = []
+    for code in raw or []:
+        code = str(code).strip().split("-")[0].lower()
+        if code and code not in langs:
+            langs.append(code)
+    return langs
+
+
+def get_content_languages(profile) -> list:
+    return parse_language_codes(getattr(profile, "content_languages", None))
+
+
+def build_multilang_caption_request(profile, media_obj, platform: str, languages: list) -> dict:
+    """
+    One completion that writes the caption in every language of `languages`,
+    returned as a JSON object {iso_code: caption} (see parse_caption_translations).
+    """
+    base_prompt = build_caption_prompt(profile, media_obj, platform=platform)
+    codes = ", ".join(languages)
+    example = ", ".join(f'"{code}": "..."' for code in languages)
+
+    prompt = (
+        base_prompt
+        + "\n\n"
+        + f"IMPORTANT: Write this caption once for EACH of these language ISO codes: {codes}. "
+          "Each version must read naturally in its language (adapt wording, slang and hashtags, "
+          "don't translate word for word) while keeping the same idea.\n"
+        + f"Return ONLY a JSON object like {{{example}}}."
+    )
+
+    return {
+        "model": "gpt-4o-mini",
+        "response_format": {"type": "json_object"},
+        "messages": [
+            {
+                "role": "system",
+                "content": (
+                    "You are a social-media caption generator. "
+                    "You MUST always follow the requested language instructions."
+                ),
+            },
+            {"role": "user", "content": prompt},
+        ],
+        "max_tokens": 80 * len(languages),
+    }
+
+
+def parse_caption_translations(raw: str, languages: list) -> dict:
+    """
+    {lang: caption} for the requested languages that came back non-empty.
+    If the JSON is unusable, the raw text is kept as the first language.
+    """
+    try:
+        data = json.loads(raw)
+    except Exception:
+        data = None
+
+    if not isinstance(data, dict):
+        return {languages[0]: raw.strip()}
+
+    translations = {}
+    for code in languages:
+        text = str(data.get(code) or "").strip()
+        if text:
+            translations[code] = text
+    return translations or {languages[0]: raw.strip()}
+
+
+def parse_caption_variants(raw: str, variants: int) -> list:
+    """
+    Captions from a variants=N completion. Falls back to one caption per
+    non-empty line (or the whole text) if the model didn't return a JSON array.
+    """
+    text = raw.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+
+    try:
+        data = json.loads(text)
+    except Exception:
+        data = None
+
+    if isinstance(data, list):
+        captions = [str(c).strip() for c in data if str(c).strip()]
+    else:
+        lines = [l.strip().lstrip("-•0123456789.) ").strip().strip('"') for l in text.splitlines()]
+        captions = [l for l in lines if l] if variants > 1 else [text]
+
+    return captions[:variants] or [text]
+
+
+# Shared (non-profile) part of the ideas prompt: hooks + latest trend titles.
+# Built once per day and again after each trend refresh; other workers pick a
+# refreshed block up within IDEAS_CONTEXT_LOCAL_TTL.
+ideas_context_cache = TieredCache(
+    "ideas:ctx",
+    default_ttl=60 * 60 * 26,
+    local_max_entries=8,
+    local_ttl=getattr(settings, "IDEAS_CONTEXT_LOCAL_TTL", 300),
+)
+
+
+def build_ideas_context(today: date) -> dict:
+    latest_trends = GlobalTrend.objects.order_by("-fetched_at")[:10]
+    return {
+        "trends": [f"{t.platform}: {t.title}" for t in latest_trends if t.title],
+        "hooks": get_seasonal_hooks(today) + get_floating_event_hooks(today) + get_trending_stub_hooks(),
+    }
+
+
+def refresh_ideas_context(today: date | None = None) -> dict:
+    today = today or date.today()
+    context = build_ideas_context(today)
+    ideas_context_cache.set(today.isoformat(), context)
+    return context
+
+
+def get_ideas_context(today: date | None = None) -> dict:
+    """
+    {"trends": [...], "hooks": [...]} for that day, from cache when possible.
+    """
+    today = today or date.today()
+    context = ideas_context_cache.get(today.isoformat())
+    if context is None:
+        context = refresh_ideas_context(today)
+    return context
+
+
+def build_ideas_prompt(profile, platform: str, today: date | None = None) -> str:
+    """
+    Build the localized idea-generation prompt for a creator profile.
+    """
+    lang = getattr(profile, "preferred_language", "en")
+    location = ", ".join(filter(None, [profile.city, profile.country]))
+
+    vibe = getattr(profile, "vibe", "fun")
+    tone = getattr(profile, "tone", "casual")
+    niche = getattr(profile, "niche", "general creator")
+    audience = getattr(profile, "target_audience", "followers")
+
+    # ---------------------------------------------------------------------
+    # Trend data and hooks (shared by everyone, cached per day)
+    # ---------------------------------------------------------------------
+    if today is None:
+        today = date.today()
+    context = get_ideas_context(today)
+    trending_labels = context["trends"]
+
+    # ---------------------------------------------------------------------
+    # Build localized AI prompt
+    # ---------------------------------------------------------------------
+    today_str = today.isoformat()
+
+    lines = [
+        "You are a social media content strategist.",
+        f"Today's date is {today_str}. Always take the current season and major holidays around this date into account.",
+        f"Platform to create for: {platform}.",
+        "",
+    ]
+    # blank profile fields (and segment stand-ins without them) are left out, not sent as "None"
+    lines += [
+        f"{label}: {value}"
+        for label, value in (
+            ("Creator vibe", vibe),
+            ("Creator tone", tone),
+            ("Creator niche", niche),
+            ("Target audience", audience),
+        )
+        if value
+    ]
+    lines += [
+        "",
+        f"Language: {lang.upper()}",
+    ]
+    if location:
+        lines.append(f"Location context: {location}")
+
+    # --- Trends block ---
+    trends_header = ["", "We have some FRESH trends from our database. PRIORITIZE these:"]
+    if not trending_labels:
+        lines += trends_header + ["- (no DB trends available, use general social media inspiration)"]
+
+    # --- Seasonal / recurring hooks ---
+    # ordered by importance: dated hooks first, generic stub hooks are trimmed first
+    hooks_header = [
+        "",
+        "Seasonal / recurring hooks (especially important if relevant to today's date, "
+        "e.g. Christmas, New Year, Valentine's, Halloween, etc.):",
+    ]
+
+    # --- Instructions ---
+    instructions = [""]
+    instructions.append(
+        "INSTRUCTIONS:\n"
+        "- Generate EXACTLY 5 ideas.\n"
+        "- At least 2 ideas MUST be primarily inspired by the latest DB trends listed above.\n"
+        "- Also include AT LEAST 1 idea that is clearly based on a seasonal or recurring hook "
+        "relevant to today's date (e.g. Christmas, New Year, Valentine's, Halloween, etc.) "
+        "when such hooks are listed.\n"
+        "- Seasonal ideas should NOT be generic clichés: make them specific to the creator's niche and audience.\n"
+        "- Keep ideas aligned with the creator's tone and niche.\n"
+        "- If location is provided, use culturally relevant examples or slang.\n"
+        "- Return ONLY JSON (array of 5 objects). No markdown, no commentary.\n"
+        "- Each object must have: title, description, suggested_caption_starter, hook_used, personal_twist."
+    )
+
+    prompt, _ = assemble_prompt("ideas", [
+        PromptSection("core", lines, required=True),
+        PromptSection(
+            "trends",
+            [f"- {h}" for h in trending_labels],
+            header=trends_header,
+            priority=2,
+            min_items=3,
+            max_item_chars=120,
+        ),
+        PromptSection(
+            "hooks",
+            [f"- {h}" for h in context["hooks"]],
+            header=hooks_header,
+            priority=1,
+            max_item_chars=160,
+        ),
+        PromptSection("instructions", instructions, required=True),
+    ])
+    return prompt
+
+
+def build_ideas_request(profile, platform: str, today: date | None = None) -> dict:
+    """
+    Full chat-completion kwargs for a batch of 5 ideas.
+    """
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": "You generate creative social media ideas."},
+            {"role": "user", "content": build_ideas_prompt(profile, platform, today)},
+        ],
+        "max_tokens": 650,
+    }
+
+
+def parse_ideas(raw: str):
+    """
+    Parse the ideas JSON; if the model returned plain text, give back the raw text.
+    """
+    try:
+        return json.loads(raw)
+    except Exception:
+        return raw
+
+
+class JSONObjectStreamParser:
+    """
+    Incrementally pulls top-level JSON objects out of a streamed array,
+    e.g. '[{"title": ...}, {"title": ...}]' arriving token by token.
+
+    feed() returns the objects whose closing brace just arrived, so each idea
+    can be sent to the client as soon as it is complete. Anything outside the
+    objects (brackets, commas, markdown fences) is ignored.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.buffer = []
+
+    def feed(self, text: str) -> list:
+        objects = []
+        for ch in text:
+            if self.depth == 0:
+                if ch == "{":
+                    self.depth = 1
+                    self.buffer = [ch]
+                continue
+
+            self.buffer.append(ch)
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+
+            if ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        obj = json.loads("".join(self.buffer))
+                    except ValueError:
+                        obj = None
+                    if isinstance(obj, dict):
+                        objects.append(obj)
+                    self.buffer = []
+        return objects
+
+
+def build_bio_variants_request(base_bio: str, platform: str, lang: str, context: dict) -> dict:
+    """
+    Full chat-completion kwargs for the bio variants generator.
+    context may contain: niche, target_audience, vibe, tone, creator_stage.
+    """
+    labels = [
+        ("niche", "niche"),
+        ("target_audience", "target audience"),
+        ("vibe", "vibe"),
+        ("tone", "tone"),
+        ("creator_stage", "creator stage"),
+    ]
+    context_bits = [
+        f"{label}: {context[key]}" for key, label in labels if context.get(key)
+    ]
+    context_str = "; ".join(context_bits) if context_bits else "no extra info"
+
+    return {
+        "model": "gpt-4.1-mini",
+        "response_format": {"type": "json_object"},
+        "messages": [
+            {
+                "role": "system",
+                "content": (
+                    "You are a social media branding assistant. "
+                    "Given an existing bio and some creator context, "
+                    "you generate multiple variants of that bio.\n\n"
+                    "Return a *single* JSON object with these keys:\n"
+                    "- short_bio: a concise 1–2 line version.\n"
+                    "- long_bio: a 3–4 line version with more detail.\n"
+                    "- cta_bio: a version optimized around a strong call to action.\n"
+                    "- fun_bio: a playful, witty version.\n"
+                    "Do not wrap it in any additional text, only valid JSON.\n\n"
+                    f"IMPORTANT: All text in all fields MUST be written in the language "
+                    f"with ISO code '{lang}'. Do NOT use English if '{lang}' is not 'en'."
+                ),
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"Platform: {platform}\n"
+                    f"Language (ISO code): {lang}\n"
+                    f"Context: {context_str}\n\n"
+                    f"Base bio:\n{base_bio}"
+                ),
+            },
+        ],
+    }
+
 
-    parts.append("Do not wrap the caption in quotes.")
-    return "\n".join(parts)
+def parse_bio_variants(raw_content: str) -> dict | None:
+    """
+    Returns the 4 bio variants, or None if the model did not return valid JSON.
+    """
+    try:
+        parsed = json.loads(raw_content)
+    except json.JSONDecodeError:
+        return None
+
+    return {
+        "short_bio": parsed.get("short_bio", "").strip(),
+        "long_bio": parsed.get("long_bio", "").strip(),
+        "cta_bio": parsed.get("cta_bio", "").strip(),
+        "fun_bio": parsed.get("fun_bio", "").strip(),
+    }
 
 def get_or_create_free_plan():
     # make sure we always have a fallback plan
@@ -508,6 +951,36 @@ def check_usage_allowed(user, kind: str, amount: int = 1) -> bool:
     return True
 
 
+def _send_limit_nudge(user, kind: str):
+    from .tasks import send_postly_email_task  # tasks imports utils
+
+    frontend = getattr(settings, "FRONTEND_URL", "http://localhost:5173")
+    pricing_url = f"{frontend}/pricing"
+
+    if kind == "idea":
+        send_postly_email_task.delay(
+            user.email,
+            "You've reached your monthly idea limit",
+            (
+                "You've used all idea generations included in your Polypost plan.<br><br>"
+                "Upgrade to unlock more ideas instantly."
+            ),
+            "View plans",
+            pricing_url,
+        )
+    elif kind == "caption":
+        send_postly_email_task.delay(
+            user.email,
+            "You've reached your monthly caption limit",
+            (
+                "You've used all caption generations included in your Polypost plan.<br><br>"
+                "Upgrade now to continue generating captions."
+            ),
+            "View plans",
+            pricing_url,
+        )
+
+
 def increment_usage(user, kind: str, amount: int = 1):
     """
     Increment usage counters and send upgrade nudges when limits are hit.
@@ -520,9 +993,6 @@ def increment_usage(user, kind: str, amount: int = 1):
     plan = get_user_plan(user)
     usage = get_current_usage(user)
 
-    frontend = getattr(settings, "FRONTEND_URL", "http://localhost:5173")
-    pricing_url = f"{frontend}/pricing"
-
     # ---- APPLY USAGE INCREASE ----
     if kind == "idea":
         before = usage.ideas_used
@@ -535,16 +1005,7 @@ def increment_usage(user, kind: str, amount: int = 1):
         if limit > 0 and usage.ideas_used >= limit:
             # avoid sending multiple nudges in the same month
             if before < limit:
-                send_postly_email.delay(
-                    user.email,
-                    "You've reached your monthly idea limit",
-                    (
-                        "You've used all idea generations included in your Polypost plan.<br><br>"
-                        "Upgrade to unlock more ideas instantly."
-                    ),
-                    "View plans",
-                    pricing_url,
-                )
+                _send_limit_nudge(user, "idea")
 
     elif kind == "caption":
         before = usage.captions_used
@@ -556,31 +1017,46 @@ def increment_usage(user, kind: str, amount: int = 1):
         if limit > 0 and usage.captions_used >= limit:
             # only fire the email on the EXACT step crossing the limit
             if before < limit:
-                send_postly_email.delay(
-                    user.email,
-                    "You've reached your monthly caption limit",
-                    (
-                        "You've used all caption generations included in your Polypost plan.<br><br>"
-                        "Upgrade now to continue generating captions."
-                    ),
-                    "View plans",
-                    pricing_url,
-                )
+                _send_limit_nudge(user, "caption")
 
-def build_brand_personas(
-    niche: str,
-    target_audience: str,
-    goals: str,
-    comfort_level: str,
-    user=None,
-    lang: str = "en",
-):
+
+USAGE_FIELDS = {"idea": ("ideas_used", "ideas_per_month"), "caption": ("captions_used", "captions_per_month")}
+
+
+def reserve_usage(user, kind: str, amount: int) -> bool:
     """
-    Returns a dict: { "personas": [ { ... }, { ... }, { ... } ] }
-    Each persona has: persona_name, brand_summary, recommended_vibe, recommended_tone,
-                      niche, target_audience, content_pillars, brand_bio
+    Atomically take `amount` idea / caption units from this month's quota
+    (one conditional UPDATE, so concurrent requests can't overspend the plan).
+    Returns False, reserving nothing, when the plan can't cover all of them.
+    Always follow a successful reservation with settle_usage().
+    """
+    field, limit_field = USAGE_FIELDS[kind]
+    limit = getattr(get_user_plan(user), limit_field) or 0
+    usage = get_current_usage(user)
+
+    return bool(
+        MonthlyUsage.objects.filter(pk=usage.pk, **{f"{field}__lte": limit - amount})
+        .update(**{field: F(field) + amount})
+    )
+
+
+def settle_usage(user, kind: str, reserved: int, used: int):
+    """
+    Give back the reserved units that were not consumed (failed generations)
+    and send the upgrade nudge if the consumed ones reached the limit.
     """
+    field, limit_field = USAGE_FIELDS[kind]
+    usage = get_current_usage(user)
+    if reserved > used:
+        MonthlyUsage.objects.filter(pk=usage.pk).update(**{field: Greatest(F(field) - (reserved - used), 0)})
+
+    limit = getattr(get_user_plan(user), limit_field) or 0
+    after = getattr(MonthlyUsage.objects.only(field).get(pk=usage.pk), field)
+    if used and limit > 0 and after >= limit and after - used < limit:
+        _send_limit_nudge(user, kind)
+
 
+def _normalize_persona_inputs(niche, target_audience, goals, comfort_level, lang):
     # ---- Normalise language a bit ----
     lang = (lang or "en").split("-")[0].lower()
     if lang not in {"en", "fr", "es", "pt"}:
@@ -594,7 +1070,21 @@ def build_brand_personas(
     goals = goals or "grow audience and increase engagement"
     comfort_level = comfort_level or "comfortable being a bit bold but still authentic"
 
-    prompt_lines = [
+    return niche, target_audience, goals, comfort_level, lang
+
+
+def build_brand_personas_request(
+    niche: str,
+    target_audience: str,
+    goals: str,
+    comfort_level: str,
+    lang: str = "en",
+) -> dict:
+    """
+    Full chat-completion kwargs for the 3 brand personas.
+    Inputs are expected to be normalised already (see _normalize_persona_inputs).
+    """
+    intro = [
         "You are a brand strategist for social media creators.",
         "Based on the details below, generate EXACTLY 3 different brand persona options.",
         "",
@@ -609,10 +1099,15 @@ def build_brand_personas(
             "and match one of the following values exactly."
         ),
         "",
+    ]
+    # onboarding answers are free text: each one is clipped, goals go first if still too long
+    answers = [
         f"Niche: {niche}",
         f"Target audience: {target_audience}",
-        f"Goals: {goals}",
         f"Comfort level on camera / social: {comfort_level}",
+        f"Goals: {goals}",
+    ]
+    prompt_lines = [
         "",
         "Allowed values for recommended_vibe:",
         "- Fun, Chill, Bold, Educational, Luxury, Cozy, High-energy, Mysterious, Wholesome",
@@ -648,12 +1143,16 @@ def build_brand_personas(
         "}",
     ]
 
-    prompt = "\n".join(prompt_lines)
+    prompt, _ = assemble_prompt("brand_personas", [
+        PromptSection("intro", intro, required=True),
+        PromptSection("answers", answers, min_items=3, max_item_chars=400),
+        PromptSection("format", prompt_lines, required=True),
+    ])
 
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        response_format={"type": "json_object"},
-        messages=[
+    return {
+        "model": "gpt-4o-mini",
+        "response_format": {"type": "json_object"},
+        "messages": [
             {
                 "role": "system",
                 "content": (
@@ -664,12 +1163,15 @@ def build_brand_personas(
             },
             {"role": "user", "content": prompt},
         ],
-        max_tokens=900,
-        temperature=0.7,
-    )
+        "max_tokens": 900,
+        "temperature": 0.7,
+    }
 
-    raw = resp.choices[0].message.content.strip()
 
+def parse_brand_personas(raw: str, niche: str, target_audience: str) -> dict:
+    """
+    Parse the personas JSON, always returning { "personas": [...] }.
+    """
     try:
         data = json.loads(raw)
     except Exception:
@@ -695,25 +1197,57 @@ def build_brand_personas(
 
     return data
 
-def generate_idea_action_plan(
+
+def build_brand_personas(
+    niche: str,
+    target_audience: str,
+    goals: str,
+    comfort_level: str,
+    user=None,
+    lang: str = "en",
+):
+    """
+    Returns a dict: { "personas": [ { ... }, { ... }, { ... } ] }
+    Each persona has: persona_name, brand_summary, recommended_vibe, recommended_tone,
+                      niche, target_audience, content_pillars, brand_bio
+    """
+    niche, target_audience, goals, comfort_level, lang = _normalize_persona_inputs(
+        niche, target_audience, goals, comfort_level, lang
+    )
+    request_kwargs = build_brand_personas_request(niche, target_audience, goals, comfort_level, lang)
+
+    raw = chat_completion("brand_personas", user=user, **request_kwargs).strip()
+    return parse_brand_personas(raw, niche, target_audience)
+
+
+async def abuild_brand_personas(
+    niche: str,
+    target_audience: str,
+    goals: str,
+    comfort_level: str,
+    user=None,
+    lang: str = "en",
+):
+    """
+    Async twin of build_brand_personas (AsyncOpenAI, for the ASGI views).
+    """
+    niche, target_audience, goals, comfort_level, lang = _normalize_persona_inputs(
+        niche, target_audience, goals, comfort_level, lang
+    )
+    request_kwargs = build_brand_personas_request(niche, target_audience, goals, comfort_level, lang)
+
+    raw = (await achat_completion("brand_personas", user=user, **request_kwargs)).strip()
+    return parse_brand_personas(raw, niche, target_audience)
+
+def build_idea_action_plan_request(
     profile,
     idea: dict,
     platform: str = "instagram",
     lang: str = "en",
 ) -> dict:
     """
-    Given an idea dict like:
-      {
-        "title": "...",
-        "description": "...",
-        "suggested_caption_starter": "...",
-        "personal_twist": "..."
-      }
-
-    Return a JSON-ready dict describing an execution plan.
-    All free-text content is generated in the requested language.
+    Full chat-completion kwargs for an idea execution plan.
     """
-
     # ---- Minimal language normalisation ----
     lang = (lang or "en").split("-")[0].lower()
     if lang not in {"en", "fr", "es", "pt"}:
@@ -756,17 +1290,18 @@ def generate_idea_action_plan(
         ),
     }
 
-    resp = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        response_format={"type": "json_object"},
-        messages=[
+    return {
+        "model": "gpt-4.1-mini",
+        "response_format": {"type": "json_object"},
+        "messages": [
             {"role": "system", "content": system_msg},
             user_msg,
         ],
-        temperature=0.7,
-    )
+        "temperature": 0.7,
+    }
+
 
-    content = resp.choices[0].message.content
+def parse_idea_action_plan(content: str, idea: dict) -> dict:
     try:
         data = json.loads(content)
     except Exception:
@@ -784,3 +1319,42 @@ def generate_idea_action_plan(
         }
 
     return data
+
+
+def generate_idea_action_plan(
+    profile,
+    idea: dict,
+    platform: str = "instagram",
+    lang: str = "en",
+    user=None,
+) -> dict:
+    """
+    Given an idea dict like:
+      {
+        "title": "...",
+        "description": "...",
+        "suggested_caption_starter": "...",
+        "personal_twist": "..."
+      }
+
+    Return a JSON-ready dict describing an execution plan.
+    All free-text content is generated in the requested language.
+    """
+    request_kwargs = build_idea_action_plan_request(profile, idea, platform, lang)
+    content = chat_completion("idea_action_plan", user=user, **request_kwargs)
+    return parse_idea_action_plan(content, idea)
+
+
+async def agenerate_idea_action_plan(
+    profile,
+    idea: dict,
+    platform: str = "instagram",
+    lang: str = "en",
+    user=None,
+) -> dict:
+    """
+    Async twin of generate_idea_action_plan (AsyncOpenAI, for the ASGI views).
+    """
+    request_kwargs = build_idea_action_plan_request(profile, idea, platform, lang)
+    content = await achat_completion("idea_action_plan", user=user, **request_kwargs)
+    return parse_idea_action_plan(content, idea)
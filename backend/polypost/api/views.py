@@ -1,5 +1,6 @@
 import os
 import json
+import math
 import zoneinfo
 import stripe
 
@@ -11,39 +12,47 @@ from rest_framework.exceptions import ValidationError
 
 from django.conf import settings
 from django.utils import timezone as dj_timezone
-from django.db import models
+from django.db import connections, models
 import zoneinfo
+from concurrent.futures import ThreadPoolExecutor
 
 
 from .models import (
     MediaUpload, GeneratedCaption, CreatorProfile, 
-    GlobalTrend, PlannedPostSlot, UseCaseTemplate,
+    PlannedPostSlot, UseCaseTemplate,
     PlatformTiming, PostPerformance, Plan, 
     Subscription, Draft, MediaUpload, GeneratedCaption,
-    MonthlyUsage, PostingReminder, Notification
+    MonthlyUsage, PostingReminder, Notification, GenerationJob
     )
 
 from .serializers import (
-    MediaUploadSerializer, RegisterSerializer, CaptionGenerateSerializer,
+    MediaUploadSerializer, RegisterSerializer, CaptionGenerateSerializer, CaptionBatchGenerateSerializer,
     GeneratedCaptionSerializer, PlannedPostSlotSerializer, CreatorProfileSerializer,
     PostPerformanceSerializer, DraftSerializer, UseCaseTemplateSerializer,
-    PostingReminderSerializer, NotificationSerializer, PlanSerializer
+    PostingReminderSerializer, NotificationSerializer, PlanSerializer,
+    GenerationJobSerializer
     )
 
 from .utils import (
-    build_caption_prompt, get_seasonal_hooks, get_floating_event_hooks,
-    get_trending_stub_hooks, get_or_create_free_plan, get_user_plan, generate_idea_action_plan
+    build_caption_request, attach_caption_images, build_ideas_request, parse_ideas, parse_caption_variants,
+    build_multilang_caption_request, parse_caption_translations, get_content_languages,
+    parse_language_codes,
+    build_bio_variants_request, parse_bio_variants, JSONObjectStreamParser,
+    get_or_create_free_plan, get_user_plan
     )
 
-from .utils import check_usage_allowed, increment_usage, send_postly_email
+from .utils import check_usage_allowed, increment_usage, reserve_usage, settle_usage, send_postly_email
 
+from .deadlines import current_deadline, deadline_at
+from .media_derivatives import vision_parts
 from .geo_utils import get_country_code_from_ip, language_from_country_code
+from .llm import chat_completion, stream_chat_completion
 
 from django.contrib.auth.models import User
 from django.utils.dateparse import parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
@@ -51,17 +60,23 @@ from django.conf import settings
 
 
 
-from openai import OpenAI
-from datetime import date, datetime, timedelta, timezone as dt_timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal, ROUND_HALF_UP
 
 from .scheduling_utils import generate_posting_suggestions, generate_ai_posting_plan
 from .email_templates import get_email_text, normalize_lang_code
 
-from .tasks import send_postly_email_task
+from .tasks import send_postly_email_task, run_generation_job
+from .idea_pools import take_pooled_ideas
+from .idea_pregen import take_pregenerated_ideas
+from .idempotency import IdempotentPostMixin
+from .action_plans import get_idea_action_plan, get_user_draft, idea_from_draft
+from .llm_router import route_stats
+from .llm_ledger import ledger_report
+from .throttling import throttle_stats
+from .degrade import DEGRADED_HEADER, degrade_reason, degraded_ideas, mark_degraded
 
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))  # or use decouple
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY", "")
 
 CURRENCY_MAP = {
@@ -151,6 +166,93 @@ def get_request_lang(request, explicit_lang: str | None = None) -> str:
     return resolved
 
 
+def wants_stream(request) -> bool:
+    """
+    ?stream=1 (or "stream": true in the body) switches a generation view to SSE.
+    """
+    flag = request.query_params.get("stream") or request.data.get("stream")
+    return str(flag).lower() in ("1", "true", "yes")
+
+
+def save_generated_caption(media, captions: list, translations: dict | None = None):
+    """
+    Store the first caption as the current text and keep all of them as variants.
+    """
+    caption_obj, _ = GeneratedCaption.objects.update_or_create(
+        media=media,
+        defaults={
+            "text": captions[0],
+            "is_user_edited": False,
+            "variants": captions if len(captions) > 1 else [],
+            "variant_index": 0,
+            "translations": translations or {},
+        },
+    )
+    return caption_obj
+
+
+def resolve_caption_languages(validated_data, profile) -> list | None:
+    """
+    Languages for a multi-language caption, or None for the normal single-language path.
+    """
+    if validated_data.get("languages"):
+        langs = parse_language_codes(validated_data["languages"])
+    elif validated_data.get("multilang"):
+        langs = get_content_languages(profile)
+    else:
+        return None
+
+    langs = langs[: getattr(settings, "CAPTION_MAX_LANGUAGES", 4)]
+    return langs if len(langs) > 1 else None
+
+
+def multilang_caption_units(n_languages: int) -> int:
+    """
+    Quota units for one multi-language caption: 1 for the first language plus
+    CAPTION_MULTILANG_WEIGHT per extra language (rounded up). Weight 0 = billed as one caption.
+    """
+    weight = getattr(settings, "CAPTION_MULTILANG_WEIGHT", 0)
+    return 1 + math.ceil(weight * max(0, n_languages - 1))
+
+
+def wants_background(request) -> bool:
+    """
+    ?background=1 (or "background": true in the body) runs the generation
+    as a GenerationJob in Celery instead of inside the request.
+    """
+    flag = request.query_params.get("background") or request.data.get("background")
+    return str(flag).lower() in ("1", "true", "yes")
+
+
+def start_generation_job(request, kind: str, params: dict) -> Response:
+    """
+    Create a GenerationJob, enqueue it and answer 202 with where to poll.
+    """
+    user = request.user if request.user.is_authenticated else None
+    job = GenerationJob.objects.create(user=user, kind=kind, params=params)
+    run_generation_job.delay(str(job.id))
+
+    return Response(
+        {
+            "job_id": str(job.id),
+            "status": job.status,
+            "status_url": f"/api/jobs/{job.id}/",
+        },
+        status=status.HTTP_202_ACCEPTED,
+    )
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def sse_response(events) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
+
+
 def detect_currency_from_request(request) -> str:
     """
     Detects an appropriate currency from the user's IP.
@@ -363,15 +465,22 @@ class MediaUploadViewSet(viewsets.ModelViewSet):
         # Save if everything is OK
         serializer.save(user=user)
 
-class GenerateCaptionView(views.APIView):
+class GenerateCaptionView(IdempotentPostMixin, views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
         serializer = CaptionGenerateSerializer(data=request.data, context={"request": request})
         serializer.is_valid(raise_exception=True)
         media = serializer.validated_data["media"]
+        variants = serializer.validated_data["variants"]
 
-        CAPTIONS_PER_CALL = 1
+        profile = CreatorProfile.objects.filter(user=request.user).first()
+        languages = resolve_caption_languages(serializer.validated_data, profile)
+
+        # one call = one caption of quota, whatever the number of variants:
+        # "next suggestion" is then served from the stored variants for free.
+        # Multi-language captions are weighted, see multilang_caption_units().
+        CAPTIONS_PER_CALL = multilang_caption_units(len(languages)) if languages else 1
         if not check_usage_allowed(request.user, "caption", amount=CAPTIONS_PER_CALL):
             return Response(
                 {"detail": "Caption limit reached for your plan. Upgrade to Pro."},
@@ -379,45 +488,173 @@ class GenerateCaptionView(views.APIView):
             )
 
         platform = request.data.get("platform", "instagram")
+        image_parts = vision_parts(media) if serializer.validated_data["vision"] else []
+
+        if languages:
+            # every language in one completion; takes precedence over variants
+            request_kwargs = build_multilang_caption_request(profile, media, platform, languages)
+            request_kwargs = attach_caption_images(request_kwargs, image_parts, media.media_type)
+            raw = chat_completion("caption", user=request.user, **request_kwargs).strip()
+            translations = parse_caption_translations(raw, languages)
+
+            caption_obj = save_generated_caption(
+                media, [next(iter(translations.values()))], translations=translations
+            )
+            increment_usage(request.user, "caption", amount=CAPTIONS_PER_CALL)
+            return Response(GeneratedCaptionSerializer(caption_obj).data, status=status.HTTP_201_CREATED)
 
         # 🔥 NEW: resolve language from explicit param or profile
         raw_lang = request.data.get("preferred_language")
         lang = get_request_lang(request, raw_lang)
 
-        profile = CreatorProfile.objects.filter(user=request.user).first()
-        base_prompt = build_caption_prompt(profile, media, platform=platform)
+        request_kwargs = build_caption_request(profile, media, platform, lang, variants=variants)
+        request_kwargs = attach_caption_images(request_kwargs, image_parts, media.media_type)
 
-        prompt = (
-            base_prompt
-            + "\n\n"
-            + f"IMPORTANT: The final caption MUST be written in the language with ISO code '{lang}'. "
-              "Do NOT explain the language choice, just output the caption text."
-        )
+        if wants_stream(request) and variants == 1:
+            return sse_response(
+                self.stream_caption(request.user, media, request_kwargs, CAPTIONS_PER_CALL)
+            )
 
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a social-media caption generator. "
-                        "You MUST always follow the requested language instructions."
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=80,
-        )
-        caption_text = completion.choices[0].message.content.strip()
+        raw = chat_completion("caption", user=request.user, **request_kwargs).strip()
+        captions = parse_caption_variants(raw, variants) if variants > 1 else [raw]
 
-        caption_obj, _ = GeneratedCaption.objects.update_or_create(
-            media=media,
-            defaults={"text": caption_text, "is_user_edited": False},
-        )
+        caption_obj = save_generated_caption(media, captions)
         increment_usage(request.user, "caption", amount=CAPTIONS_PER_CALL)
         return Response(GeneratedCaptionSerializer(caption_obj).data, status=status.HTTP_201_CREATED)
 
-class GenerateIdeasView(views.APIView):
+    def stream_caption(self, user, media, request_kwargs, amount):
+        """
+        SSE: `token` events while the caption is written, then `done` with the
+        saved caption. Nothing is saved or charged if the stream is cut short.
+        """
+        parts = []
+        try:
+            for delta in stream_chat_completion("caption", user=user, **request_kwargs):
+                parts.append(delta)
+                yield sse_event("token", {"text": delta})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"OpenAI error: {e}"})
+            return
+
+        caption_obj = save_generated_caption(media, ["".join(parts).strip()])
+        increment_usage(user, "caption", amount=amount)
+        yield sse_event("done", GeneratedCaptionSerializer(caption_obj).data)
+
+
+class NextCaptionVariantView(views.APIView):
+    """
+    POST /api/captions/<media_id>/next/
+    Switches the media's caption to the next variant stored by
+    captions/generate/ with variants=N. No model call, no quota.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, media_id, *args, **kwargs):
+        caption_obj = GeneratedCaption.objects.filter(
+            media_id=media_id, media__user=request.user
+        ).first()
+        if caption_obj is None:
+            return Response({"detail": "Caption not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        if not caption_obj.next_variant():
+            return Response(
+                {"detail": "No more caption variants, generate new ones."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        caption_obj.save(update_fields=["text", "is_user_edited", "variant_index"])
+        return Response(GeneratedCaptionSerializer(caption_obj).data, status=status.HTTP_200_OK)
+
+
+class GenerateCaptionBatchView(IdempotentPostMixin, views.APIView):
+    """
+    POST /api/captions/generate/batch/
+    Body: { "media_ids": ["<uuid>", ...], "platform": "...", "preferred_language": "..." }
+
+    Generates one caption per media in a single HTTP request:
+      - quota for the whole batch (N captions) is reserved up front, in one
+        conditional UPDATE, so concurrent batches can't overspend the plan
+      - OpenAI calls run with bounded concurrency (CAPTION_BATCH_CONCURRENCY)
+      - all GeneratedCaption rows are written in one bulk upsert, and the
+        captions that didn't come back are refunded.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = CaptionBatchGenerateSerializer(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+        media_list = serializer.validated_data["media"]
+
+        if not reserve_usage(request.user, "caption", len(media_list)):
+            return Response(
+                {"detail": "This batch would exceed the caption limit for your plan. Upgrade to Pro."},
+                status=403,
+            )
+        used = 0
+        try:
+            response, used = self.generate_batch(request, media_list)
+        finally:
+            settle_usage(request.user, "caption", reserved=len(media_list), used=used)
+        return response
+
+    def generate_batch(self, request, media_list):
+        """
+        (response, number of captions saved)
+        """
+        platform = request.data.get("platform", "instagram")
+        lang = get_request_lang(request, request.data.get("preferred_language"))
+        profile = CreatorProfile.objects.filter(user=request.user).first()
+
+        # the prompt only depends on the media type -> build each one once
+        requests_by_type = {}
+        for media in media_list:
+            if media.media_type not in requests_by_type:
+                requests_by_type[media.media_type] = build_caption_request(profile, media, platform, lang)
+
+        deadline = current_deadline()  # worker threads don't inherit the request's context
+
+        def generate(media):
+            try:
+                with deadline_at(deadline):
+                    text = chat_completion("caption", user=request.user, **requests_by_type[media.media_type]).strip()
+                return media, text, None
+            except Exception as e:
+                return media, None, str(e)
+            finally:
+                # the plan lookup / ledger may have opened a DB connection in this pool thread
+                connections.close_all()
+
+        workers = min(getattr(settings, "CAPTION_BATCH_CONCURRENCY", 4), len(media_list))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(generate, media_list))
+
+        succeeded = [(media, text) for media, text, error in results if error is None]
+        errors = [
+            {"media_id": str(media.id), "detail": f"OpenAI error: {error}"}
+            for media, _, error in results
+            if error is not None
+        ]
+
+        if not succeeded:
+            return Response({"captions": [], "errors": errors}, status=status.HTTP_502_BAD_GATEWAY), 0
+
+        GeneratedCaption.objects.bulk_create(
+            [GeneratedCaption(media=media, text=text, is_user_edited=False) for media, text in succeeded],
+            update_conflicts=True,
+            unique_fields=["media"],
+            update_fields=["text", "is_user_edited", "variants", "variant_index", "translations"],
+        )
+
+        captions = GeneratedCaption.objects.filter(media__in=[media for media, _ in succeeded])
+        captions_by_media = {c.media_id: c for c in captions}
+        data = [
+            {"media_id": str(media.id), **GeneratedCaptionSerializer(captions_by_media[media.id]).data}
+            for media, _ in succeeded
+        ]
+        return Response({"captions": data, "errors": errors}, status=status.HTTP_201_CREATED), len(succeeded)
+
+
+class GenerateIdeasView(IdempotentPostMixin, views.APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
@@ -436,117 +673,103 @@ class GenerateIdeasView(views.APIView):
             )
 
         # ---------------------------------------------------------------------
-        # 2. Core profile context
+        # 2. Build prompt from profile context + trends / hooks
         # ---------------------------------------------------------------------
         platform = request.data.get("platform") or getattr(
             profile, "default_platform", "instagram"
         )
-        lang = getattr(profile, "preferred_language", "en")
-        location = ", ".join(filter(None, [profile.city, profile.country]))
 
-        vibe = getattr(profile, "vibe", "fun")
-        tone = getattr(profile, "tone", "casual")
-        niche = getattr(profile, "niche", "general creator")
-        audience = getattr(profile, "target_audience", "followers")
+        # opted-in users get their overnight batch first, then common segments
+        # are served from the nightly pool (see idea_pregen.py / idea_pools.py).
+        # Either way quota is charged now, when the ideas are revealed.
+        pooled = take_pregenerated_ideas(user, profile, platform) or take_pooled_ideas(user, profile, platform)
+        if pooled is not None:
+            if wants_stream(request):
+                return sse_response(self.stream_pooled_ideas(user, pooled, IDEAS_PER_CALL))
+            increment_usage(user, "idea", amount=IDEAS_PER_CALL)
+            return Response({"ideas": pooled}, status=status.HTTP_200_OK)
 
-        # ---------------------------------------------------------------------
-        # 3. Collect trend data and hooks
-        # ---------------------------------------------------------------------
-        today = date.today()
-        seasonal = get_seasonal_hooks(today)
-        floating = get_floating_event_hooks(today)
-        stub_trends = get_trending_stub_hooks()
-
-        latest_trends = list(GlobalTrend.objects.order_by("-fetched_at")[:10])
-        trending_labels = [
-            f"{t.platform}: {t.title}" for t in latest_trends if t.title
-        ]
+        # LLM tier saturated / failing -> template ideas (degrade.py), not charged
+        reason = degrade_reason("ideas")
+        if reason:
+            return self.degraded_response(request, profile, platform, reason)
 
-                # ---------------------------------------------------------------------
-        # 4. Build localized AI prompt
-        # ---------------------------------------------------------------------
-        today_str = today.isoformat()
-
-        lines = [
-            "You are a social media content strategist.",
-            f"Today's date is {today_str}. Always take the current season and major holidays around this date into account.",
-            f"Platform to create for: {platform}.",
-            "",
-            f"Creator vibe: {vibe}",
-            f"Creator tone: {tone}",
-            f"Creator niche: {niche}",
-            f"Target audience: {audience}",
-            "",
-            f"Language: {lang.upper()}",
-        ]
-        if location:
-            lines.append(f"Location context: {location}")
-
-        # --- Trends block ---
-        lines.append("")
-        lines.append("We have some FRESH trends from our database. PRIORITIZE these:")
-        if trending_labels:
-            lines += [f"- {h}" for h in trending_labels]
-        else:
-            lines.append("- (no DB trends available, use general social media inspiration)")
-
-        # --- Seasonal / recurring hooks ---
-        lines.append("")
-        lines.append(
-            "Seasonal / recurring hooks (especially important if relevant to today's date, "
-            "e.g. Christmas, New Year, Valentine's, Halloween, etc.):"
-        )
-        for h in (seasonal + floating + stub_trends):
-            lines.append(f"- {h}")
-
-        # --- Instructions ---
-        lines.append("")
-        lines.append(
-            "INSTRUCTIONS:\n"
-            "- Generate EXACTLY 5 ideas.\n"
-            "- At least 2 ideas MUST be primarily inspired by the latest DB trends listed above.\n"
-            "- Also include AT LEAST 1 idea that is clearly based on a seasonal or recurring hook "
-            "relevant to today's date (e.g. Christmas, New Year, Valentine's, Halloween, etc.) "
-            "when such hooks are listed.\n"
-            "- Seasonal ideas should NOT be generic clichés: make them specific to the creator's niche and audience.\n"
-            "- Keep ideas aligned with the creator's tone and niche.\n"
-            "- If location is provided, use culturally relevant examples or slang.\n"
-            "- Return ONLY JSON (array of 5 objects). No markdown, no commentary.\n"
-            "- Each object must have: title, description, suggested_caption_starter, hook_used, personal_twist."
-        )
+        request_kwargs = build_ideas_request(profile, platform)
 
-        prompt = "\n".join(lines)
+        if wants_stream(request):
+            return sse_response(self.stream_ideas(user, request_kwargs, IDEAS_PER_CALL))
 
         # ---------------------------------------------------------------------
-        # 5. OpenAI call
+        # 3. OpenAI call
         # ---------------------------------------------------------------------
         try:
-            completion = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You generate creative social media ideas."},
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=650,
-            )
-            raw = completion.choices[0].message.content.strip()
+            raw = chat_completion("ideas", user=user, **request_kwargs).strip()
         except Exception as e:
+            if settings.LLM_DEGRADE_ON_ERROR:
+                print(f"[IDEAS] OpenAI error, serving degraded ideas: {e}")
+                return self.degraded_response(request, profile, platform, "error")
             return Response(
                 {"detail": f"OpenAI error: {e}"},
                 status=status.HTTP_502_BAD_GATEWAY,
             )
 
         # ---------------------------------------------------------------------
-        # 6. Parse response (JSON or fallback)
+        # 4. Parse response (JSON or fallback to raw text)
         # ---------------------------------------------------------------------
-        ideas = raw
-        try:
-            ideas = json.loads(raw)
-        except Exception:
-            pass  # If model returns text instead of JSON, fallback to raw
+        ideas = parse_ideas(raw)
 
         increment_usage(user, "idea", amount=IDEAS_PER_CALL)
         return Response({"ideas": ideas}, status=status.HTTP_200_OK)
+
+    def stream_ideas(self, user, request_kwargs, amount):
+        """
+        SSE: one `idea` event per object as soon as its JSON closes, then `done`.
+
+        Usage is charged exactly once, when the stream ends (normally or
+        because the client went away), as long as the model produced something.
+        """
+        parser = JSONObjectStreamParser()
+        parts = []
+        sent = 0
+        finished = False
+        try:
+            for delta in stream_chat_completion("ideas", user=user, **request_kwargs):
+                parts.append(delta)
+                for idea in parser.feed(delta):
+                    sent += 1
+                    yield sse_event("idea", idea)
+
+            done = {"count": sent}
+            if not sent:
+                # model answered with plain text instead of JSON
+                done["raw"] = parse_ideas("".join(parts).strip())
+            finished = True
+            yield sse_event("done", done)
+        except Exception as e:
+            yield sse_event("error", {"detail": f"OpenAI error: {e}"})
+        finally:
+            if sent or finished:
+                increment_usage(user, "idea", amount=amount)
+
+    def stream_pooled_ideas(self, user, ideas, amount, degraded=None):
+        """
+        Same SSE shape as stream_ideas, for a batch that is already generated.
+        """
+        for idea in ideas:
+            yield sse_event("idea", idea)
+        if amount:
+            increment_usage(user, "idea", amount=amount)
+        done = {"count": len(ideas)}
+        yield sse_event("done", mark_degraded(done, degraded) if degraded else done)
+
+    def degraded_response(self, request, profile, platform, reason):
+        ideas = degraded_ideas(profile, platform, user=request.user)
+        if wants_stream(request):
+            response = sse_response(self.stream_pooled_ideas(request.user, ideas, 0, degraded=reason))
+        else:
+            response = Response(mark_degraded({"ideas": ideas}, reason), status=status.HTTP_200_OK)
+        response[DEGRADED_HEADER] = reason
+        return response
     
     
 class PostingSuggestionView(views.APIView):
@@ -1418,7 +1641,7 @@ class NotificationListView(views.APIView):
         serializer = NotificationSerializer(qs, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
-class IdeaActionPlanView(views.APIView):
+class IdeaActionPlanView(IdempotentPostMixin, views.APIView):
     """
     Turn a generated idea into a concrete execution plan.
     """
@@ -1428,7 +1651,13 @@ class IdeaActionPlanView(views.APIView):
         user = request.user
         profile = CreatorProfile.objects.filter(user=user).first()
 
-        idea = request.data.get("idea") or {}
+        # opened from a saved draft: its stored plan is reused / refreshed
+        draft_id = request.data.get("draft_id")
+        draft = get_user_draft(user, draft_id)
+        if draft_id and draft is None:
+            return Response({"detail": "Draft not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        idea = request.data.get("idea") or (idea_from_draft(draft) if draft else {})
         # fallback to profile's default_platform like in GenerateIdeasView
         platform = request.data.get("platform") or getattr(
             profile, "default_platform", "instagram"
@@ -1444,16 +1673,83 @@ class IdeaActionPlanView(views.APIView):
         raw_lang = request.data.get("preferred_language")
         lang = get_request_lang(request, raw_lang)
 
-        plan = generate_idea_action_plan(
+        if wants_background(request):
+            return start_generation_job(
+                request,
+                "idea_action_plan",
+                {"idea": idea, "platform": platform, "lang": lang, "draft_id": str(draft.pk) if draft else None},
+            )
+
+        plan = get_idea_action_plan(
             profile=profile,
             idea=idea,
             platform=platform,
             lang=lang,
+            draft=draft,
+            user=user,
         )
 
         return Response(plan, status=status.HTTP_200_OK)
-    
-class BioVariantsView(views.APIView):
+
+
+class LLMRouteStatsView(views.APIView):
+    """
+    GET /api/llm/routes/ -> per-route, per-model latency / error stats (staff only).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(route_stats(), status=status.HTTP_200_OK)
+
+
+class ThrottleStatsView(views.APIView):
+    """
+    GET /api/llm/throttle/?days=7 -> rejected calls per day and bucket (staff only).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            days = min(max(int(request.query_params.get("days", 7)), 1), 30)
+        except ValueError:
+            days = 7
+        return Response(throttle_stats(days), status=status.HTTP_200_OK)
+
+
+class LLMLedgerReportView(views.APIView):
+    """
+    GET /api/llm/ledger/?days=7&endpoint=caption -> per endpoint per day: calls,
+    cache hits, errors, tokens, p50 / p95 latency, estimated cost (staff only).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            days = min(max(int(request.query_params.get("days", 7)), 1), 90)
+        except ValueError:
+            days = 7
+        endpoint = request.query_params.get("endpoint") or None
+        return Response(ledger_report(days, endpoint=endpoint), status=status.HTTP_200_OK)
+
+
+class GenerationJobStatusView(views.APIView):
+    """
+    GET /api/jobs/<id>/   -> current job state, answered straight away: poll
+                             it, or long-poll the ASGI twin
+                             /api/async/jobs/<id>/?wait=20 (views_async.py),
+                             which doesn't hold a worker thread while it waits.
+
+    Anonymous jobs (brand personas during registration) are reachable by id only.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = GenerationJob.objects.filter(id=job_id).first()
+        if job is None or (job.user_id and job.user_id != request.user.id):
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(GenerationJobSerializer(job).data, status=status.HTTP_200_OK)
+
+class BioVariantsView(IdempotentPostMixin, views.APIView):
     """
     POST /api/brand/bio-variants/
 
@@ -1500,64 +1796,17 @@ class BioVariantsView(views.APIView):
 
         print(f"[BIO_LANG] profile={profile_lang!r} override={override_lang!r} -> used={lang!r}")
 
-        niche = request.data.get("niche") or ""
-        target = request.data.get("target_audience") or ""
-        vibe = request.data.get("vibe") or ""
-        tone = request.data.get("tone") or ""
-        stage = request.data.get("creator_stage") or ""
-
-        context_bits = []
-        if niche:
-            context_bits.append(f"niche: {niche}")
-        if target:
-            context_bits.append(f"target audience: {target}")
-        if vibe:
-            context_bits.append(f"vibe: {vibe}")
-        if tone:
-            context_bits.append(f"tone: {tone}")
-        if stage:
-            context_bits.append(f"creator stage: {stage}")
-
-        context_str = "; ".join(context_bits) if context_bits else "no extra info"
+        context = {
+            key: request.data.get(key) or ""
+            for key in ("niche", "target_audience", "vibe", "tone", "creator_stage")
+        }
+        request_kwargs = build_bio_variants_request(base_bio, platform, lang, context)
 
         try:
-            completion = client.chat.completions.create(
-                model="gpt-4.1-mini",
-                response_format={"type": "json_object"},
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are a social media branding assistant. "
-                            "Given an existing bio and some creator context, "
-                            "you generate multiple variants of that bio.\n\n"
-                            "Return a *single* JSON object with these keys:\n"
-                            "- short_bio: a concise 1–2 line version.\n"
-                            "- long_bio: a 3–4 line version with more detail.\n"
-                            "- cta_bio: a version optimized around a strong call to action.\n"
-                            "- fun_bio: a playful, witty version.\n"
-                            "Do not wrap it in any additional text, only valid JSON.\n\n"
-                            f"IMPORTANT: All text in all fields MUST be written in the language "
-                            f"with ISO code '{lang}'. Do NOT use English if '{lang}' is not 'en'."
-                        ),
-                    },
-                    {
-                        "role": "user",
-                        "content": (
-                            f"Platform: {platform}\n"
-                            f"Language (ISO code): {lang}\n"
-                            f"Context: {context_str}\n\n"
-                            f"Base bio:\n{base_bio}"
-                        ),
-                    },
-                ],
-            )
+            raw_content = chat_completion("bio_variants", user=request.user, **request_kwargs)
 
-            raw_content = completion.choices[0].message.content
-
-            try:
-                parsed = json.loads(raw_content)
-            except json.JSONDecodeError:
+            result = parse_bio_variants(raw_content)
+            if result is None:
                 return Response(
                     {
                         "detail": "Model did not return valid JSON.",
@@ -1566,13 +1815,6 @@ class BioVariantsView(views.APIView):
                     status=status.HTTP_502_BAD_GATEWAY,
                 )
 
-            result = {
-                "short_bio": parsed.get("short_bio", "").strip(),
-                "long_bio": parsed.get("long_bio", "").strip(),
-                "cta_bio": parsed.get("cta_bio", "").strip(),
-                "fun_bio": parsed.get("fun_bio", "").strip(),
-            }
-
             return Response(result, status=status.HTTP_200_OK)
 
         except Exception as e:
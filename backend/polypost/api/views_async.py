@@ -0,0 +1,414 @@
+# api/views_async.py
+"""
+Async (ASGI) versions of the LLM-bound endpoints.
+
+They mirror the DRF views in views.py / views_brand.py but are plain async
+Django views: the OpenAI round trip is awaited through AsyncOpenAI, so a
+single worker can keep many generations in flight instead of blocking one
+thread per request. Only useful when served through polypost.asgi.
+"""
+import asyncio
+import json
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .action_plans import aget_idea_action_plan, get_user_draft, idea_from_draft
+from .degrade import (
+    DEGRADED_HEADER,
+    degrade_reason,
+    degraded_ideas,
+    degraded_sample_captions,
+    mark_degraded,
+)
+from .idea_pools import take_pooled_ideas
+from .idempotency import (
+    IDEMPOTENCY_HEADER,
+    IdempotencyConflict,
+    IdempotencyKeyReused,
+    fingerprint,
+    make_scope,
+    replay_or_lock,
+    store_and_unlock,
+    unlock,
+)
+from .idea_pregen import take_pregenerated_ideas
+from .persona_cache import aget_brand_personas
+from .throttling import check_token_buckets
+from .llm import achat_completion
+from .media_derivatives import vision_parts
+from .models import CreatorProfile, GenerationJob
+from .serializers import (
+    BrandPersonaRequestSerializer,
+    CaptionGenerateSerializer,
+    GeneratedCaptionSerializer,
+    GenerationJobSerializer,
+)
+from .utils import (
+    attach_caption_images,
+    build_bio_variants_request,
+    build_caption_request,
+    build_multilang_caption_request,
+    build_ideas_request,
+    check_usage_allowed,
+    increment_usage,
+    parse_bio_variants,
+    parse_caption_translations,
+    parse_caption_variants,
+    parse_ideas,
+)
+from .views import (
+    get_request_lang,
+    multilang_caption_units,
+    resolve_caption_languages,
+    save_generated_caption,
+)
+from .views_brand import (
+    BrandSampleCaptionsSerializer,
+    build_brand_sample_captions_request,
+    parse_brand_sample_captions,
+)
+
+
+async def _get_jwt_user(request):
+    """
+    Same JWT auth as the DRF views. Returns None when there is no valid token.
+    """
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    if result is None:
+        return None
+    return result[0]
+
+
+class AsyncGenerationJobStatusView(View):
+    """
+    GET /api/async/jobs/<id>/?wait=20 -> long-poll: hold the request until the
+    job finishes or `wait` seconds have passed (capped by
+    GENERATION_JOB_MAX_WAIT). The wait is awaited on the event loop, so pollers
+    don't pin a worker thread each.
+
+    Anonymous jobs (brand personas during registration) are reachable by id only.
+    """
+    http_method_names = ["get", "options"]
+
+    POLL_INTERVAL = 0.5
+
+    async def get(self, request, job_id, *args, **kwargs):
+        user = await _get_jwt_user(request)
+        job = await GenerationJob.objects.filter(id=job_id).afirst()
+        if job is None or (job.user_id and job.user_id != getattr(user, "id", None)):
+            return JsonResponse({"detail": "Not found."}, status=404)
+
+        try:
+            wait = float(request.GET.get("wait", 0))
+        except (TypeError, ValueError):
+            wait = 0
+        wait = max(0.0, min(wait, getattr(settings, "GENERATION_JOB_MAX_WAIT", 25)))
+
+        deadline = time.monotonic() + wait
+        while not job.is_finished and time.monotonic() < deadline:
+            await asyncio.sleep(self.POLL_INTERVAL)
+            await job.arefresh_from_db()
+
+        return JsonResponse(GenerationJobSerializer(job).data, status=200)
+
+
+class AsyncLLMView(View):
+    """
+    Base class: JWT auth, JSON body parsing, CSRF exempt (token auth only),
+    Idempotency-Key handling (see idempotency.py), token-bucket throttling
+    when `throttle_scope` is set (see throttling.py).
+    Subclasses implement `async def post(self, request)` and read self.data.
+    """
+    http_method_names = ["post", "options"]
+    auth_required = True
+    throttle_scope = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await _get_jwt_user(request)
+        if user is None and self.auth_required:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=401,
+            )
+        request.user = user or AnonymousUser()
+
+        if self.throttle_scope:
+            wait = await sync_to_async(check_token_buckets, thread_sensitive=False)(self.throttle_scope, request)
+            if wait is not None:
+                response = JsonResponse(
+                    {"detail": f"Request was throttled. Expected available in {wait} seconds."},
+                    status=429,
+                )
+                response["Retry-After"] = str(wait)
+                return response
+
+        try:
+            self.data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error."}, status=400)
+        if not isinstance(self.data, dict):
+            return JsonResponse({"detail": "Expected a JSON object."}, status=400)
+
+        idempotency = None
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key and request.method == "POST":
+            scope = make_scope(self.__class__.__name__, request.user, key)
+            fp = fingerprint({"query": request.GET.dict(), "data": self.data})
+            try:
+                replay = await sync_to_async(replay_or_lock, thread_sensitive=False)(scope, fp)
+            except (IdempotencyConflict, IdempotencyKeyReused) as e:
+                return JsonResponse({"detail": str(e.detail)}, status=e.status_code)
+            if replay is not None:
+                return replay
+            idempotency = (scope, fp)
+
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "__await__"):
+                response = await response
+        except APIException as e:
+            # LLMSaturated (503), CircuitOpen (503), DeadlineExceeded (504), ...:
+            # plain async views don't get DRF's exception handler
+            if idempotency is not None:
+                await sync_to_async(unlock, thread_sensitive=False)(idempotency[0])
+            response = JsonResponse({"detail": str(e.detail)}, status=e.status_code)
+            wait = getattr(e, "wait", None)
+            if wait:
+                response["Retry-After"] = str(int(math.ceil(wait)))
+            return response
+        except Exception:
+            if idempotency is not None:
+                await sync_to_async(unlock, thread_sensitive=False)(idempotency[0])
+            raise
+
+        if idempotency is not None:
+            await sync_to_async(store_and_unlock, thread_sensitive=False)(*idempotency, response)
+        return response
+
+
+class AsyncGenerateCaptionView(AsyncLLMView):
+    async def post(self, request, *args, **kwargs):
+        serializer = CaptionGenerateSerializer(data=self.data, context={"request": request})
+        if not await sync_to_async(serializer.is_valid)():
+            return JsonResponse(serializer.errors, status=400)
+        media = serializer.validated_data["media"]
+        variants = serializer.validated_data["variants"]
+
+        profile = await CreatorProfile.objects.filter(user=request.user).afirst()
+        languages = resolve_caption_languages(serializer.validated_data, profile)
+
+        CAPTIONS_PER_CALL = multilang_caption_units(len(languages)) if languages else 1
+        if not await sync_to_async(check_usage_allowed)(request.user, "caption", amount=CAPTIONS_PER_CALL):
+            return JsonResponse(
+                {"detail": "Caption limit reached for your plan. Upgrade to Pro."},
+                status=403,
+            )
+
+        platform = self.data.get("platform", "instagram")
+        image_parts = []
+        if serializer.validated_data["vision"]:
+            image_parts = await sync_to_async(vision_parts, thread_sensitive=False)(media)
+
+        if languages:
+            request_kwargs = build_multilang_caption_request(profile, media, platform, languages)
+            request_kwargs = attach_caption_images(request_kwargs, image_parts, media.media_type)
+            raw = (await achat_completion("caption", user=request.user, **request_kwargs)).strip()
+            translations = parse_caption_translations(raw, languages)
+            captions = [next(iter(translations.values()))]
+        else:
+            lang = await sync_to_async(get_request_lang)(request, self.data.get("preferred_language"))
+            request_kwargs = build_caption_request(profile, media, platform, lang, variants=variants)
+            request_kwargs = attach_caption_images(request_kwargs, image_parts, media.media_type)
+            raw = (await achat_completion("caption", user=request.user, **request_kwargs)).strip()
+            captions = parse_caption_variants(raw, variants) if variants > 1 else [raw]
+            translations = None
+
+        caption_obj = await sync_to_async(save_generated_caption)(media, captions, translations)
+        await sync_to_async(increment_usage)(request.user, "caption", amount=CAPTIONS_PER_CALL)
+        return JsonResponse(GeneratedCaptionSerializer(caption_obj).data, status=201)
+
+
+class AsyncGenerateIdeasView(AsyncLLMView):
+    async def post(self, request, *args, **kwargs):
+        user = request.user
+        profile = await CreatorProfile.objects.filter(user=user).afirst()
+
+        IDEAS_PER_CALL = 5
+        if not await sync_to_async(check_usage_allowed)(user, "idea", amount=IDEAS_PER_CALL):
+            return JsonResponse(
+                {"detail": "Idea limit reached for your plan. Upgrade to Pro."},
+                status=403,
+            )
+
+        platform = self.data.get("platform") or getattr(
+            profile, "default_platform", "instagram"
+        )
+
+        pooled = (
+            await sync_to_async(take_pregenerated_ideas)(user, profile, platform)
+            or await sync_to_async(take_pooled_ideas)(user, profile, platform)
+        )
+        if pooled is not None:
+            await sync_to_async(increment_usage)(user, "idea", amount=IDEAS_PER_CALL)
+            return JsonResponse({"ideas": pooled}, status=200)
+
+        reason = await sync_to_async(degrade_reason, thread_sensitive=False)("ideas")
+        if reason:
+            return await self.degraded_response(profile, platform, reason)
+
+        # prompt building reads GlobalTrend rows -> run it off the event loop
+        request_kwargs = await sync_to_async(build_ideas_request)(profile, platform)
+
+        try:
+            raw = (await achat_completion("ideas", user=user, **request_kwargs)).strip()
+        except Exception as e:
+            if settings.LLM_DEGRADE_ON_ERROR:
+                print(f"[IDEAS] OpenAI error, serving degraded ideas: {e}")
+                return await self.degraded_response(profile, platform, "error")
+            return JsonResponse({"detail": f"OpenAI error: {e}"}, status=502)
+
+        ideas = parse_ideas(raw)
+
+        await sync_to_async(increment_usage)(user, "idea", amount=IDEAS_PER_CALL)
+        return JsonResponse({"ideas": ideas}, status=200)
+
+    async def degraded_response(self, profile, platform, reason):
+        ideas = await sync_to_async(degraded_ideas)(profile, platform, user=self.request.user)
+        response = JsonResponse(mark_degraded({"ideas": ideas}, reason), status=200)
+        response[DEGRADED_HEADER] = reason
+        return response
+
+
+class AsyncIdeaActionPlanView(AsyncLLMView):
+    async def post(self, request, *args, **kwargs):
+        profile = await CreatorProfile.objects.filter(user=request.user).afirst()
+
+        draft_id = self.data.get("draft_id")
+        draft = await sync_to_async(get_user_draft)(request.user, draft_id)
+        if draft_id and draft is None:
+            return JsonResponse({"detail": "Draft not found"}, status=404)
+
+        idea = self.data.get("idea") or (idea_from_draft(draft) if draft else {})
+        platform = self.data.get("platform") or getattr(
+            profile, "default_platform", "instagram"
+        )
+
+        if not isinstance(idea, dict) or not idea:
+            return JsonResponse({"detail": "idea field (object) is required"}, status=400)
+
+        lang = await sync_to_async(get_request_lang)(request, self.data.get("preferred_language"))
+
+        plan = await aget_idea_action_plan(
+            profile=profile,
+            idea=idea,
+            platform=platform,
+            lang=lang,
+            draft=draft,
+            user=request.user,
+        )
+        return JsonResponse(plan, status=200)
+
+
+class AsyncBioVariantsView(AsyncLLMView):
+    async def post(self, request, *args, **kwargs):
+        profile = await CreatorProfile.objects.filter(user=request.user).afirst()
+
+        base_bio = (self.data.get("base_bio") or "").strip()
+        if not base_bio:
+            return JsonResponse({"detail": "base_bio is required"}, status=400)
+
+        platform = self.data.get("platform") or "instagram"
+
+        profile_lang = getattr(profile, "preferred_language", None) or "en"
+        override_lang = self.data.get("preferred_language") or None
+        lang = (override_lang or profile_lang).lower()
+
+        context = {
+            key: self.data.get(key) or ""
+            for key in ("niche", "target_audience", "vibe", "tone", "creator_stage")
+        }
+        request_kwargs = build_bio_variants_request(base_bio, platform, lang, context)
+
+        try:
+            raw_content = await achat_completion("bio_variants", user=request.user, **request_kwargs)
+        except Exception as e:
+            return JsonResponse({"detail": f"OpenAI error: {str(e)}"}, status=502)
+
+        result = parse_bio_variants(raw_content)
+        if result is None:
+            return JsonResponse(
+                {"detail": "Model did not return valid JSON.", "raw": raw_content},
+                status=502,
+            )
+        return JsonResponse(result, status=200)
+
+
+class AsyncBrandPersonaView(AsyncLLMView):
+    auth_required = False
+    throttle_scope = "brand_personas"
+
+    async def post(self, request, *args, **kwargs):
+        serializer = BrandPersonaRequestSerializer(data=self.data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+        data = serializer.validated_data
+
+        raw_lang = data.get("preferred_language") or self.data.get("preferred_language")
+        lang = await sync_to_async(get_request_lang)(request, raw_lang)
+
+        personas_data = await aget_brand_personas(
+            niche=data.get("niche", ""),
+            target_audience=data.get("target_audience", ""),
+            goals=data.get("goals", ""),
+            comfort_level=data.get("comfort_level", ""),
+            user=request.user,  # anonymous visitors -> default lane
+            lang=lang,
+        )
+        return JsonResponse(personas_data, status=200)
+
+
+class AsyncBrandSampleCaptionsView(AsyncLLMView):
+    auth_required = False
+    throttle_scope = "brand_sample_captions"
+
+    async def post(self, request, *args, **kwargs):
+        serializer = BrandSampleCaptionsSerializer(data=self.data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+        data = serializer.validated_data
+
+        platform = data.get("platform") or "instagram"
+        lang = await sync_to_async(get_request_lang)(request)
+
+        reason = await sync_to_async(degrade_reason, thread_sensitive=False)("brand_sample_captions")
+        if not reason:
+            request_kwargs = build_brand_sample_captions_request(data, platform, lang)
+            try:
+                raw = (await achat_completion("brand_sample_captions", user=request.user, **request_kwargs)).strip()
+                return JsonResponse(parse_brand_sample_captions(raw), status=200)
+            except Exception as e:
+                if not settings.LLM_DEGRADE_ON_ERROR:
+                    raise
+                print(f"[BRAND_SAMPLE_CAPTIONS] OpenAI error, serving degraded captions: {e}")
+                reason = "error"
+
+        captions = await sync_to_async(degraded_sample_captions)(data, platform, lang)
+        response = JsonResponse(mark_degraded(captions, reason), status=200)
+        response[DEGRADED_HEADER] = reason
+        return response
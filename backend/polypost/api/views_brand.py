@@ -5,20 +5,26 @@ from rest_framework.response import Response
 from rest_framework import permissions, status
 
 from .serializers import BrandPersonaRequestSerializer
-from .utils import build_brand_personas 
+from .persona_cache import get_brand_personas
+from .throttling import TokenBucketThrottle
 
 from rest_framework import serializers
-from .utils import client
+from .llm import chat_completion
 from .email_templates import normalize_lang_code
-from .views import get_request_lang
+from .views import get_request_lang, wants_background, start_generation_job
+from .idempotency import IdempotentPostMixin
+from .degrade import DEGRADED_HEADER, degrade_reason, degraded_sample_captions, mark_degraded
+from django.conf import settings
 from .models import CreatorProfile
 
-class BrandPersonaView(APIView):
+class BrandPersonaView(IdempotentPostMixin, APIView):
     """
     Public endpoint: returns 3 persona options.
     Used both during registration (anonymous) and for logged-in users.
     """
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = "brand_personas"
 
     def post(self, request, *args, **kwargs):
         serializer = BrandPersonaRequestSerializer(data=request.data)
@@ -33,12 +39,25 @@ class BrandPersonaView(APIView):
 
         print(f"[BRAND_PERSONA_VIEW] raw_lang={raw_lang!r} -> resolved_lang={lang!r}")
 
-        personas_data = build_brand_personas(
+        if wants_background(request):
+            return start_generation_job(
+                request,
+                "brand_personas",
+                {
+                    "niche": data.get("niche", ""),
+                    "target_audience": data.get("target_audience", ""),
+                    "goals": data.get("goals", ""),
+                    "comfort_level": data.get("comfort_level", ""),
+                    "lang": lang,
+                },
+            )
+
+        personas_data = get_brand_personas(
             niche=data.get("niche", ""),
             target_audience=data.get("target_audience", ""),
             goals=data.get("goals", ""),
             comfort_level=data.get("comfort_level", ""),
-            user=request.user if request.user.is_authenticated else None,
+            user=request.user,  # anonymous visitors -> default lane
             lang=lang,
         )
 
@@ -54,8 +73,58 @@ class BrandSampleCaptionsSerializer(serializers.Serializer):
     platform = serializers.CharField(required=False, allow_blank=True)  # e.g. instagram
 
 
-class BrandSampleCaptionsView(APIView):
+def build_brand_sample_captions_request(data: dict, platform: str, lang: str) -> dict:
+    """
+    Full chat-completion kwargs for 3 sample captions matching a persona.
+    Shared by the sync and async sample-captions views.
+    """
+    prompt_lines = [
+        "You write short social media posts that match a brand persona.",
+        f"The captions you output MUST be written in the language with ISO code '{lang}'. "
+        "Do NOT output English if that code is not 'en'.",
+        "",
+        f"Persona name: {data.get('persona_name') or 'Creator'}",
+        f"Vibe: {data.get('recommended_vibe') or 'Fun'}",
+        f"Tone: {data.get('recommended_tone') or 'Casual'}",
+        f"Niche: {data.get('niche') or 'general creator'}",
+        f"Target audience: {data.get('target_audience') or 'followers'}",
+        f"Platform: {platform}",
+        "",
+        "Generate EXACTLY 3 short caption ideas (1–2 sentences each).",
+        "They should feel aligned with the vibe & tone and speak to the audience.",
+        "",
+        "Return ONLY JSON in this shape:",
+        '{ "captions": ["...", "...", "..."] }',
+    ]
+    prompt = "\n".join(prompt_lines)
+
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": "You generate on-brand social captions."},
+            {"role": "user", "content": prompt},
+        ],
+        "max_tokens": 300,
+    }
+
+
+def parse_brand_sample_captions(raw: str) -> dict:
+    try:
+        data = json.loads(raw)
+    except Exception:
+        # fallback: simple splitting
+        data = {"captions": [raw]}
+
+    if not isinstance(data, dict) or "captions" not in data:
+        data = {"captions": [raw]}
+
+    return data
+
+
+class BrandSampleCaptionsView(IdempotentPostMixin, APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = "brand_sample_captions"
 
     def post(self, request, *args, **kwargs):
         serializer = BrandSampleCaptionsSerializer(data=request.data)
@@ -65,43 +134,21 @@ class BrandSampleCaptionsView(APIView):
         platform = data.get("platform") or "instagram"
         lang = get_request_lang(request)
 
-        prompt_lines = [
-            "You write short social media posts that match a brand persona.",
-            f"The captions you output MUST be written in the language with ISO code '{lang}'. "
-            "Do NOT output English if that code is not 'en'.",
-            "",
-            f"Persona name: {data.get('persona_name') or 'Creator'}",
-            f"Vibe: {data.get('recommended_vibe') or 'Fun'}",
-            f"Tone: {data.get('recommended_tone') or 'Casual'}",
-            f"Niche: {data.get('niche') or 'general creator'}",
-            f"Target audience: {data.get('target_audience') or 'followers'}",
-            f"Platform: {platform}",
-            "",
-            "Generate EXACTLY 3 short caption ideas (1–2 sentences each).",
-            "They should feel aligned with the vibe & tone and speak to the audience.",
-            "",
-            "Return ONLY JSON in this shape:",
-            '{ "captions": ["...", "...", "..."] }',
-        ]
-        prompt = "\n".join(prompt_lines)
-
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You generate on-brand social captions."},
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=300,
+        reason = degrade_reason("brand_sample_captions")
+        if not reason:
+            request_kwargs = build_brand_sample_captions_request(data, platform, lang)
+            try:
+                raw = chat_completion("brand_sample_captions", user=request.user, **request_kwargs).strip()
+                return Response(parse_brand_sample_captions(raw), status=status.HTTP_200_OK)
+            except Exception as e:
+                if not settings.LLM_DEGRADE_ON_ERROR:
+                    raise
+                print(f"[BRAND_SAMPLE_CAPTIONS] OpenAI error, serving degraded captions: {e}")
+                reason = "error"
+
+        response = Response(
+            mark_degraded(degraded_sample_captions(data, platform, lang), reason),
+            status=status.HTTP_200_OK,
         )
-        raw = completion.choices[0].message.content.strip()
-
-        try:
-            data = json.loads(raw)
-        except Exception:
-            # fallback: simple splitting
-            data = {"captions": [raw]}
-
-        if not isinstance(data, dict) or "captions" not in data:
-            data = {"captions": [raw]}
-
-        return Response(data, status=status.HTTP_200_OK)
\ No newline at end of file
+        response[DEGRADED_HEADER] = reason
+        return response
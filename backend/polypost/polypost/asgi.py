@@ -1,7 +1,9 @@
 """
-ASGI config for postly project.
+ASGI config for polypost project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The async LLM endpoints (api/views_async.py, under /api/async/...) only
+free up the worker while waiting on OpenAI when served through this entry point.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -11,6 +13,6 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'postly.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'polypost.settings')
 
 application = get_asgi_application()
@@ -65,6 +65,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "api.deadlines.RequestDeadlineMiddleware",
+    "api.load_shedding.LoadSheddingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -91,6 +93,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "polypost.wsgi.application"
+ASGI_APPLICATION = "polypost.asgi.application"
 
 # -----------------------------------------------------------------------------
 # DATABASE
@@ -129,8 +132,323 @@ CELERY_BEAT_SCHEDULE = {
         "task": "api.tasks.check_upcoming_posts",
         "schedule": 60 * 15,  # every 15 minutes
     },
+    "refresh-idea-pools-nightly": {
+        "task": "api.tasks.refresh_idea_pools",
+        "schedule": crontab(minute=30, hour=0),
+    },
+    "pregenerate-daily-ideas-hourly": {
+        "task": "api.tasks.pregenerate_daily_ideas",
+        "schedule": crontab(minute=5),  # every hour; each user is due at their local IDEA_PREGEN_LOCAL_HOUR
+    },
+    "prewarm-persona-cache": {
+        "task": "api.tasks.prewarm_persona_cache",
+        "schedule": crontab(minute=20, hour="*/6"),
+    },
+    "flush-llm-ledger": {
+        "task": "api.tasks.flush_llm_ledger",
+        "schedule": 60,  # every minute
+    },
+}
+
+# -----------------------------------------------------------------------------
+# LLM BACKEND
+# -----------------------------------------------------------------------------
+# "openai" (default), "fake" (offline, deterministic), "record" (OpenAI + capture
+# to LLM_REPLAY_PATH) or "replay" (serve captured completions, no network).
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+LLM_FAKE_LATENCY_MS = int(os.getenv("LLM_FAKE_LATENCY_MS", "800"))
+LLM_FAKE_LATENCY_JITTER_MS = int(os.getenv("LLM_FAKE_LATENCY_JITTER_MS", "0"))
+LLM_FAKE_PROMPT_TOKENS = int(os.getenv("LLM_FAKE_PROMPT_TOKENS", "0")) or None  # None = estimate from prompt
+LLM_FAKE_COMPLETION_TOKENS = int(os.getenv("LLM_FAKE_COMPLETION_TOKENS", "120"))
+LLM_FAKE_RESPONSES = {}  # endpoint -> fixed completion text
+
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH", str(BASE_DIR / "llm_replay.jsonl"))
+LLM_REPLAY_ON_MISS = os.getenv("LLM_REPLAY_ON_MISS", "fake")  # "fake" or "error"
+LLM_REPLAY_REALTIME = os.getenv("LLM_REPLAY_REALTIME", "False") == "True"
+
+# -----------------------------------------------------------------------------
+# LLM MODEL ROUTING
+# -----------------------------------------------------------------------------
+# Task classes with an ordered model chain. The first model whose recent p95
+# latency / error rate is within budget serves the call; failures fall through
+# to the next model. Stats: GET /api/llm/routes/ (staff only).
+LLM_ROUTES = {
+    "fast": {
+        "models": ["gpt-4o-mini", "gpt-4.1-nano"],
+        "latency_budget_ms": int(os.getenv("LLM_FAST_LATENCY_BUDGET_MS", "6000")),
+        "max_error_rate": 0.2,
+        "min_samples": 20,
+    },
+    "structured": {
+        "models": ["gpt-4.1-mini", "gpt-4o-mini"],
+        "latency_budget_ms": int(os.getenv("LLM_STRUCTURED_LATENCY_BUDGET_MS", "10000")),
+        "max_error_rate": 0.2,
+        "min_samples": 20,
+    },
 }
 
+# endpoint -> route. Unlisted endpoints (background jobs) keep the model
+# their prompt builder asks for.
+LLM_ENDPOINT_ROUTES = {
+    "caption": "fast",
+    "ideas": "fast",
+    "brand_personas": "fast",
+    "brand_sample_captions": "fast",
+    "idea_action_plan": "structured",
+    "bio_variants": "structured",
+}
+
+# Whole model chain (first try + fallbacks). A try that isn't done within the
+# route's latency_budget_ms moves on to the next model (the last model gets
+# what's left); the request / task deadline still wins when it's shorter.
+# Rejected requests (400, 401, 403, 422) fail at once instead of trying the
+# next model.
+LLM_CHAIN_TIMEOUT_SECONDS = int(os.getenv("LLM_CHAIN_TIMEOUT_SECONDS", "45"))
+LLM_ROUTE_SAMPLE_WINDOW = 600  # seconds of latency / error samples used for routing
+
+# -----------------------------------------------------------------------------
+# VISION CAPTIONS
+# -----------------------------------------------------------------------------
+# captions/generate/ with vision=true sends a downscaled JPEG of the photo (or
+# VISION_VIDEO_FRAMES frames of the video, needs ffmpeg) with the prompt. The
+# budget bounds upload size and image tokens; derivatives are cached in storage
+# under vision/ and rebuilt when the budget changes.
+VISION_CAPTIONS_ENABLED = os.getenv("VISION_CAPTIONS_ENABLED", "True") == "True"
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "768"))  # px, longest side
+VISION_MAX_BYTES = int(os.getenv("VISION_MAX_BYTES", "120000"))  # per image, encoded
+VISION_JPEG_QUALITY = 75
+VISION_VIDEO_FRAMES = int(os.getenv("VISION_VIDEO_FRAMES", "3"))
+VISION_DETAIL = os.getenv("VISION_DETAIL", "low")  # "low" = fixed, smallest image token cost
+VISION_FFMPEG_BIN = os.getenv("VISION_FFMPEG_BIN", "ffmpeg")
+VISION_FFPROBE_BIN = os.getenv("VISION_FFPROBE_BIN", "ffprobe")
+
+# -----------------------------------------------------------------------------
+# LLM USAGE LEDGER
+# -----------------------------------------------------------------------------
+# Every LLM call is queued in Redis and written to LLMCall by flush_llm_ledger
+# (every minute). Report: GET /api/llm/ledger/?days=7 (staff only).
+LLM_LEDGER_ENABLED = os.getenv("LLM_LEDGER_ENABLED", "True") == "True"
+LLM_LEDGER_FLUSH_BATCH = 5000  # rows per bulk insert round
+
+# USD per 1M tokens (input, output), for the report's cost estimate
+LLM_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+# -----------------------------------------------------------------------------
+# LLM PRIORITY LANES
+# -----------------------------------------------------------------------------
+# At most LLM_CONCURRENCY_LIMIT calls in flight across workers (0 = no limit).
+# A lane (picked from the user's plan slug) may only start a call while the
+# total is below `share` of the limit; it waits up to `max_wait` seconds for
+# a slot, then 503s (ideas / sample captions degrade instead).
+LLM_CONCURRENCY_LIMIT = int(os.getenv("LLM_CONCURRENCY_LIMIT", "48"))
+LLM_PRIORITY_LANES = {
+    "priority": {"plans": ["yearly"], "share": 1.0, "max_wait": 30},
+    "paid": {"plans": ["monthly", "quarterly"], "share": 0.9, "max_wait": 20},
+    "free": {"plans": ["free"], "share": 0.6, "max_wait": 3},
+    "background": {"plans": [], "share": 0.4, "max_wait": 60},  # no user: pools, pre-generation
+}
+LLM_DEFAULT_LANE = "free"  # anonymous visitors / unknown plans
+
+# -----------------------------------------------------------------------------
+# LLM DEGRADE MODE
+# -----------------------------------------------------------------------------
+# Ideas / brand sample captions fall back to local templates (api/degrade.py)
+# when this many LLM calls are in flight across workers, when every model of
+# the endpoint's route is unhealthy, or (ON_ERROR) when the call itself fails.
+# Responses carry "degraded": true and an X-Degraded header, and aren't charged.
+LLM_DEGRADE_ENABLED = os.getenv("LLM_DEGRADE_ENABLED", "True") == "True"
+LLM_DEGRADE_FORCE = os.getenv("LLM_DEGRADE_FORCE", "False") == "True"  # manual switch
+LLM_DEGRADE_ON_ERROR = os.getenv("LLM_DEGRADE_ON_ERROR", "True") == "True"
+LLM_DEGRADE_MAX_INFLIGHT = int(os.getenv("LLM_DEGRADE_MAX_INFLIGHT", str(LLM_CONCURRENCY_LIMIT or 64)))
+LLM_DEGRADE_SOURCE_TTL = 300  # seconds trend titles / templates are kept in process
+LLM_INFLIGHT_STALE_AFTER = 120  # in-flight entries older than this are ignored
+
+# -----------------------------------------------------------------------------
+# LOAD SHEDDING
+# -----------------------------------------------------------------------------
+# Generation POSTs get an immediate 503 + Retry-After (api/load_shedding.py)
+# when this process already has LOAD_SHED_MAX_LOCAL of them in progress, or
+# (LOAD_SHED_LANES only) when the LLM calls in flight across workers reached
+# the caller's lane share of LOAD_SHED_MAX_INFLIGHT (0 = off). Paying lanes
+# queue in the limiter instead of being shed on the cluster count.
+# Ideas / sample captions aren't listed: they degrade instead.
+LOAD_SHED_ENABLED = os.getenv("LOAD_SHED_ENABLED", "True") == "True"
+LOAD_SHED_MAX_LOCAL = int(os.getenv("LOAD_SHED_MAX_LOCAL", "32"))
+LOAD_SHED_MAX_INFLIGHT = int(os.getenv("LOAD_SHED_MAX_INFLIGHT", str(LLM_CONCURRENCY_LIMIT)))
+LOAD_SHED_LANES = ("free",)  # anonymous visitors are in LLM_DEFAULT_LANE
+LOAD_SHED_RETRY_AFTER = 5
+LOAD_SHED_PATHS = (
+    "/api/captions/generate/",
+    "/api/captions/generate/batch/",
+    "/api/ideas/action-plan/",
+    "/api/brand/persona/",
+    "/api/brand/bio-variants/",
+    "/api/async/captions/generate/",
+    "/api/async/ideas/action-plan/",
+    "/api/async/brand/persona/",
+    "/api/async/brand/bio-variants/",
+)
+
+# -----------------------------------------------------------------------------
+# LLM THROTTLING
+# -----------------------------------------------------------------------------
+# Token buckets (Redis, per IP and per logged-in user) for the public LLM
+# endpoints: `capacity` = burst, refilled at `per_minute`. Empty bucket -> 429
+# with Retry-After. Rejections: GET /api/llm/throttle/ (staff only).
+LLM_THROTTLE_ENABLED = os.getenv("LLM_THROTTLE_ENABLED", "True") == "True"
+# proxies in front of Django that append to X-Forwarded-For (0 = use REMOTE_ADDR)
+LLM_THROTTLE_TRUSTED_PROXIES = int(os.getenv("LLM_THROTTLE_TRUSTED_PROXIES", "0"))
+LLM_TOKEN_BUCKETS = {
+    "brand_personas": {
+        "ip": {"capacity": 10, "per_minute": 3},
+        "user": {"capacity": 20, "per_minute": 6},
+    },
+    "brand_sample_captions": {
+        "ip": {"capacity": 15, "per_minute": 6},
+        "user": {"capacity": 30, "per_minute": 12},
+    },
+}
+
+# -----------------------------------------------------------------------------
+# PROMPT BUDGETS
+# -----------------------------------------------------------------------------
+# Estimated input-token ceiling per prompt builder (see api/prompt_budget.py).
+# Low-priority sections (example captions, generic hooks, extra trends) are
+# trimmed first; instructions are never cut.
+PROMPT_TOKEN_BUDGETS = {
+    "caption": int(os.getenv("PROMPT_BUDGET_CAPTION", "500")),
+    "ideas": int(os.getenv("PROMPT_BUDGET_IDEAS", "900")),
+    "brand_personas": int(os.getenv("PROMPT_BUDGET_BRAND_PERSONAS", "900")),
+}
+
+# -----------------------------------------------------------------------------
+# LLM COMPLETION CACHE
+# -----------------------------------------------------------------------------
+# App-level Redis (locks, counters, queues) – separate DB from Celery broker/results.
+# Must never evict keys (see docker-compose.yml: noeviction).
+APP_REDIS_URL = os.getenv("APP_REDIS_URL", "redis://localhost:6379/2")
+# Rebuildable caches (TieredCache). Eviction policy is per instance, not per DB,
+# so this is a separate allkeys-lru instance; unset = share APP_REDIS_URL.
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "True") == "True"
+LLM_CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("LLM_CACHE_LOCAL_MAX_ENTRIES", "512"))
+
+# Per-endpoint opt-in: endpoint name -> TTL (seconds). Endpoints not listed are never cached.
+LLM_CACHE_ENDPOINTS = {
+    "brand_personas": 60 * 60 * 24,
+    "brand_sample_captions": 60 * 60 * 6,
+    "idea_action_plan": 60 * 60 * 24,
+    "bio_variants": 60 * 60,
+    # "caption" is NOT cached by default: its prompt only depends on the profile
+    # and the media type, so a cache hit would reuse one caption for every photo.
+}
+
+# Identical prompts already in flight (double-clicks, frontend retries) wait
+# for the first call instead of hitting OpenAI again - across workers via Redis.
+LLM_SINGLE_FLIGHT_ENDPOINTS = ("ideas", "idea_action_plan")
+LLM_SINGLE_FLIGHT_WAIT = int(os.getenv("LLM_SINGLE_FLIGHT_WAIT", "60"))
+
+# -----------------------------------------------------------------------------
+# REQUEST DEADLINES
+# -----------------------------------------------------------------------------
+# Every API request gets a time budget; OpenAI / Apify / MaxMind / TMDB calls
+# use what's left of it as their timeout (api/deadlines.py). Celery tasks use
+# their soft_time_limit instead.
+REQUEST_DEADLINE_SECONDS = int(os.getenv("REQUEST_DEADLINE_SECONDS", "25"))
+REQUEST_DEADLINE_PATHS = {
+    "/api/captions/generate/batch/": 90,
+}
+TASK_DEADLINE_SECONDS = int(os.getenv("TASK_DEADLINE_SECONDS", "600"))  # tasks without a soft_time_limit
+
+# Upper bounds per outbound call (the remaining budget may shorten them).
+# The OpenAI client makes no retries of its own, so this is the whole call.
+LLM_TIMEOUT_SECONDS = int(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+MAXMIND_TIMEOUT = int(os.getenv("MAXMIND_TIMEOUT", "3"))
+
+# -----------------------------------------------------------------------------
+# CIRCUIT BREAKERS
+# -----------------------------------------------------------------------------
+# `failures` errors (timeouts, connection errors, 5xx) within `window` seconds
+# open the circuit: calls fail fast for `cooldown` seconds, then one probe call
+# decides whether it closes again. State is shared through Redis.
+CIRCUIT_BREAKERS_ENABLED = os.getenv("CIRCUIT_BREAKERS_ENABLED", "True") == "True"
+CIRCUIT_BREAKERS = {
+    "openai": {"failures": 5, "window": 60, "cooldown": 30},
+    "apify": {"failures": 3, "window": 300, "cooldown": 300},
+    "tmdb": {"failures": 3, "window": 300, "cooldown": 120},
+    "maxmind": {"failures": 5, "window": 60, "cooldown": 60},
+}
+
+# -----------------------------------------------------------------------------
+# IDEMPOTENCY
+# -----------------------------------------------------------------------------
+# Generation POSTs honour an Idempotency-Key header: the first response is
+# replayed byte-for-byte for this long (seconds).
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(60 * 60 * 24)))
+IDEMPOTENCY_LOCK_TTL = 120  # max time a key stays "in progress" if a worker dies
+
+# -----------------------------------------------------------------------------
+# IDEA POOLS
+# -----------------------------------------------------------------------------
+# Nightly pre-generated idea batches for the most common (platform, niche,
+# vibe, tone, language, target audience, country, city) segments.
+IDEA_POOL_ENABLED = os.getenv("IDEA_POOL_ENABLED", "True") == "True"
+IDEA_POOL_MAX_SEGMENTS = int(os.getenv("IDEA_POOL_MAX_SEGMENTS", "50"))
+IDEA_POOL_MIN_USERS = int(os.getenv("IDEA_POOL_MIN_USERS", "5"))
+IDEA_POOL_ACTIVE_DAYS = int(os.getenv("IDEA_POOL_ACTIVE_DAYS", "14"))
+IDEA_POOL_BATCHES = int(os.getenv("IDEA_POOL_BATCHES", "3"))  # batches of 5 ideas per segment
+
+# The shared hooks / trends block of the ideas prompt is cached per day
+# (rebuilt after refresh_global_trends); workers re-read it from Redis this often.
+IDEAS_CONTEXT_LOCAL_TTL = int(os.getenv("IDEAS_CONTEXT_LOCAL_TTL", "300"))
+
+# Per-user overnight pre-generation (CreatorProfile.pregenerate_ideas opt-in)
+IDEA_PREGEN_LOCAL_HOUR = int(os.getenv("IDEA_PREGEN_LOCAL_HOUR", "4"))
+IDEA_PREGEN_ACTIVE_DAYS = int(os.getenv("IDEA_PREGEN_ACTIVE_DAYS", "3"))
+IDEA_PREGEN_CONCURRENCY = int(os.getenv("IDEA_PREGEN_CONCURRENCY", "4"))
+
+# -----------------------------------------------------------------------------
+# BRAND PERSONA CACHE
+# -----------------------------------------------------------------------------
+# Personas cached per normalized onboarding answers + language; the most
+# requested answer sets of the last PREWARM_DAYS days are pre-generated.
+PERSONA_CACHE_TTL = int(os.getenv("PERSONA_CACHE_TTL", str(60 * 60 * 24 * 7)))
+PERSONA_PREWARM_TOP = int(os.getenv("PERSONA_PREWARM_TOP", "100"))
+PERSONA_PREWARM_MIN_COUNT = int(os.getenv("PERSONA_PREWARM_MIN_COUNT", "3"))
+PERSONA_PREWARM_DAYS = int(os.getenv("PERSONA_PREWARM_DAYS", "7"))
+PERSONA_PREWARM_CONCURRENCY = int(os.getenv("PERSONA_PREWARM_CONCURRENCY", "4"))
+
+# Idea action plans cached per (idea hash, platform, lang, profile fingerprint)
+# and written back to Draft.execution_plan when opened from a draft.
+ACTION_PLAN_CACHE_TTL = int(os.getenv("ACTION_PLAN_CACHE_TTL", str(60 * 60 * 24 * 30)))
+
+# -----------------------------------------------------------------------------
+# CAPTION BATCHES
+# -----------------------------------------------------------------------------
+CAPTION_BATCH_MAX_ITEMS = int(os.getenv("CAPTION_BATCH_MAX_ITEMS", "20"))
+CAPTION_BATCH_CONCURRENCY = int(os.getenv("CAPTION_BATCH_CONCURRENCY", "4"))
+
+# captions/generate/ with variants=N: N captions from one completion
+CAPTION_MAX_VARIANTS = int(os.getenv("CAPTION_MAX_VARIANTS", "5"))
+
+# multi-language captions (languages=[...] or multilang=true -> content_languages),
+# all languages in one completion. Each extra language costs this many caption
+# units (rounded up); 0 = the whole fan-out is billed as one caption.
+CAPTION_MAX_LANGUAGES = int(os.getenv("CAPTION_MAX_LANGUAGES", "4"))
+CAPTION_MULTILANG_WEIGHT = float(os.getenv("CAPTION_MULTILANG_WEIGHT", "0"))
+
+# -----------------------------------------------------------------------------
+# BACKGROUND GENERATION JOBS
+# -----------------------------------------------------------------------------
+# Upper bound (seconds) for ?wait= long-polling on /api/async/jobs/<id>/
+GENERATION_JOB_MAX_WAIT = int(os.getenv("GENERATION_JOB_MAX_WAIT", "25"))
+
 # -----------------------------------------------------------------------------
 # REST FRAMEWORK / JWT
 # -----------------------------------------------------------------------------
@@ -174,6 +492,7 @@ CORS_ALLOW_HEADERS = [
     "dnt",
     "x-csrftoken",
     "x-requested-with",
+    "idempotency-key",
 ]
 
 # Not strictly needed unless you’re sending cookies: